@@ -30,3 +30,29 @@ class ApiForbiddenError(HTTPException):
     def __init__(self, message: str | None = None):
         self.status_code = status.HTTP_403_FORBIDDEN
         self.detail = message if message else "Forbidden"
+
+
+class ApiConflictError(HTTPException):
+    def __init__(self, message: str | None = None):
+        self.status_code = status.HTTP_409_CONFLICT
+        self.detail = message if message else "Conflict"
+
+
+class ApiRequestEntityTooLargeError(HTTPException):
+    def __init__(self, message: str | None = None):
+        self.status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        self.detail = message if message else "Request entity too large"
+
+
+class ApiRangeNotSatisfiableError(HTTPException):
+    def __init__(self, size: int):
+        self.status_code = status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        self.detail = "Range not satisfiable"
+        self.headers = {"Content-Range": f"bytes */{size}"}
+
+
+class ApiServiceUnavailableError(HTTPException):
+    def __init__(self, retry_after: int):
+        self.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        self.detail = "Service unavailable, retry later"
+        self.headers = {"Retry-After": str(retry_after)}
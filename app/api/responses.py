@@ -0,0 +1,77 @@
+import asyncio
+from collections.abc import AsyncIterator, Mapping
+from pathlib import Path
+
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.types import Receive, Scope, Send
+
+# ASGI extensions letting the server send a file without passing it through Python
+ZERO_COPY_SEND = "http.response.zerocopysend"
+PATH_SEND = "http.response.pathsend"
+
+
+class BLOBResponse(StreamingResponse):
+    """Streaming response which hands a local file over to the server if possible.
+
+    If the server supports the zero-copy send extension, the file (or its part)
+    is transferred with os.sendfile() directly from the page cache. A whole file
+    can also be sent with the path send extension. Otherwise, the content
+    iterator is streamed as usual.
+    """
+
+    def __init__(
+        self,
+        content: AsyncIterator[bytes | memoryview],
+        file_path: Path | None = None,
+        offset: int = 0,
+        count: int | None = None,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        super().__init__(content, status_code, headers, media_type, background)
+        self.file_path = file_path
+        self.offset = offset
+        self.count = count
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        whole_file = self.offset == 0 and self.count is None
+        try:
+            if self.file_path is not None and ZERO_COPY_SEND in extensions:
+                await self._send_zero_copy(send, self.file_path)
+            elif self.file_path is not None and PATH_SEND in extensions and whole_file:
+                await self._send_start(send)
+                await send({"type": PATH_SEND, "path": str(self.file_path)})
+            else:
+                return await super().__call__(scope, receive, send)
+        finally:
+            # The content iterator is always closed to release what it holds
+            await self._close_content()
+
+        if self.background is not None:
+            await self.background()
+
+    async def _send_zero_copy(self, send: Send, file_path: Path) -> None:
+        with await asyncio.to_thread(open, file_path, "rb") as file:
+            await self._send_start(send)
+            message = {"type": ZERO_COPY_SEND, "file": file, "offset": self.offset}
+            if self.count is not None:
+                message["count"] = self.count
+            await send(message)
+
+    async def _send_start(self, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+
+    async def _close_content(self) -> None:
+        aclose = getattr(self.body_iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -2,6 +2,7 @@ from fastapi import APIRouter, FastAPI
 
 from app.routers.update_files import update_files_router
 from app.routers.update_manifest import update_manifest_router
+from app.routers.update_patches import update_patches_router
 
 router = APIRouter(
     tags=["app-update-service"],
@@ -11,6 +12,7 @@ router = APIRouter(
 def add_routers(app: FastAPI):
     routers = [
         update_files_router,
+        update_patches_router,
         update_manifest_router,
     ]
     _add_routers(app, routers)
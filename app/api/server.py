@@ -18,10 +18,16 @@ async def lifespan(app: FastAPI):
     Note: Make sure that startup and shutdown are called on
           the same object, e.g. a singleton instance.
     """
-    # container: Container = app.state.container
+    container: Container = app.state.container
+    job_worker = container.update_job_worker()
+    job_worker.start()
+    storage_reconciler = container.storage_reconciler()
+    storage_reconciler.start()
 
     yield
     # Clean up
+    await storage_reconciler.stop()
+    await job_worker.stop()
 
 
 @lru_cache
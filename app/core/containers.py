@@ -2,18 +2,33 @@ from typing import Set
 
 from dependency_injector import containers, providers
 
+from app.models.update_job import UpdateJobKind
 from app.plugins.http.http_client import http_client_session
 from app.plugins.logger.logging_config import LoggingConfiguration, init_logging
 from app.plugins.logger.settings import LoggerSettings
 from app.plugins.postgres.plugin import PostgresPlugin
 from app.plugins.postgres.settings import PostgresSettings
+from app.plugins.process_pool.process_pool import process_pool_executor
 from app.services.auth.auth_service import AuthService
 from app.services.crm.client import CRMClient
+from app.services.update_files.reconciler import StorageReconciler
+from app.services.update_files.scheduler import DownloadScheduler
 from app.services.update_files.service import UpdateFileService
+from app.services.update_files.storage.cached_file_repository import (
+    CachedBLOBRepository,
+)
 from app.services.update_files.storage.file_info_repository import FileInfoRepository
 from app.services.update_files.storage.file_repository import BLOBRepository
+from app.services.update_files.storage.upload_repository import (
+    UpdateFileUploadRepository,
+)
+from app.services.update_files.uploads import UpdateFileUploadService
+from app.services.update_jobs.storage.repository import UpdateJobRepository
+from app.services.update_jobs.worker import UpdateJobWorker
 from app.services.update_manifest.service import UpdateManifestService
 from app.services.update_manifest.storage.repository import UpdateManifestRepositoryDB
+from app.services.update_patches.service import UpdatePatchService
+from app.services.update_patches.storage.repository import UpdatePatchRepository
 from app.settings import AppSettings, MainSettings
 
 
@@ -55,20 +70,98 @@ class Container(containers.DeclarativeContainer):
         logger=logger,
     )
 
-    update_file_repository = providers.Factory(
+    blob_repository = providers.Singleton(
         BLOBRepository,
         config=config.provided.app,
         logger=logger,
     )
+    update_file_repository = providers.Singleton(
+        CachedBLOBRepository,
+        repository=blob_repository,
+        config=config.provided.app,
+        logger=logger,
+    )
     file_info_repository = providers.Factory(
         FileInfoRepository,
         db_session=db.provided.session,
         logger=logger,
     )
+    download_scheduler = providers.Singleton(
+        DownloadScheduler,
+        config=config.provided.app,
+        logger=logger,
+    )
+
+    process_executor = providers.Resource(
+        process_pool_executor,
+        max_workers=config.provided.app.file_patch_workers,
+    )
+    update_patch_repository = providers.Factory(
+        UpdatePatchRepository,
+        db_session=db.provided.session,
+        logger=logger,
+    )
+    update_patch_service = providers.Factory(
+        UpdatePatchService,
+        repository=update_patch_repository,
+        blob_repository=update_file_repository,
+        file_info_repository=file_info_repository,
+        executor=process_executor,
+        scheduler=download_scheduler,
+        config=config.provided.app,
+        logger=logger,
+    )
+
+    update_job_repository = providers.Factory(
+        UpdateJobRepository,
+        db_session=db.provided.session,
+        logger=logger,
+    )
     update_file_service = providers.Factory(
         UpdateFileService,
         repository=update_file_repository,
         file_info_repository=file_info_repository,
+        job_repository=update_job_repository,
+        patch_service=update_patch_service,
+        scheduler=download_scheduler,
+        executor=process_executor,
+        config=config.provided.app,
+        logger=logger,
+    )
+    update_job_worker = providers.Singleton(
+        UpdateJobWorker,
+        repository=update_job_repository,
+        handlers=providers.Dict(
+            {
+                UpdateJobKind.VERIFY: update_file_service.provided.verify,
+                UpdateJobKind.COMPRESS: update_file_service.provided.compress,
+                UpdateJobKind.BUILD_PATCHES: update_file_service.provided.build_patches,
+            }
+        ),
+        config=config.provided.app,
+        logger=logger,
+    )
+
+    update_file_upload_repository = providers.Factory(
+        UpdateFileUploadRepository,
+        db_session=db.provided.session,
+        logger=logger,
+    )
+    update_file_upload_service = providers.Factory(
+        UpdateFileUploadService,
+        repository=update_file_upload_repository,
+        blob_repository=update_file_repository,
+        file_service=update_file_service,
+        config=config.provided.app,
+        logger=logger,
+    )
+    storage_reconciler = providers.Singleton(
+        StorageReconciler,
+        blob_repository=update_file_repository,
+        file_info_repository=file_info_repository,
+        file_service=update_file_service,
+        upload_service=update_file_upload_service,
+        scheduler=download_scheduler,
         config=config.provided.app,
         logger=logger,
     )
@@ -78,9 +171,12 @@ class Container(containers.DeclarativeContainer):
         db_session=db.provided.session,
         logger=logger,
     )
-    update_manifest_service = providers.Factory(
+    # Keeps the cached manifest between the requests
+    update_manifest_service = providers.Singleton(
         UpdateManifestService,
         repository=update_manifest_repository,
+        patch_service=update_patch_service,
+        config=config.provided.app,
         logger=logger,
     )
 
@@ -1,7 +1,8 @@
 from datetime import datetime
 from uuid import UUID
 
-from sqlalchemy import DateTime, func
+from sqlalchemy import BigInteger, DateTime, Index, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.entities.base import EntityBase
@@ -9,6 +10,12 @@ from app.entities.base import EntityBase
 
 class UpdateFileEntity(EntityBase):
     __tablename__ = "update_files"
+    __table_args__ = (
+        # Listing pages are read in the (created_at, id) order
+        Index("ix_update_files_created_at_id", "created_at", "id"),
+        # Patches are looked up by the newest file of a version
+        Index("ix_update_files_version_created_at_id", "version", "created_at", "id"),
+    )
 
     id: Mapped[UUID] = mapped_column(
         primary_key=True, server_default=func.gen_random_uuid()
@@ -16,6 +23,17 @@ class UpdateFileEntity(EntityBase):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), nullable=False, server_default=func.now()
     )
+    last_downloaded_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
     comment: Mapped[str] = mapped_column(nullable=True)
     name: Mapped[str] = mapped_column(nullable=True)
-    size: Mapped[int] = mapped_column(nullable=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    sha256: Mapped[str] = mapped_column(nullable=True)
+    version: Mapped[str] = mapped_column(nullable=True)
+    # Chunk size and SHA-256 of every chunk, loaded only on demand
+    chunk_hashes: Mapped[dict] = mapped_column(JSONB, nullable=True, deferred=True)
+    # Sizes of pre-compressed variants by content coding
+    variants: Mapped[dict[str, int]] = mapped_column(
+        JSONB, nullable=False, server_default=text("'{}'::jsonb")
+    )
@@ -0,0 +1,36 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import DateTime, Index, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.entities.base import EntityBase
+
+
+class UpdateFileJobEntity(EntityBase):
+    """Post-upload processing job of an update file."""
+
+    __tablename__ = "update_file_jobs"
+    __table_args__ = (Index("ix_update_file_jobs_status_run_at", "status", "run_at"),)
+
+    id: Mapped[UUID] = mapped_column(
+        primary_key=True, server_default=func.gen_random_uuid()
+    )
+    file_id: Mapped[UUID] = mapped_column(nullable=False, index=True)
+    kind: Mapped[str] = mapped_column(nullable=False)
+    status: Mapped[str] = mapped_column(nullable=False, server_default="pending")
+    attempts: Mapped[int] = mapped_column(nullable=False, server_default="0")
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    run_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    # Running jobs of a crashed worker are claimed again after the lease
+    locked_until: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    error: Mapped[str] = mapped_column(nullable=True)
@@ -0,0 +1,20 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import BigInteger, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.entities.base import EntityBase
+
+
+class UpdateFilePatchEntity(EntityBase):
+    """Binary patch turning the source update file into the target one."""
+
+    __tablename__ = "update_file_patches"
+
+    source_id: Mapped[UUID] = mapped_column(primary_key=True)
+    target_id: Mapped[UUID] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
@@ -0,0 +1,29 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import BigInteger, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.entities.base import EntityBase
+
+
+class UpdateFileUploadEntity(EntityBase):
+    """Resumable upload session of an update file, until it is finalized."""
+
+    __tablename__ = "update_file_uploads"
+
+    id: Mapped[UUID] = mapped_column(
+        primary_key=True, server_default=func.gen_random_uuid()
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    # Last activity, stale sessions are collected by it
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    comment: Mapped[str] = mapped_column(nullable=True)
+    name: Mapped[str] = mapped_column(nullable=True)
+    version: Mapped[str] = mapped_column(nullable=True)
+    # Declared size of the file, if known in advance
+    length: Mapped[int] = mapped_column(BigInteger, nullable=True)
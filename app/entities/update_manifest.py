@@ -1,11 +1,33 @@
-from sqlalchemy import String
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer, String, func
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.entities.base import EntityBase
 
 
 class UpdateManifestEntity(EntityBase):
+    """The latest release of a product in a channel for a platform."""
+
     __tablename__ = "update_manifests"
 
-    version: Mapped[str] = mapped_column(String, primary_key=True)
+    product: Mapped[str] = mapped_column(
+        String, primary_key=True, server_default="default"
+    )
+    channel: Mapped[str] = mapped_column(
+        String, primary_key=True, server_default="stable"
+    )
+    platform: Mapped[str] = mapped_column(
+        String, primary_key=True, server_default="any"
+    )
+    version: Mapped[str] = mapped_column(String, nullable=False)
     url: Mapped[str] = mapped_column(String, nullable=False)
+    rollout_percentage: Mapped[float] = mapped_column(
+        Float, nullable=False, server_default="100"
+    )
+    rollout_ramp_seconds: Mapped[int] = mapped_column(
+        Integer, nullable=False, server_default="0"
+    )
+    published_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
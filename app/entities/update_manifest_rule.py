@@ -0,0 +1,31 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import DateTime, Index, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.entities.base import EntityBase
+
+
+class UpdateManifestRuleEntity(EntityBase):
+    """A release served to a range of requester versions instead of the latest."""
+
+    __tablename__ = "update_manifest_rules"
+    __table_args__ = (
+        Index("ix_update_manifest_rules_key", "product", "channel", "platform"),
+    )
+
+    id: Mapped[UUID] = mapped_column(
+        primary_key=True, server_default=func.gen_random_uuid()
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    product: Mapped[str] = mapped_column(String, nullable=False)
+    channel: Mapped[str] = mapped_column(String, nullable=False)
+    platform: Mapped[str] = mapped_column(String, nullable=False)
+    # The requester version range, [min_version, max_version)
+    min_version: Mapped[str] = mapped_column(String, nullable=True)
+    max_version: Mapped[str] = mapped_column(String, nullable=True)
+    version: Mapped[str] = mapped_column(String, nullable=False)
+    url: Mapped[str] = mapped_column(String, nullable=False)
@@ -16,6 +16,8 @@ class UpdateFileInfoToCreate(BaseModel):
     name: str | None = None
     size: int | None = None
     comment: str | None = None
+    sha256: str | None = None
+    version: str | None = None
 
 
 class UpdateFileInfo(UpdateFileInfoToCreate):
@@ -23,3 +25,84 @@ class UpdateFileInfo(UpdateFileInfoToCreate):
 
     id: Annotated[str, BeforeValidator(str_from_uuid)]
     created_at: datetime
+    last_downloaded_at: datetime | None = None
+    variants: dict[str, int] = {}
+
+
+class UpdateFileInfoPage(BaseModel):
+    items: list[UpdateFileInfo]
+    # Opaque cursor of the next page, None for the last one
+    next_cursor: str | None = None
+
+
+class StorageLimits(BaseModel):
+    max_count: int
+    max_bytes: int | None = None
+
+
+class UpdateFileEviction(BaseModel):
+    file_ids: list[str] = []
+    # Source and target file ids of the patches dropped with the files
+    patches: list[tuple[str, str]] = []
+
+
+class StorageReferences(BaseModel):
+    # Creation time of the files by id
+    files: dict[str, datetime] = {}
+    uploads: set[str] = set()
+    # Source and target file ids of the patches
+    patches: set[tuple[str, str]] = set()
+
+
+class UpdateFileChunks(BaseModel):
+    size: int | None = None
+    chunk_size: int
+    # SHA-256 hex digests of the chunks in order, the last one may be shorter
+    sha256: list[str]
+
+
+class DownloadSchedulerStats(BaseModel):
+    max_active: int
+    active: int
+    queued: int
+    admitted: int
+    rejected: int
+    # Seconds
+    average_wait: float
+    max_wait: float
+    average_duration: float
+
+
+class UpdateFileCacheStats(BaseModel):
+    max_bytes: int = 0
+    size_bytes: int = 0
+    entries: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class StorageReconcileReport(BaseModel):
+    started_at: datetime
+    finished_at: datetime | None = None
+    scanned: int = 0
+    # Blobs without records, deleted once older than the grace period
+    orphans_deleted: int = 0
+    orphan_bytes_freed: int = 0
+    orphans_recent: int = 0
+    # Records of the files whose blobs are gone
+    missing_deleted: int = 0
+    # Resumable uploads inactive for longer than their TTL
+    uploads_expired: int = 0
+    # Entries not named like blobs, left alone
+    unknown: int = 0
+    errors: int = 0
+
+
+class StorageReconcileStats(BaseModel):
+    runs: int = 0
+    orphans_deleted: int = 0
+    orphan_bytes_freed: int = 0
+    missing_deleted: int = 0
+    uploads_expired: int = 0
+    last_run: StorageReconcileReport | None = None
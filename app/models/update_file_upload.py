@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Annotated
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict
+
+from app.models.update_file import str_from_uuid
+
+
+class UpdateFileUploadToCreate(BaseModel):
+    name: str | None = None
+    comment: str | None = None
+    version: str | None = None
+    length: int | None = None
+
+
+class UpdateFileUploadInfo(UpdateFileUploadToCreate):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Annotated[str, BeforeValidator(str_from_uuid)]
+    created_at: datetime
+    updated_at: datetime
+    # Bytes received so far
+    offset: int = 0
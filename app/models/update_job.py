@@ -0,0 +1,35 @@
+from datetime import datetime
+from enum import StrEnum
+from typing import Annotated
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict
+
+from app.models.update_file import str_from_uuid
+
+
+class UpdateJobKind(StrEnum):
+    VERIFY = "verify"
+    COMPRESS = "compress"
+    BUILD_PATCHES = "build_patches"
+
+
+class UpdateJobStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class UpdateJobInfo(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Annotated[str, BeforeValidator(str_from_uuid)]
+    file_id: Annotated[str, BeforeValidator(str_from_uuid)]
+    kind: str
+    status: UpdateJobStatus
+    attempts: int
+    created_at: datetime
+    updated_at: datetime
+    # Not before, e.g. when retried with a backoff
+    run_at: datetime
+    error: str | None = None
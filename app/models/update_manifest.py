@@ -1,6 +1,67 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Annotated
 
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
 
-class UpdateManifest(BaseModel):
+from app.models.update_file import str_from_uuid
+
+# Single-product setups use the defaults, as they did before the dimensions
+DEFAULT_PRODUCT = "default"
+DEFAULT_CHANNEL = "stable"
+DEFAULT_PLATFORM = "any"
+
+
+class UpdateManifestKey(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    product: str = Field(default=DEFAULT_PRODUCT, min_length=1, max_length=64)
+    channel: str = Field(default=DEFAULT_CHANNEL, min_length=1, max_length=64)
+    platform: str = Field(default=DEFAULT_PLATFORM, min_length=1, max_length=64)
+
+
+class UpdateManifestBase(BaseModel):
     version: str
     url: str
+
+
+class UpdateManifestRelease(UpdateManifestBase):
+    product: str = Field(default=DEFAULT_PRODUCT, min_length=1, max_length=64)
+    channel: str = Field(default=DEFAULT_CHANNEL, min_length=1, max_length=64)
+    platform: str = Field(default=DEFAULT_PLATFORM, min_length=1, max_length=64)
+
+    @property
+    def key(self) -> UpdateManifestKey:
+        return UpdateManifestKey(
+            product=self.product, channel=self.channel, platform=self.platform
+        )
+
+
+class UpdateManifest(UpdateManifestRelease):
+    # Share of the clients served the manifest, by their client ids
+    rollout_percentage: float = Field(default=100, ge=0, le=100)
+    # Seconds the share grows over from zero after publishing, 0 for at once
+    rollout_ramp_seconds: int = Field(default=0, ge=0)
+    # Set on publishing a version, the ramp starts from it
+    published_at: datetime | None = None
+
+
+class ClientUpdateManifest(UpdateManifestBase):
+    # Set when a patch from the requester version is available
+    patch_url: str | None = None
+    patch_size: int | None = None
+
+
+class UpdateManifestRuleToCreate(UpdateManifestRelease):
+    """Serves the manifest to the requester versions in the range instead."""
+
+    # Inclusive, no lower bound if None
+    min_version: str | None = None
+    # Exclusive, no upper bound if None
+    max_version: str | None = None
+
+
+class UpdateManifestRule(UpdateManifestRuleToCreate):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: Annotated[str, BeforeValidator(str_from_uuid)]
+    created_at: datetime
@@ -0,0 +1,15 @@
+from datetime import datetime
+from typing import Annotated
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict
+
+from app.models.update_file import str_from_uuid
+
+
+class UpdatePatchInfo(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    source_id: Annotated[str, BeforeValidator(str_from_uuid)]
+    target_id: Annotated[str, BeforeValidator(str_from_uuid)]
+    created_at: datetime
+    size: int
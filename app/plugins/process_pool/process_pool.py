@@ -0,0 +1,12 @@
+import multiprocessing
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool_executor(max_workers: int) -> Iterator[ProcessPoolExecutor]:
+    """Pool of worker processes for CPU-bound jobs, started on demand."""
+
+    # Forking a process with running threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        yield executor
@@ -27,7 +27,9 @@ async def check_access_by_api_key(
 async def check_access_by_crm_token_or_api_key(
     credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
     auth_service: AuthService = Depends(Provide[Container.auth_service]),
-) -> None:
+) -> str | None:
+    """The CRM token of a client, None for the API key."""
+
     try:
         await auth_service.check_access_by_api_key(
             credentials.scheme, credentials.credentials
@@ -36,3 +38,5 @@ async def check_access_by_crm_token_or_api_key(
         await auth_service.check_access_by_crm_token(
             credentials.scheme, credentials.credentials
         )
+        return credentials.credentials
+    return None
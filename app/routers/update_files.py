@@ -1,20 +1,69 @@
 from typing import Annotated
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, Form, UploadFile, status
-from fastapi.responses import StreamingResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from starlette.datastructures import FormData, UploadFile
 
+from app.api.errors import WrongDataError
+from app.api.responses import BLOBResponse
 from app.core.containers import Container, inject_module
-from app.models.update_file import UpdateFileInfo
+from app.models.update_file import (
+    DownloadSchedulerStats,
+    StorageReconcileStats,
+    UpdateFileCacheStats,
+    UpdateFileChunks,
+    UpdateFileInfo,
+)
+from app.models.update_file_upload import UpdateFileUploadInfo
+from app.models.update_job import UpdateJobInfo
 from app.routers.auth_validation import check_access_by_api_key
-from app.services.update_files.service import UpdateFileService
+from app.services.update_files.reconciler import StorageReconciler
+from app.services.update_files.service import (
+    INFOS_MAX_PAGE_SIZE,
+    INFOS_PAGE_SIZE,
+    UpdateFileService,
+)
+from app.services.update_files.uploads import UpdateFileUploadService
 
 inject_module(__name__)
 
 
+@inject
+async def check_upload_size(
+    request: Request,
+    update_file_service: UpdateFileService = Depends(
+        Provide[Container.update_file_service]
+    ),
+) -> None:
+    """Reject an upload which cannot be stored by its declared Content-Length."""
+
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit():
+        await update_file_service.check_upload_size(int(content_length))
+
+
+def _form_text(form: FormData, name: str) -> str | None:
+    value = form.get(name)
+    if isinstance(value, UploadFile):
+        raise WrongDataError(name, "Input should be a valid string")
+    return value
+
+
 update_files_router = APIRouter(
     responses={404: {"messages": "Not found"}},
 )
+# Uploads which cannot be stored are rejected before they are received, only
+# once the caller is authorized. Their bodies are read by the endpoints, as
+# FastAPI reads declared form fields before solving the dependencies.
+UPLOAD_DEPENDENCIES = [Depends(check_access_by_api_key), Depends(check_upload_size)]
 
 
 @update_files_router.get(
@@ -24,11 +73,60 @@ update_files_router = APIRouter(
 )
 @inject
 async def get_update_file_infos(
+    response: Response,
+    limit: Annotated[int, Query(ge=1, le=INFOS_MAX_PAGE_SIZE)] = INFOS_PAGE_SIZE,
+    cursor: str | None = None,
     update_file_service: UpdateFileService = Depends(
         Provide[Container.update_file_service]
     ),
 ) -> list[UpdateFileInfo]:
-    return await update_file_service.get_all_infos()
+    page = await update_file_service.get_infos_page(limit, cursor)
+    # The next page is requested with the cursor, the header is absent on the last
+    if page.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return page.items
+
+
+@update_files_router.get(
+    "/service/update-files/cache-stats",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def get_update_file_cache_stats(
+    update_file_service: UpdateFileService = Depends(
+        Provide[Container.update_file_service]
+    ),
+) -> UpdateFileCacheStats:
+    return update_file_service.get_cache_stats()
+
+
+@update_files_router.get(
+    "/service/update-files/reconcile-stats",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def get_update_file_reconcile_stats(
+    storage_reconciler: StorageReconciler = Depends(
+        Provide[Container.storage_reconciler]
+    ),
+) -> StorageReconcileStats:
+    return storage_reconciler.get_stats()
+
+
+@update_files_router.get(
+    "/service/update-files/download-stats",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def get_update_file_download_stats(
+    update_file_service: UpdateFileService = Depends(
+        Provide[Container.update_file_service]
+    ),
+) -> DownloadSchedulerStats:
+    return update_file_service.get_download_stats()
 
 
 @update_files_router.get(
@@ -38,30 +136,242 @@ async def get_update_file_infos(
 @inject
 async def get_update_file(
     id: str,
+    range_header: Annotated[str | None, Header(alias="Range")] = None,
+    if_range: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+    if_modified_since: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None,
     update_file_service: UpdateFileService = Depends(
         Provide[Container.update_file_service]
     ),
-) -> StreamingResponse:
-    return StreamingResponse(
-        await update_file_service.get_file(id),
-        media_type="application/octet-stream",
+) -> Response:
+    download = await update_file_service.get_file(
+        id,
+        range_header=range_header,
+        if_range=if_range,
+        if_none_match=if_none_match,
+        if_modified_since=if_modified_since,
+        accept_encoding=accept_encoding,
     )
+    if download.content is None:
+        return Response(status_code=download.status_code, headers=download.headers)
+    return BLOBResponse(
+        download.content,
+        file_path=download.file_path,
+        offset=download.offset,
+        count=download.count,
+        status_code=download.status_code,
+        headers=download.headers,
+        media_type=download.media_type,
+    )
+
+
+@update_files_router.get(
+    "/service/update-files/{id}/jobs",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def get_update_file_jobs(
+    id: str,
+    update_file_service: UpdateFileService = Depends(
+        Provide[Container.update_file_service]
+    ),
+) -> list[UpdateJobInfo]:
+    return await update_file_service.get_jobs(id)
+
+
+@update_files_router.get(
+    "/update-files/{id}/chunks",
+    tags=["client-applications"],
+)
+@inject
+async def get_update_file_chunks(
+    id: str,
+    update_file_service: UpdateFileService = Depends(
+        Provide[Container.update_file_service]
+    ),
+) -> UpdateFileChunks:
+    return await update_file_service.get_chunks(id)
 
 
 @update_files_router.post(
     "/service/update-files",
     tags=["service-operations"],
-    dependencies=[Depends(check_access_by_api_key)],
+    dependencies=UPLOAD_DEPENDENCIES,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "file": {"type": "string", "format": "binary"},
+                            "comment": {"type": "string"},
+                            "version": {"type": "string"},
+                        },
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
 )
 @inject
 async def upload_update_file(
-    file: UploadFile,
-    comment: Annotated[str | None, Form()] = None,
+    request: Request,
+    update_file_service: UpdateFileService = Depends(
+        Provide[Container.update_file_service]
+    ),
+) -> UpdateFileInfo:
+    async with request.form(max_files=1) as form:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise WrongDataError("file")
+        # Processed by the job workers once stored, never per request
+        return await update_file_service.create(
+            file,
+            comment=_form_text(form, "comment"),
+            version=_form_text(form, "version"),
+        )
+
+
+@update_files_router.post(
+    "/service/update-files/raw",
+    tags=["service-operations"],
+    dependencies=UPLOAD_DEPENDENCIES,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            },
+        }
+    },
+)
+@inject
+async def upload_raw_update_file(
+    request: Request,
+    name: Annotated[str | None, Query()] = None,
+    comment: Annotated[str | None, Query()] = None,
+    version: Annotated[str | None, Query()] = None,
     update_file_service: UpdateFileService = Depends(
         Provide[Container.update_file_service]
     ),
 ) -> UpdateFileInfo:
-    return await update_file_service.create(file, comment=comment)
+    # The body is streamed right into the storage, with no multipart spooling
+    return await update_file_service.create_from_stream(
+        request.stream(), name, comment=comment, version=version
+    )
+
+
+@update_files_router.post(
+    "/service/update-files/uploads",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+    status_code=status.HTTP_201_CREATED,
+)
+@inject
+async def create_update_file_upload(
+    request: Request,
+    response: Response,
+    upload_length: Annotated[int | None, Header(ge=0)] = None,
+    name: Annotated[str | None, Query()] = None,
+    comment: Annotated[str | None, Query()] = None,
+    version: Annotated[str | None, Query()] = None,
+    upload_service: UpdateFileUploadService = Depends(
+        Provide[Container.update_file_upload_service]
+    ),
+) -> UpdateFileUploadInfo:
+    upload = await upload_service.create(name, comment, version, upload_length)
+    response.headers["Location"] = str(
+        request.url_for("get_update_file_upload", id=upload.id)
+    )
+    return upload
+
+
+@update_files_router.head(
+    "/service/update-files/uploads/{id}",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def get_update_file_upload(
+    id: str,
+    upload_service: UpdateFileUploadService = Depends(
+        Provide[Container.update_file_upload_service]
+    ),
+) -> Response:
+    upload = await upload_service.get(id)
+    headers = {"Upload-Offset": str(upload.offset), "Cache-Control": "no-store"}
+    if upload.length is not None:
+        headers["Upload-Length"] = str(upload.length)
+    return Response(headers=headers)
+
+
+@update_files_router.patch(
+    "/service/update-files/uploads/{id}",
+    tags=["service-operations"],
+    dependencies=UPLOAD_DEPENDENCIES,
+    status_code=status.HTTP_204_NO_CONTENT,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/offset+octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            },
+        }
+    },
+)
+@inject
+async def append_update_file_upload(
+    id: str,
+    request: Request,
+    upload_offset: Annotated[int, Header(ge=0)],
+    upload_service: UpdateFileUploadService = Depends(
+        Provide[Container.update_file_upload_service]
+    ),
+) -> Response:
+    offset = await upload_service.append(id, upload_offset, request.stream())
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT, headers={"Upload-Offset": str(offset)}
+    )
+
+
+@update_files_router.post(
+    "/service/update-files/uploads/{id}/finalize",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def finalize_update_file_upload(
+    id: str,
+    upload_service: UpdateFileUploadService = Depends(
+        Provide[Container.update_file_upload_service]
+    ),
+) -> UpdateFileInfo:
+    return await upload_service.finalize(id)
+
+
+@update_files_router.delete(
+    "/service/update-files/uploads/{id}",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+@inject
+async def delete_update_file_upload(
+    id: str,
+    upload_service: UpdateFileUploadService = Depends(
+        Provide[Container.update_file_upload_service]
+    ),
+) -> None:
+    await upload_service.delete(id)
 
 
 @update_files_router.delete(
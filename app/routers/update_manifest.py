@@ -1,19 +1,38 @@
 from typing import Annotated
 
 from dependency_injector.wiring import Provide, inject
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Depends, Header, Query, Response, status
 
 from app.core.containers import Container, inject_module
-from app.models.update_manifest import UpdateManifest
+from app.models.update_manifest import (
+    DEFAULT_CHANNEL,
+    DEFAULT_PLATFORM,
+    DEFAULT_PRODUCT,
+    ClientUpdateManifest,
+    UpdateManifest,
+    UpdateManifestKey,
+    UpdateManifestRule,
+    UpdateManifestRuleToCreate,
+)
 from app.routers.auth_validation import (
     check_access_by_api_key,
     check_access_by_crm_token_or_api_key,
 )
+from app.services.update_files.conditional import etag_listed
+from app.services.update_manifest.rollout import ANONYMOUS_CLIENT_ID
 from app.services.update_manifest.service import UpdateManifestService
 
 inject_module(__name__)
 
 
+def get_manifest_key(
+    product: Annotated[str, Query(min_length=1, max_length=64)] = DEFAULT_PRODUCT,
+    channel: Annotated[str, Query(min_length=1, max_length=64)] = DEFAULT_CHANNEL,
+    platform: Annotated[str, Query(min_length=1, max_length=64)] = DEFAULT_PLATFORM,
+) -> UpdateManifestKey:
+    return UpdateManifestKey(product=product, channel=channel, platform=platform)
+
+
 update_manifest_router = APIRouter(
     responses={404: {"messages": "Not found"}},
 )
@@ -22,16 +41,30 @@ update_manifest_router = APIRouter(
 @update_manifest_router.get(
     "/update-manifest",
     tags=["client-applications"],
-    dependencies=[Depends(check_access_by_crm_token_or_api_key)],
+    response_model=ClientUpdateManifest,
+    response_model_exclude_none=True,
 )
 @inject
 async def get_update_manifest(
     current_version: Annotated[str, Query(alias="currentVersion")],
+    key: Annotated[UpdateManifestKey, Depends(get_manifest_key)],
+    crm_token: Annotated[str | None, Depends(check_access_by_crm_token_or_api_key)],
+    if_none_match: Annotated[str | None, Header()] = None,
+    x_client_id: Annotated[str | None, Header()] = None,
     update_manifest_service: UpdateManifestService = Depends(
         Provide[Container.update_manifest_service]
     ),
-) -> UpdateManifest:
-    return await update_manifest_service.get(current_version)
+) -> Response:
+    client_id = None
+    if crm_token is not None:
+        # Rollouts pick the clients by their own stable id, the CRM tokens rotate
+        client_id = x_client_id or ANONYMOUS_CLIENT_ID
+    # Sent as serialized once, without validating and encoding the model again
+    answer = await update_manifest_service.get_answer(current_version, key, client_id)
+    headers = {"ETag": answer.etag}
+    if if_none_match is not None and etag_listed(if_none_match, answer.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=answer.body, media_type="application/json", headers=headers)
 
 
 @update_manifest_router.post(
@@ -58,8 +91,55 @@ async def set_update_manifest(
 )
 @inject
 async def remove_update_manifest(
+    key: Annotated[UpdateManifestKey, Depends(get_manifest_key)],
+    update_manifest_service: UpdateManifestService = Depends(
+        Provide[Container.update_manifest_service]
+    ),
+) -> None:
+    await update_manifest_service.delete(key)
+
+
+@update_manifest_router.get(
+    "/service/update-manifest/rules",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def get_update_manifest_rules(
+    update_manifest_service: UpdateManifestService = Depends(
+        Provide[Container.update_manifest_service]
+    ),
+) -> list[UpdateManifestRule]:
+    return await update_manifest_service.get_rules()
+
+
+@update_manifest_router.post(
+    "/service/update-manifest/rules",
+    tags=["service-operations"],
+    dependencies=[Depends(check_access_by_api_key)],
+    status_code=status.HTTP_201_CREATED,
+)
+@inject
+async def add_update_manifest_rule(
+    rule: UpdateManifestRuleToCreate,
+    update_manifest_service: UpdateManifestService = Depends(
+        Provide[Container.update_manifest_service]
+    ),
+) -> UpdateManifestRule:
+    return await update_manifest_service.add_rule(rule)
+
+
+@update_manifest_router.delete(
+    "/service/update-manifest/rules/{id}",
+    tags=["service-operations"],
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(check_access_by_api_key)],
+)
+@inject
+async def remove_update_manifest_rule(
+    id: str,
     update_manifest_service: UpdateManifestService = Depends(
         Provide[Container.update_manifest_service]
     ),
 ) -> None:
-    await update_manifest_service.delete()
+    await update_manifest_service.delete_rule(id)
@@ -0,0 +1,45 @@
+from typing import Annotated
+
+from dependency_injector.wiring import Provide, inject
+from fastapi import APIRouter, Depends, Header, Response
+
+from app.api.responses import BLOBResponse
+from app.core.containers import Container, inject_module
+from app.services.update_patches.service import UpdatePatchService
+
+inject_module(__name__)
+
+
+update_patches_router = APIRouter(
+    responses={404: {"messages": "Not found"}},
+)
+
+
+@update_patches_router.get(
+    "/update-patches/{source_id}/{target_id}",
+    tags=["client-applications"],
+)
+@inject
+async def get_update_patch(
+    source_id: str,
+    target_id: str,
+    range_header: Annotated[str | None, Header(alias="Range")] = None,
+    if_range: Annotated[str | None, Header()] = None,
+    update_patch_service: UpdatePatchService = Depends(
+        Provide[Container.update_patch_service]
+    ),
+) -> Response:
+    download = await update_patch_service.get_patch(
+        source_id, target_id, range_header=range_header, if_range=if_range
+    )
+    if download.content is None:
+        return Response(status_code=download.status_code, headers=download.headers)
+    return BLOBResponse(
+        download.content,
+        file_path=download.file_path,
+        offset=download.offset,
+        count=download.count,
+        status_code=download.status_code,
+        headers=download.headers,
+        media_type=download.media_type,
+    )
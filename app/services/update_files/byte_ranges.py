@@ -0,0 +1,76 @@
+"""HTTP byte range handling for update file downloads (RFC 9110, section 14)."""
+
+from dataclasses import dataclass
+
+from app.api.errors import ApiRangeNotSatisfiableError
+
+# Requests with more ranges than this are served in full
+MAX_RANGES = 16
+
+
+@dataclass(frozen=True)
+class ByteRange:
+    start: int
+    end: int  # inclusive
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start + 1
+
+    def content_range(self, size: int) -> str:
+        return f"bytes {self.start}-{self.end}/{size}"
+
+
+def parse_range_header(value: str, size: int) -> list[ByteRange] | None:
+    """Parse a Range header value against an object of the given size.
+
+    Returns None when the header must be ignored and the whole object served,
+    otherwise the satisfiable ranges, sorted and with overlaps coalesced.
+
+    Raises: ApiRangeNotSatisfiableError
+    """
+
+    unit, _, specs = value.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges: list[ByteRange] = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if not first:
+                # Suffix range: the last N bytes
+                suffix_length = int(last)
+                if suffix_length > 0 and size > 0:
+                    ranges.append(ByteRange(max(size - suffix_length, 0), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start < size:
+            ranges.append(
+                ByteRange(start, size - 1 if end is None else min(end, size - 1))
+            )
+
+    if not ranges:
+        raise ApiRangeNotSatisfiableError(size)
+    if len(ranges) > MAX_RANGES:
+        return None
+    return _coalesce(ranges)
+
+
+def _coalesce(ranges: list[ByteRange]) -> list[ByteRange]:
+    ranges = sorted(ranges, key=lambda r: r.start)
+    merged = [ranges[0]]
+    for current in ranges[1:]:
+        previous = merged[-1]
+        if current.start <= previous.end + 1:
+            merged[-1] = ByteRange(previous.start, max(previous.end, current.end))
+        else:
+            merged.append(current)
+    return merged
@@ -0,0 +1,89 @@
+"""Pre-compressed variants of update files and content coding negotiation."""
+
+import gzip
+import shutil
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+
+import zstandard
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Encoding:
+    name: str
+    # Appended to the object id to get the id of the variant
+    suffix: str
+    # Blocking, compresses the source file into the target one
+    compress: Callable[[Path, Path], None]
+
+
+def _compress_gzip(source_path: Path, target_path: Path) -> None:
+    # Fixed mtime makes the variant reproducible
+    with (
+        open(source_path, "rb") as source,
+        open(target_path, "wb") as target,
+        gzip.GzipFile(fileobj=target, mode="wb", compresslevel=9, mtime=0) as f,
+    ):
+        shutil.copyfileobj(source, f, COPY_BUFFER_SIZE)
+
+
+def _compress_zstd(source_path: Path, target_path: Path) -> None:
+    compressor = zstandard.ZstdCompressor(level=19)
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        compressor.copy_stream(source, target, write_size=COPY_BUFFER_SIZE)
+
+
+ENCODINGS: dict[str, Encoding] = {
+    "gzip": Encoding(name="gzip", suffix=".gz", compress=_compress_gzip),
+    "zstd": Encoding(name="zstd", suffix=".zst", compress=_compress_zstd),
+}
+
+
+def choose_encoding(
+    accept_encoding: str | None, variants: Mapping[str, int]
+) -> str | None:
+    """Choose a variant acceptable by the client (RFC 9110, section 12.5.3).
+
+    Variants with the highest quality value win, the smallest one among them.
+    None stands for the identity (not encoded) content.
+    """
+
+    if accept_encoding is None or not variants:
+        return None
+
+    qualities: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if coding:
+            qualities[coding] = _parse_quality(params)
+
+    best: tuple[float, int] | None = None
+    chosen = None
+    for name, size in variants.items():
+        quality = qualities.get(name, qualities.get("*", 0.0))
+        if quality <= 0:
+            continue
+        rank = (-quality, size)
+        if best is None or rank < best:
+            best, chosen = rank, name
+
+    # The identity is only preferred when the client says so explicitly
+    identity = qualities.get("identity")
+    if best is not None and identity is not None and identity > -best[0]:
+        return None
+    return chosen
+
+
+def _parse_quality(params: str) -> float:
+    for param in params.split(";"):
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
@@ -0,0 +1,60 @@
+"""HTTP conditional requests for update downloads (RFC 9110, section 13)."""
+
+from datetime import UTC, datetime
+from email.utils import format_datetime, parsedate_to_datetime
+
+
+def format_http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(UTC).replace(microsecond=0), usegmt=True)
+
+
+def is_not_modified(
+    if_none_match: str | None,
+    if_modified_since: str | None,
+    etag: str | None,
+    last_modified: datetime,
+) -> bool:
+    """Check whether a GET request can be answered with 304 Not Modified."""
+
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return etag is not None and etag_listed(if_none_match, etag)
+    if if_modified_since is not None:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def if_range_matches(
+    value: str | None, etag: str | None, last_modified: datetime
+) -> bool:
+    """Check an If-Range validator, an absent one always matches."""
+
+    if value is None:
+        return True
+    if value.startswith(('"', "W/")):
+        # Strong comparison, weak entity tags never match
+        return etag is not None and value.strip() == etag
+    validator = _parse_http_date(value)
+    return validator is not None and validator == last_modified.replace(microsecond=0)
+
+
+def etag_listed(header: str, etag: str) -> bool:
+    """Weak comparison of an entity tag with a list of them."""
+
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == etag:
+            return True
+    return False
+
+
+def _parse_http_date(value: str) -> datetime | None:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    # Dates without a time zone cannot be compared and are ignored
+    return parsed if parsed.tzinfo is not None else None
@@ -0,0 +1,130 @@
+import asyncio
+import secrets
+from collections.abc import AsyncGenerator, AsyncIterator
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+from fastapi import status
+
+from app.services.update_files.byte_ranges import ByteRange, parse_range_header
+from app.services.update_files.storage.file_repository import ClosingContent
+from app.services.update_files.storage.interfaces import BLOBRepositoryInterface
+
+MEDIA_TYPE = "application/octet-stream"
+
+
+@dataclass
+class UpdateFileDownload:
+    # No content is sent for 304 Not Modified
+    content: AsyncIterator[bytes | memoryview] | None = None
+    headers: dict[str, str] = field(default_factory=dict)
+    status_code: int = status.HTTP_200_OK
+    media_type: str = MEDIA_TYPE
+    # Set when the content can be sent directly from a local file
+    file_path: Path | None = None
+    offset: int = 0
+    count: int | None = None
+
+
+async def get_download(
+    blob_repository: BLOBRepositoryInterface,
+    object_id: str,
+    headers: dict[str, str],
+    range_header: str | None,
+    zero_copy: bool,
+) -> UpdateFileDownload:
+    """Get the object content, or the requested ranges of it.
+
+    Raises: FileNotFoundError
+    """
+
+    blob = await blob_repository.stat(object_id)
+    ranges = None
+    if range_header is not None:
+        ranges = parse_range_header(range_header, blob.size)
+
+    file_path = blob_repository.get_path(object_id) if zero_copy else None
+    if not ranges:
+        headers["Content-Length"] = str(blob.size)
+        return UpdateFileDownload(
+            content=await blob_repository.get(object_id),
+            headers=headers,
+            file_path=file_path,
+        )
+
+    if len(ranges) == 1:
+        (byte_range,) = ranges
+        headers["Content-Range"] = byte_range.content_range(blob.size)
+        headers["Content-Length"] = str(byte_range.length)
+        return UpdateFileDownload(
+            content=await blob_repository.get(
+                object_id, byte_range.start, byte_range.length
+            ),
+            headers=headers,
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            file_path=file_path,
+            offset=byte_range.start,
+            count=byte_range.length,
+        )
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    content_length = 0
+    try:
+        for byte_range in ranges:
+            part_header = _multipart_header(boundary, byte_range, blob.size)
+            part_content = await blob_repository.get(
+                object_id, byte_range.start, byte_range.length
+            )
+            parts.append((part_header, part_content))
+            content_length += len(part_header) + byte_range.length
+    except BaseException:
+        # The parts opened so far hold the object
+        await _close_parts(parts)
+        raise
+
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(content_length + len(closing))
+    return UpdateFileDownload(
+        # Each part holds the object until it is closed
+        content=ClosingContent(
+            _multipart_content(parts, closing), partial(_close_parts, parts)
+        ),
+        headers=headers,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+    )
+
+
+def _multipart_header(boundary: str, byte_range: ByteRange, size: int) -> bytes:
+    # Delimiters start with CRLF, for the first part it forms an empty preamble
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {MEDIA_TYPE}\r\n"
+        f"Content-Range: {byte_range.content_range(size)}\r\n\r\n"
+    ).encode()
+
+
+async def _multipart_content(
+    parts: list[tuple[bytes, AsyncIterator[bytes | memoryview]]], closing: bytes
+) -> AsyncGenerator[bytes | memoryview]:
+    for part_header, content in parts:
+        yield part_header
+        async for chunk in content:
+            yield chunk
+    yield closing
+
+
+async def _close_parts(
+    parts: list[tuple[bytes, AsyncIterator[bytes | memoryview]]],
+) -> None:
+    await asyncio.gather(*(close_content(content) for _, content in parts))
+
+
+async def close_content(content: AsyncIterator[bytes | memoryview]) -> None:
+    """Release what the content holds, e.g. a storage reader or a transfer slot."""
+
+    aclose = getattr(content, "aclose", None)
+    if aclose is not None:
+        await aclose()
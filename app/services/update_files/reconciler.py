@@ -0,0 +1,184 @@
+"""Reconciliation of the file storage with the records of the files in it."""
+
+import asyncio
+import re
+from datetime import UTC, datetime, timedelta
+from logging import Logger
+
+from app.models.update_file import (
+    StorageReconcileReport,
+    StorageReconcileStats,
+    StorageReferences,
+)
+from app.services.update_files.compression import ENCODINGS
+from app.services.update_files.scheduler import DownloadScheduler, TokenBucket
+from app.services.update_files.service import UpdateFileService
+from app.services.update_files.storage.file_info_repository import FileInfoRepository
+from app.services.update_files.storage.interfaces import (
+    BLOBEntry,
+    BLOBRepositoryInterface,
+)
+from app.services.update_files.uploads import (
+    UpdateFileUploadService,
+    upload_object_id,
+)
+from app.services.update_patches.diff import patch_object_id
+from app.settings import AppSettings
+
+# A file, its variant, upload or patch, any of them possibly being written
+BLOB_NAME = re.compile(r"[0-9a-f]{32}(\.from-[0-9a-f]{32})?(\.[^.]+)?(\.tmp)?")
+SCAN_BATCH_SIZE = 256
+# Seconds to wait for while downloads are queued
+BUSY_POLL_INTERVAL = 1
+
+
+class StorageReconciler:
+    """Deletes blobs without records and records without blobs.
+
+    Runs periodically in the background. The stale resumable uploads are
+    dropped first, then the storage is listed and compared to the references
+    read in one query before and after the listing. Only the entries older
+    than the grace period are deleted, so the uploads in flight are left
+    alone. The entries are checked at a limited rate, and not at all while
+    downloads are queued, to stay out of the way of the transfers.
+    """
+
+    def __init__(
+        self,
+        blob_repository: BLOBRepositoryInterface,
+        file_info_repository: FileInfoRepository,
+        file_service: UpdateFileService,
+        upload_service: UpdateFileUploadService,
+        scheduler: DownloadScheduler,
+        config: AppSettings,
+        logger: Logger,
+    ) -> None:
+        self.blob_repository = blob_repository
+        self.file_infos = file_info_repository
+        self.file_service = file_service
+        self.upload_service = upload_service
+        self.scheduler = scheduler
+        self.interval = config.file_reconcile_interval
+        self.grace_period = timedelta(seconds=config.file_reconcile_grace_period)
+        self.bucket = (
+            TokenBucket(config.file_reconcile_rate)
+            if config.file_reconcile_rate
+            else None
+        )
+        self.logger = logger
+        self._stats = StorageReconcileStats()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.interval:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def get_stats(self) -> StorageReconcileStats:
+        return self._stats
+
+    async def run(self) -> StorageReconcileReport:
+        report = StorageReconcileReport(started_at=datetime.now(UTC))
+        deadline = report.started_at - self.grace_period
+        # Their records and blobs are deleted together, not left for the scan
+        report.uploads_expired = await self.upload_service.collect_stale()
+        # Read before listing, the blobs are stored before their records
+        references = await self.file_infos.get_references()
+        owned = _owned_blob_ids(references)
+        stored_ids: set[str] = set()
+        orphans: list[BLOBEntry] = []
+
+        async for batch in self.blob_repository.scan(SCAN_BATCH_SIZE):
+            await self._throttle(len(batch))
+            for entry in batch:
+                report.scanned += 1
+                stored_ids.add(entry.object_id)
+                if entry.object_id in owned:
+                    continue
+                if BLOB_NAME.fullmatch(entry.object_id) is None:
+                    report.unknown += 1
+                elif entry.modified_at >= deadline:
+                    report.orphans_recent += 1
+                else:
+                    orphans.append(entry)
+
+        # Read again, a blob may have been recorded while listing, e.g. an
+        # upload sealed as a file keeps the time it was last appended to
+        owned = _owned_blob_ids(await self.file_infos.get_references())
+        for entry in orphans:
+            if entry.object_id not in owned:
+                await self._delete_orphan(entry, report)
+
+        for file_id, created_at in references.files.items():
+            if file_id in stored_ids or created_at >= deadline:
+                continue
+            await self._throttle(1)
+            self.logger.warning(f"Dropping the record of missing {file_id=}")
+            try:
+                await self.file_service.delete_file(file_id)
+            except Exception:
+                self.logger.exception(f"Failed to drop the record of {file_id=}")
+                report.errors += 1
+            else:
+                report.missing_deleted += 1
+
+        report.finished_at = datetime.now(UTC)
+        self._update_stats(report)
+        self.logger.info(f"Reconciled the file storage: {report}")
+        return report
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run()
+            except Exception:
+                self.logger.exception("Failed to reconcile the file storage")
+
+    async def _throttle(self, amount: int) -> None:
+        while self.scheduler.get_stats().queued:
+            await asyncio.sleep(BUSY_POLL_INTERVAL)
+        if self.bucket is not None:
+            await self.bucket.consume(amount)
+
+    async def _delete_orphan(
+        self, entry: BLOBEntry, report: StorageReconcileReport
+    ) -> None:
+        await self._throttle(1)
+        self.logger.warning(f"Deleting orphaned blob {entry.object_id}")
+        try:
+            await self.blob_repository.delete(entry.object_id)
+        except FileNotFoundError:
+            # Deleted meanwhile
+            pass
+        except OSError:
+            self.logger.exception(f"Failed to delete {entry.object_id}")
+            report.errors += 1
+            return
+        report.orphans_deleted += 1
+        report.orphan_bytes_freed += entry.size
+
+    def _update_stats(self, report: StorageReconcileReport) -> None:
+        self._stats.runs += 1
+        self._stats.orphans_deleted += report.orphans_deleted
+        self._stats.orphan_bytes_freed += report.orphan_bytes_freed
+        self._stats.missing_deleted += report.missing_deleted
+        self._stats.uploads_expired += report.uploads_expired
+        self._stats.last_run = report
+
+
+def _owned_blob_ids(references: StorageReferences) -> set[str]:
+    """Ids of the blobs the records refer to, including the file variants."""
+
+    suffixes = ["", *(encoding.suffix for encoding in ENCODINGS.values())]
+    return (
+        {id + suffix for id in references.files for suffix in suffixes}
+        | {upload_object_id(id) for id in references.uploads}
+        | {patch_object_id(source, target) for source, target in references.patches}
+    )
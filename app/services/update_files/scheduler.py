@@ -0,0 +1,200 @@
+import asyncio
+import math
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import suppress
+from dataclasses import replace
+from logging import Logger
+from time import monotonic
+
+from app.api.errors import ApiServiceUnavailableError
+from app.models.update_file import DownloadSchedulerStats
+from app.services.update_files.downloads import UpdateFileDownload
+from app.settings import AppSettings
+
+# Weight of the last transfer in the average transfer duration
+DURATION_SMOOTHING = 0.2
+
+
+class TokenBucket:
+    """Byte rate limit allowing bursts of up to one second."""
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = monotonic()
+
+    async def consume(self, amount: int) -> None:
+        now = monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Going into debt makes the concurrent consumers queue up
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class DownloadScheduler:
+    """Admission control and bandwidth shaping of file transfers.
+
+    At most the configured number of transfers run at once, the others wait
+    for a slot in FIFO order. When the queue is full or the wait times out,
+    the download is rejected with a Retry-After estimate.
+    """
+
+    def __init__(self, config: AppSettings, logger: Logger):
+        self.max_active = config.download_max_concurrent
+        self.max_queued = config.download_max_queued
+        self.queue_timeout = config.download_queue_timeout
+        self.rate_limit = config.download_rate_limit
+        self.global_bucket = (
+            TokenBucket(config.download_global_rate_limit)
+            if config.download_global_rate_limit
+            else None
+        )
+        self.logger = logger
+        self._active = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._admitted = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._average_duration: float | None = None
+
+    @property
+    def shaping(self) -> bool:
+        return bool(self.rate_limit or self.global_bucket)
+
+    async def schedule(self, download: UpdateFileDownload) -> UpdateFileDownload:
+        """Wait for a transfer slot, the content releases it once closed.
+
+        Raises: ApiServiceUnavailableError
+        """
+
+        if download.content is None:
+            return download
+        try:
+            await self._acquire()
+        except ApiServiceUnavailableError:
+            await _close(download.content)
+            raise
+
+        content = ScheduledContent(
+            self,
+            download.content,
+            TokenBucket(self.rate_limit) if self.rate_limit else None,
+        )
+        # Files sent directly by the server cannot be shaped
+        file_path = None if self.shaping else download.file_path
+        return replace(download, content=content, file_path=file_path)
+
+    def get_stats(self) -> DownloadSchedulerStats:
+        return DownloadSchedulerStats(
+            max_active=self.max_active,
+            active=self._active,
+            queued=len(self._waiters),
+            admitted=self._admitted,
+            rejected=self._rejected,
+            average_wait=self._total_wait / self._admitted if self._admitted else 0,
+            max_wait=self._max_wait,
+            average_duration=self._average_duration or 0,
+        )
+
+    async def _acquire(self) -> None:
+        started = monotonic()
+        if not self.max_active or (
+            self._active < self.max_active and not self._waiters
+        ):
+            self._active += 1
+        elif self.max_queued and len(self._waiters) >= self.max_queued:
+            self._reject()
+        else:
+            await self._wait()
+
+        waited = monotonic() - started
+        self._admitted += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+
+    async def _wait(self) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(self.queue_timeout or None):
+                await waiter
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot has been handed over meanwhile
+                self._release()
+            else:
+                waiter.cancel()
+                with suppress(ValueError):
+                    self._waiters.remove(waiter)
+            if isinstance(e, TimeoutError):
+                self._reject()
+            raise
+
+    def _release(self) -> None:
+        # The slot is handed over to the first waiter still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def _reject(self) -> None:
+        self._rejected += 1
+        # Time for the queue ahead to drain through the slots
+        duration = self._average_duration or 1.0
+        retry_after = (len(self._waiters) + 1) * duration / (self.max_active or 1)
+        raise ApiServiceUnavailableError(retry_after=max(1, math.ceil(retry_after)))
+
+    def _finish(self, duration: float) -> None:
+        self._release()
+        if self._average_duration is None:
+            self._average_duration = duration
+        else:
+            self._average_duration += DURATION_SMOOTHING * (
+                duration - self._average_duration
+            )
+
+
+class ScheduledContent:
+    """Content iterator holding a transfer slot until it is closed."""
+
+    def __init__(
+        self,
+        scheduler: DownloadScheduler,
+        content: AsyncIterator[bytes | memoryview],
+        bucket: TokenBucket | None,
+    ):
+        self.scheduler = scheduler
+        self.content = content
+        self.bucket = bucket
+        self.started = monotonic()
+        self.closed = False
+
+    def __aiter__(self) -> "ScheduledContent":
+        return self
+
+    async def __anext__(self) -> bytes | memoryview:
+        chunk = await anext(self.content)
+        if self.bucket is not None:
+            await self.bucket.consume(len(chunk))
+        if self.scheduler.global_bucket is not None:
+            await self.scheduler.global_bucket.consume(len(chunk))
+        return chunk
+
+    async def aclose(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.scheduler._finish(monotonic() - self.started)
+        await _close(self.content)
+
+
+async def _close(content: AsyncIterator[bytes | memoryview]) -> None:
+    aclose = getattr(content, "aclose", None)
+    if aclose is not None:
+        await aclose()
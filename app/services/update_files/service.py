@@ -1,68 +1,389 @@
-from io import BytesIO
+import asyncio
+import binascii
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import AsyncGenerator, AsyncIterable
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
 from logging import Logger
+from uuid import UUID, uuid4
 
-from fastapi import UploadFile
+from fastapi import status
+from packaging.version import InvalidVersion, Version
+from starlette.datastructures import UploadFile
 
-from app.api.errors import ApiNotFoundError
-from app.models.update_file import UpdateFileInfo, UpdateFileInfoToCreate
+from app.api.errors import (
+    ApiNotFoundError,
+    ApiRequestEntityTooLargeError,
+    WrongDataError,
+)
+from app.models.update_file import (
+    DownloadSchedulerStats,
+    StorageLimits,
+    UpdateFileCacheStats,
+    UpdateFileChunks,
+    UpdateFileEviction,
+    UpdateFileInfo,
+    UpdateFileInfoPage,
+    UpdateFileInfoToCreate,
+)
+from app.models.update_job import UpdateJobInfo, UpdateJobKind
+from app.services.update_files.compression import ENCODINGS, choose_encoding
+from app.services.update_files.conditional import (
+    format_http_date,
+    if_range_matches,
+    is_not_modified,
+)
+from app.services.update_files.downloads import (
+    UpdateFileDownload,
+    close_content,
+    get_download,
+)
+from app.services.update_files.scheduler import DownloadScheduler
 from app.services.update_files.storage.file_info_repository import FileInfoRepository
-from app.services.update_files.storage.interfaces import BLOBRepositoryInterface
+from app.services.update_files.storage.interfaces import (
+    BLOBRepositoryInterface,
+    BLOBSizeLimitError,
+)
+from app.services.update_jobs.storage.repository import UpdateJobRepository
+from app.services.update_patches.service import UpdatePatchService
 from app.settings import AppSettings
 
+UPLOAD_READ_SIZE = 1024 * 1024
+# Downloads are recorded for the eviction order with this precision
+LAST_DOWNLOAD_PRECISION = timedelta(minutes=1)
+INFOS_PAGE_SIZE = 100
+INFOS_MAX_PAGE_SIZE = 1000
+
+
+class UpdateFileIntegrityError(Exception):
+    pass
+
 
 class UpdateFileService:
     def __init__(
         self,
         repository: BLOBRepositoryInterface,
         file_info_repository: FileInfoRepository,
+        job_repository: UpdateJobRepository,
+        patch_service: UpdatePatchService,
+        scheduler: DownloadScheduler,
+        executor: Executor,
         config: AppSettings,
         logger: Logger,
     ) -> None:
         self.blob_repository = repository
         self.file_infos = file_info_repository
-        self.capacity = config.file_storage_capacity
+        self.jobs = job_repository
+        self.patch_service = patch_service
+        self.scheduler = scheduler
+        self.executor = executor
+        self.storage_limits = StorageLimits(
+            max_count=config.file_storage_capacity,
+            max_bytes=config.file_storage_capacity_bytes or None,
+        )
+        self.max_upload_size = config.file_max_upload_size
+        self.zero_copy = config.file_zero_copy
+        self.compression_encodings = config.file_compression_encodings
+        self.compression_min_saving = config.file_compression_min_saving
         self.logger = logger
 
-    async def create(self, file: UploadFile, comment: str | None) -> UpdateFileInfo:
-        await self._ensure_capacity()
-        created_info = await self.file_infos.create(
-            UpdateFileInfoToCreate(name=file.filename, size=file.size, comment=comment)
+    async def create(
+        self, file: UploadFile, comment: str | None, version: str | None = None
+    ) -> UpdateFileInfo:
+        return await self.create_from_stream(
+            _read_upload(file), file.filename, comment, version
+        )
+
+    async def create_from_stream(
+        self,
+        content: AsyncIterable[bytes],
+        name: str | None,
+        comment: str | None,
+        version: str | None = None,
+    ) -> UpdateFileInfo:
+        version = normalize_version(version)
+        object_id = uuid4().hex
+        started_at = time.monotonic()
+        try:
+            digest = await self.blob_repository.create(
+                object_id=object_id,
+                content=content,
+                max_size=self.max_upload_size or None,
+            )
+        except BLOBSizeLimitError:
+            raise ApiRequestEntityTooLargeError
+        elapsed = time.monotonic() - started_at
+        self.logger.info(
+            f"Stored {object_id=}: {digest.size} bytes in {elapsed:.3f}s"
+            f" ({digest.size / max(elapsed, 1e-6) / 2**20:.1f} MiB/s)"
         )
         try:
-            await self.blob_repository.create(object_id=created_info.id, file=file)
+            file_info, eviction = await self.file_infos.create(
+                object_id,
+                UpdateFileInfoToCreate(
+                    name=name,
+                    size=digest.size,
+                    comment=comment,
+                    sha256=digest.sha256,
+                    version=version,
+                ),
+                UpdateFileChunks(
+                    chunk_size=digest.chunk_size, sha256=digest.chunk_sha256
+                ),
+                self.storage_limits,
+                # The file is processed by the job workers
+                list(UpdateJobKind),
+            )
         except Exception:
-            await self.file_infos.delete(created_info.id)
+            await self._delete_blobs(object_id)
             raise
-        return created_info
+        await self.delete_evicted(eviction)
+        return file_info
+
+    async def get_jobs(self, object_id: str) -> list[UpdateJobInfo]:
+        if await self.file_infos.get(object_id) is None:
+            raise ApiNotFoundError
+        return await self.jobs.get_for_file(object_id)
+
+    async def verify(self, object_id: str) -> None:
+        """Check the stored file against the digest computed at upload."""
+
+        info = await self.file_infos.get(object_id)
+        if info is None or info.sha256 is None:
+            return
+        digest = await self.blob_repository.digest(object_id, self.executor)
+        if digest.sha256 != info.sha256:
+            raise UpdateFileIntegrityError(f"SHA-256 mismatch of {object_id=}")
+
+    async def check_upload_size(self, size: int) -> None:
+        """Reject an upload by its declared size before it is received."""
+
+        if self.max_upload_size and size > self.max_upload_size:
+            raise ApiRequestEntityTooLargeError
+        free_space = await self.blob_repository.get_free_space()
+        if free_space is not None and size > free_space:
+            raise ApiRequestEntityTooLargeError("Not enough storage space")
+
+    async def compress(self, object_id: str) -> None:
+        """Produce pre-compressed variants of a new file, run as a job."""
+
+        if not self.compression_encodings:
+            return
+        info = await self.file_infos.get(object_id)
+        if info is None or info.size is None:
+            return
+        for name in self.compression_encodings:
+            encoding = ENCODINGS.get(name)
+            if encoding is None:
+                self.logger.warning(f"Skipping unknown encoding {name=}")
+                continue
+
+            variant_id = object_id + encoding.suffix
+            try:
+                variant = await self.blob_repository.create_derived(
+                    variant_id, [object_id], encoding.compress, self.executor
+                )
+            except FileNotFoundError:
+                # The file has been deleted meanwhile
+                return
+            if variant.size > info.size * (1 - self.compression_min_saving):
+                self.logger.info(f"Dropping {name} variant of {object_id=}, no gain")
+                await self.blob_repository.delete(variant_id)
+                continue
+            if not await self.file_infos.add_variant(object_id, name, variant.size):
+                await self.blob_repository.delete(variant_id)
+                return
+            self.logger.info(
+                f"Stored {name} variant of {object_id=}: {info.size} -> {variant.size}"
+            )
+        await self.evict_over_limits()
 
-    async def get_all_infos(self) -> list[UpdateFileInfo]:
-        return await self.file_infos.get_all()
+    async def build_patches(self, object_id: str) -> None:
+        """Build the patches to a new file, run as a job."""
+
+        await self.patch_service.build_patches(object_id)
+        await self.evict_over_limits()
+
+    async def evict_over_limits(self) -> None:
+        """Evict files if the variants or patches added exceed the byte limit."""
+
+        if self.storage_limits.max_bytes is None:
+            return
+        await self.delete_evicted(await self.file_infos.evict(self.storage_limits))
+
+    async def get_infos_page(
+        self, limit: int, cursor: str | None = None
+    ) -> UpdateFileInfoPage:
+        """Get a page of the file infos, newest first.
+
+        The cursor is the one of the previous page, None for the first page.
+        """
+
+        after = _decode_cursor(cursor) if cursor is not None else None
+        # One more is read to know if there is a next page
+        infos = await self.file_infos.get_page(limit + 1, after)
+        page = UpdateFileInfoPage(items=infos[:limit])
+        if len(infos) > limit:
+            last = page.items[-1]
+            page.next_cursor = _encode_cursor(last.created_at, last.id)
+        return page
+
+    async def get_chunks(self, object_id: str) -> UpdateFileChunks:
+        chunks = await self.file_infos.get_chunks(object_id)
+        if chunks is None:
+            # Also for files uploaded before the chunks were hashed
+            raise ApiNotFoundError
+        return chunks
+
+    async def get_file(
+        self,
+        object_id: str,
+        range_header: str | None = None,
+        if_range: str | None = None,
+        if_none_match: str | None = None,
+        if_modified_since: str | None = None,
+        accept_encoding: str | None = None,
+    ) -> UpdateFileDownload:
+        info = await self.file_infos.get(object_id)
+        if info is None:
+            raise ApiNotFoundError
 
-    async def get_file(self, object_id: str) -> BytesIO:
+        conditions = (range_header, if_range, if_none_match, if_modified_since)
+        # The chunk hashes are of the identity content, ranges are served from it
+        encoding = None
+        if range_header is None:
+            encoding = choose_encoding(accept_encoding, info.variants)
         try:
-            return await self.blob_repository.get(object_id)
+            download = await self._get_representation(info, encoding, *conditions)
         except FileNotFoundError:
-            raise ApiNotFoundError
+            if encoding is None:
+                raise ApiNotFoundError
+            self.logger.warning(f"Missing {encoding} variant of {object_id=}")
+            try:
+                download = await self._get_representation(info, None, *conditions)
+            except FileNotFoundError:
+                raise ApiNotFoundError
+        download = await self.scheduler.schedule(download)
+        if download.content is not None:
+            try:
+                await self.file_infos.mark_downloaded(info.id, LAST_DOWNLOAD_PRECISION)
+            except BaseException:
+                # No response holds the transfer slot and the reader of the file
+                await close_content(download.content)
+                raise
+        return download
 
     async def delete_file(self, object_id: str) -> None:
+        await self.jobs.delete_for_file(object_id)
+        await self.patch_service.delete_for_file(object_id)
+        await self._delete_blobs(object_id)
+        await self.file_infos.delete(object_id)
+
+    def get_cache_stats(self) -> UpdateFileCacheStats:
+        return self.blob_repository.get_cache_stats() or UpdateFileCacheStats()
+
+    def get_download_stats(self) -> DownloadSchedulerStats:
+        return self.scheduler.get_stats()
+
+    async def _get_representation(
+        self,
+        info: UpdateFileInfo,
+        encoding: str | None,
+        range_header: str | None,
+        if_range: str | None,
+        if_none_match: str | None,
+        if_modified_since: str | None,
+    ) -> UpdateFileDownload:
+        """Raises: FileNotFoundError"""
+
+        blob_id = info.id
+        etag = f'"{info.sha256}"' if info.sha256 else None
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Last-Modified": format_http_date(info.created_at),
+        }
+        if info.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding is not None:
+            blob_id += ENCODINGS[encoding].suffix
+            # Each content coding is a separate representation
+            etag = f'"{info.sha256}-{encoding}"' if info.sha256 else None
+            headers["Content-Encoding"] = encoding
+        if etag is not None:
+            headers["ETag"] = etag
+
+        # Answered from the metadata alone, the blob is not touched
+        if is_not_modified(if_none_match, if_modified_since, etag, info.created_at):
+            headers.pop("Content-Encoding", None)
+            return UpdateFileDownload(
+                headers=headers, status_code=status.HTTP_304_NOT_MODIFIED
+            )
+
+        if not if_range_matches(if_range, etag, info.created_at):
+            range_header = None
+        return await get_download(
+            self.blob_repository, blob_id, headers, range_header, self.zero_copy
+        )
+
+    async def delete_evicted(self, eviction: UpdateFileEviction) -> None:
+        """Delete the blobs of the evicted files, concurrently."""
+
+        if not eviction.file_ids:
+            return
+        self.logger.info(f"Evicted {eviction.file_ids} to free storage")
+        await asyncio.gather(
+            self._delete_blobs(*eviction.file_ids),
+            self.patch_service.delete_blobs(eviction.patches),
+        )
+
+    async def _delete_blobs(self, *object_ids: str) -> None:
+        """Delete the objects along with their pre-compressed variants."""
+
+        await asyncio.gather(
+            *(
+                self._delete_blob(object_id + suffix)
+                for object_id in object_ids
+                for suffix in ["", *(e.suffix for e in ENCODINGS.values())]
+            )
+        )
+
+    async def _delete_blob(self, blob_id: str) -> None:
         try:
-            await self.blob_repository.delete(object_id)
+            await self.blob_repository.delete(blob_id)
         except FileNotFoundError:
             pass
-        await self.file_infos.delete(object_id)
 
-    async def _ensure_capacity(self) -> None:
-        current_files = await self.file_infos.get_all()
-        # Expect that current_files are already sorted by creation time (desc)
-        current_count = len(current_files)
-        if current_count < self.capacity:
-            return
 
-        # Leave space for one extra file by removing oldest files
-        files_to_remove = current_count - self.capacity + 1
-        for file in current_files[-files_to_remove:]:
-            try:
-                await self.blob_repository.delete(file.id)
-            except FileNotFoundError:
-                pass
-            await self.file_infos.delete(file.id)
+def normalize_version(version: str | None) -> str | None:
+    if version is None:
+        return None
+    try:
+        return str(Version(version))
+    except InvalidVersion:
+        raise WrongDataError(loc="version", message="Invalid version")
+
+
+async def _read_upload(file: UploadFile) -> AsyncGenerator[bytes]:
+    while data := await file.read(UPLOAD_READ_SIZE):
+        yield data
+
+
+def _encode_cursor(created_at: datetime, id: str) -> str:
+    return urlsafe_b64encode(f"{created_at.isoformat()} {id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """The (created_at, id) position a page cursor points after.
+
+    Raises: WrongDataError
+    """
+
+    try:
+        created_at, id = urlsafe_b64decode(cursor).decode().split(" ")
+        position = datetime.fromisoformat(created_at), UUID(hex=id).hex
+        if position[0].tzinfo is None:
+            raise ValueError("No time zone")
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise WrongDataError(loc="cursor", message="Invalid cursor")
+    return position
@@ -0,0 +1,226 @@
+import asyncio
+from collections import OrderedDict
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Sequence,
+)
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from functools import partial
+from logging import Logger
+from pathlib import Path
+
+from app.models.update_file import UpdateFileCacheStats
+from app.services.update_files.storage.file_repository import (
+    ClosingContent,
+    iter_chunks,
+)
+from app.services.update_files.storage.interfaces import (
+    BLOBDigest,
+    BLOBEntry,
+    BLOBRepositoryInterface,
+    BLOBStat,
+)
+from app.settings import AppSettings
+
+
+@dataclass(frozen=True)
+class _CacheEntry:
+    content: bytes
+    stat: BLOBStat
+
+
+class CachedBLOBRepository(BLOBRepositoryInterface):
+    """Keeps the most recently downloaded objects in memory.
+
+    The total size of the cached objects is limited by a byte budget, the least
+    recently used objects are evicted first. Cached content is served as
+    memoryview slices, so no copy is made per request. Objects larger than the
+    budget, and all objects when the budget is 0, are passed through.
+    """
+
+    def __init__(
+        self,
+        repository: BLOBRepositoryInterface,
+        config: AppSettings,
+        logger: Logger,
+    ):
+        self.repository = repository
+        self.max_bytes = config.file_cache_max_bytes
+        self.chunk_size = config.file_chunk_size
+        self.logger = logger
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._loading: dict[str, asyncio.Lock] = {}
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    async def create(
+        self,
+        object_id: str,
+        content: AsyncIterable[bytes],
+        max_size: int | None = None,
+    ) -> BLOBDigest:
+        self._invalidate(object_id)
+        return await self.repository.create(object_id, content, max_size)
+
+    async def append(
+        self,
+        object_id: str,
+        content: AsyncIterable[bytes],
+        offset: int,
+        max_size: int | None = None,
+    ) -> int:
+        self._invalidate(object_id)
+        return await self.repository.append(object_id, content, offset, max_size)
+
+    async def seal(self, object_id: str, new_object_id: str) -> BLOBDigest:
+        self._invalidate(object_id)
+        self._invalidate(new_object_id)
+        return await self.repository.seal(object_id, new_object_id)
+
+    async def unseal(self, object_id: str, new_object_id: str) -> None:
+        self._invalidate(object_id)
+        self._invalidate(new_object_id)
+        await self.repository.unseal(object_id, new_object_id)
+
+    async def create_derived(
+        self,
+        object_id: str,
+        source_ids: Sequence[str],
+        transform: Callable[..., None],
+        executor: Executor | None = None,
+    ) -> BLOBStat:
+        self._invalidate(object_id)
+        return await self.repository.create_derived(
+            object_id, source_ids, transform, executor
+        )
+
+    async def digest(
+        self, object_id: str, executor: Executor | None = None
+    ) -> BLOBDigest:
+        # The stored object itself is checked, never the cached copy
+        return await self.repository.digest(object_id, executor)
+
+    async def stat(self, object_id: str) -> BLOBStat:
+        entry = self._entries.get(object_id)
+        if entry is not None:
+            return entry.stat
+        return await self.repository.stat(object_id)
+
+    async def get(
+        self, object_id: str, offset: int = 0, length: int | None = None
+    ) -> AsyncIterator[bytes | memoryview]:
+        entry = self._entries.get(object_id)
+        if entry is not None:
+            self._entries.move_to_end(object_id)
+            self._hits += 1
+            return self._serve(entry, offset, length)
+
+        if not self.max_bytes:
+            return await self.repository.get(object_id, offset, length)
+        stat = await self.repository.stat(object_id)
+        if stat.size > self.max_bytes:
+            return await self.repository.get(object_id, offset, length)
+        # Loaded on the first read, e.g. not at all if the file is sent directly,
+        # the object is held for the reader until then anyway
+        source = await self.repository.get(object_id)
+        return ClosingContent(
+            self._load_and_serve(object_id, stat, source, offset, length),
+            partial(_close, source),
+        )
+
+    async def delete(self, object_id: str) -> None:
+        self._invalidate(object_id)
+        await self.repository.delete(object_id)
+
+    def scan(self, batch_size: int) -> AsyncIterator[list[BLOBEntry]]:
+        return self.repository.scan(batch_size)
+
+    async def get_free_space(self) -> int | None:
+        return await self.repository.get_free_space()
+
+    def get_path(self, object_id: str) -> Path | None:
+        return self.repository.get_path(object_id)
+
+    def get_cache_stats(self) -> UpdateFileCacheStats:
+        return UpdateFileCacheStats(
+            max_bytes=self.max_bytes,
+            size_bytes=self._size,
+            entries=len(self._entries),
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+        )
+
+    async def _serve(
+        self, entry: _CacheEntry, offset: int, length: int | None
+    ) -> AsyncGenerator[memoryview]:
+        for chunk in iter_chunks(entry.content, offset, length, self.chunk_size):
+            yield chunk
+
+    async def _load_and_serve(
+        self,
+        object_id: str,
+        stat: BLOBStat,
+        source: AsyncIterator[bytes | memoryview],
+        offset: int,
+        length: int | None,
+    ) -> AsyncGenerator[memoryview]:
+        entry = await self._load(object_id, stat, source)
+        # Evicted content stays alive while it is referenced by the slices
+        for chunk in iter_chunks(entry.content, offset, length, self.chunk_size):
+            yield chunk
+
+    async def _load(
+        self,
+        object_id: str,
+        stat: BLOBStat,
+        source: AsyncIterator[bytes | memoryview],
+    ) -> _CacheEntry:
+        # Concurrent misses of the same object wait for a single load
+        lock = self._loading.setdefault(object_id, asyncio.Lock())
+        try:
+            async with lock:
+                entry = self._entries.get(object_id)
+                if entry is not None:
+                    self._entries.move_to_end(object_id)
+                    self._hits += 1
+                    return entry
+
+                self._misses += 1
+                entry = _CacheEntry(
+                    content=b"".join([chunk async for chunk in source]), stat=stat
+                )
+                # Not cached if the object was deleted while being loaded
+                if self._loading.get(object_id) is lock:
+                    self._store(object_id, entry)
+                return entry
+        finally:
+            if self._loading.get(object_id) is lock:
+                del self._loading[object_id]
+
+    def _store(self, object_id: str, entry: _CacheEntry) -> None:
+        self._entries[object_id] = entry
+        self._size += len(entry.content)
+        while self._size > self.max_bytes:
+            evicted_id, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.content)
+            self._evictions += 1
+            self.logger.debug(f"Evicted {evicted_id=} from the cache")
+
+    def _invalidate(self, object_id: str) -> None:
+        self._loading.pop(object_id, None)
+        entry = self._entries.pop(object_id, None)
+        if entry is not None:
+            self._size -= len(entry.content)
+
+
+async def _close(content: AsyncIterator[bytes | memoryview]) -> None:
+    aclose = getattr(content, "aclose", None)
+    if aclose is not None:
+        await aclose()
@@ -1,14 +1,54 @@
+from collections.abc import Sequence
 from contextlib import AbstractAsyncContextManager
+from datetime import datetime, timedelta
 from logging import Logger
 from typing import Callable
 from uuid import UUID
 
 from pydantic import TypeAdapter
-from sqlalchemy import delete, desc, select
+from sqlalchemy import (
+    BigInteger,
+    Text,
+    cast,
+    delete,
+    desc,
+    exists,
+    func,
+    literal,
+    null,
+    or_,
+    select,
+    true,
+    tuple_,
+    union_all,
+    update,
+)
 from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.sql import CompoundSelect, Select
+from sqlalchemy.sql.selectable import Exists
 
 from app.entities.update_file import UpdateFileEntity
-from app.models.update_file import UpdateFileInfo, UpdateFileInfoToCreate
+from app.entities.update_file_job import UpdateFileJobEntity
+from app.entities.update_file_patch import UpdateFilePatchEntity
+from app.entities.update_file_upload import UpdateFileUploadEntity
+from app.entities.update_manifest import UpdateManifestEntity
+from app.entities.update_manifest_rule import UpdateManifestRuleEntity
+from app.models.update_file import (
+    StorageLimits,
+    StorageReferences,
+    UpdateFileChunks,
+    UpdateFileEviction,
+    UpdateFileInfo,
+    UpdateFileInfoToCreate,
+)
+from app.services.update_jobs.storage.repository import enqueue_txn
+
+# Serializes the storage accounting of the files created concurrently
+STORAGE_LOCK_ID = 0x55504446
+# File infos are listed as plain rows of their columns, with no ORM objects
+INFO_COLUMNS = [getattr(UpdateFileEntity, name) for name in UpdateFileInfo.model_fields]
+INFO_LIST_ADAPTER = TypeAdapter(list[UpdateFileInfo])
+NEWEST_FIRST = (desc(UpdateFileEntity.created_at), desc(UpdateFileEntity.id))
 
 
 class FileInfoRepository:
@@ -22,16 +62,41 @@ class FileInfoRepository:
         )
         self.logger = logger
 
-    async def create(self, new_file_info: UpdateFileInfoToCreate) -> UpdateFileInfo:
+    async def create(
+        self,
+        id: str,
+        new_file_info: UpdateFileInfoToCreate,
+        chunks: UpdateFileChunks | None = None,
+        limits: StorageLimits | None = None,
+        jobs: Sequence[str] = (),
+    ) -> tuple[UpdateFileInfo, UpdateFileEviction]:
+        """Create the file info, evicting files to stay within the limits.
+
+        The eviction, the creation and the queueing of the file's jobs happen
+        in one transaction, the evicted files' blobs are left to the caller.
+        """
+
         async with self.db_session() as session:
-            db_object = UpdateFileEntity(**new_file_info.model_dump())
+            eviction = UpdateFileEviction()
+            if limits is not None:
+                eviction = await evict_txn(session, limits, new_file_info.size or 0)
+            db_object = UpdateFileEntity(
+                id=UUID(hex=id),
+                chunk_hashes=chunks.model_dump(exclude={"size"}) if chunks else None,
+                **new_file_info.model_dump(),
+            )
             session.add(db_object)
+            await enqueue_txn(session, id, jobs)
             await session.commit()
             await session.refresh(db_object)
-            return UpdateFileInfo.model_validate(db_object)
+            return UpdateFileInfo.model_validate(db_object), eviction
 
     async def get(self, id: str) -> UpdateFileInfo | None:
-        db_id = UUID(hex=id)
+        try:
+            db_id = UUID(hex=id)
+        except ValueError:
+            return None
+
         async with self.db_session() as session:
             query = select(UpdateFileEntity).filter_by(id=db_id)
             db_object = (await session.execute(query)).scalar_one_or_none()
@@ -39,13 +104,114 @@ class FileInfoRepository:
                 return None
             return UpdateFileInfo.model_validate(db_object)
 
+    async def get_chunks(self, id: str) -> UpdateFileChunks | None:
+        try:
+            db_id = UUID(hex=id)
+        except ValueError:
+            return None
+
+        async with self.db_session() as session:
+            query = select(
+                UpdateFileEntity.size, UpdateFileEntity.chunk_hashes
+            ).filter_by(id=db_id)
+            row = (await session.execute(query)).one_or_none()
+            if row is None or row.chunk_hashes is None:
+                return None
+            return UpdateFileChunks(size=row.size, **row.chunk_hashes)
+
     async def get_all(self) -> list[UpdateFileInfo]:
         """Get all update file infos ordered by creation timestamp descending."""
 
+        return await self._get_infos(select(*INFO_COLUMNS).order_by(*NEWEST_FIRST))
+
+    async def get_page(
+        self, limit: int, after: tuple[datetime, str] | None = None
+    ) -> list[UpdateFileInfo]:
+        """Get up to limit file infos following the (created_at, id) position.
+
+        Ordered by creation timestamp descending, like get_all().
+        """
+
+        query = select(*INFO_COLUMNS).order_by(*NEWEST_FIRST).limit(limit)
+        if after is not None:
+            created_at, id = after
+            query = query.where(
+                tuple_(UpdateFileEntity.created_at, UpdateFileEntity.id)
+                < (created_at, UUID(hex=id))
+            )
+        return await self._get_infos(query)
+
+    async def get_references(self) -> StorageReferences:
+        """Get the ids of everything the storage should hold, in one query."""
+
+        patch = UpdateFilePatchEntity
+        upload = UpdateFileUploadEntity
+        query: CompoundSelect = union_all(
+            select(
+                literal("file").label("kind"),
+                UpdateFileEntity.id,
+                null().label("target_id"),
+                UpdateFileEntity.created_at,
+            ),
+            select(literal("upload"), upload.id, null(), upload.created_at),
+            select(
+                literal("patch"), patch.source_id, patch.target_id, patch.created_at
+            ),
+        )
+        references = StorageReferences()
         async with self.db_session() as session:
-            query = select(UpdateFileEntity).order_by(desc(UpdateFileEntity.created_at))
-            db_objects = (await session.execute(query)).scalars().all()
-            return TypeAdapter(list[UpdateFileInfo]).validate_python(db_objects)
+            for kind, id, target_id, created_at in await session.execute(query):
+                if kind == "file":
+                    references.files[id.hex] = created_at
+                elif kind == "upload":
+                    references.uploads.add(id.hex)
+                else:
+                    references.patches.add((id.hex, target_id.hex))
+        return references
+
+    async def mark_downloaded(self, id: str, precision: timedelta) -> None:
+        """Record a download, updated at most once per precision to save writes."""
+
+        async with self.db_session() as session:
+            query = (
+                update(UpdateFileEntity)
+                .filter_by(id=UUID(hex=id))
+                .where(
+                    or_(
+                        UpdateFileEntity.last_downloaded_at.is_(None),
+                        UpdateFileEntity.last_downloaded_at < func.now() - precision,
+                    )
+                )
+                .values(last_downloaded_at=func.now())
+            )
+            await session.execute(query)
+            await session.commit()
+
+    async def add_variant(self, id: str, encoding: str, size: int) -> bool:
+        """Record a pre-compressed variant, False if the file info is gone."""
+
+        async with self.db_session() as session:
+            query = (
+                update(UpdateFileEntity)
+                .filter_by(id=UUID(hex=id))
+                .values(variants=UpdateFileEntity.variants.concat({encoding: size}))
+            )
+            result = await session.execute(query)
+            await session.commit()
+            return bool(result.rowcount)
+
+    async def evict(self, limits: StorageLimits) -> UpdateFileEviction:
+        """Evict the files over the limits, e.g. once variants or patches are added."""
+
+        async with self.db_session() as session:
+            eviction = await evict_txn(session, limits, 0, incoming_count=0)
+            await session.commit()
+            return eviction
+
+    async def _get_infos(self, query: Select) -> list[UpdateFileInfo]:
+        async with self.db_session() as session:
+            rows = (await session.execute(query)).all()
+            return INFO_LIST_ADAPTER.validate_python(rows)
 
     async def delete(self, id: str) -> None:
         try:
@@ -57,3 +223,122 @@ class FileInfoRepository:
             query = delete(UpdateFileEntity).filter_by(id=db_id)
             await session.execute(query)
             await session.commit()
+
+
+async def evict_txn(
+    session: AsyncSession,
+    limits: StorageLimits,
+    incoming_size: int,
+    incoming_count: int = 1,
+) -> UpdateFileEviction:
+    """Delete the file infos to evict to fit the incoming files of the size.
+
+    Takes a transaction-level advisory lock first, so concurrent creations
+    are accounted one after another and cannot overshoot the limits together.
+    The patches and the jobs of the evicted files are deleted as well, the
+    number of round trips does not depend on the number of evicted files.
+    """
+
+    await session.execute(select(func.pg_advisory_xact_lock(STORAGE_LOCK_ID)))
+    query = (
+        delete(UpdateFileEntity)
+        .where(
+            UpdateFileEntity.id.in_(
+                _eviction_candidates(limits, incoming_size, incoming_count)
+            )
+        )
+        .returning(UpdateFileEntity.id)
+    )
+    file_uuids = (await session.execute(query)).scalars().all()
+    if not file_uuids:
+        return UpdateFileEviction()
+
+    patch = UpdateFilePatchEntity
+    patches_query = (
+        delete(patch)
+        .where(or_(patch.source_id.in_(file_uuids), patch.target_id.in_(file_uuids)))
+        .returning(patch.source_id, patch.target_id)
+    )
+    patches = (await session.execute(patches_query)).all()
+    await session.execute(
+        delete(UpdateFileJobEntity).where(UpdateFileJobEntity.file_id.in_(file_uuids))
+    )
+    return UpdateFileEviction(
+        file_ids=[id.hex for id in file_uuids],
+        patches=[(source_id.hex, target_id.hex) for source_id, target_id in patches],
+    )
+
+
+def _eviction_candidates(
+    limits: StorageLimits, incoming_size: int, incoming_count: int
+) -> Select:
+    """Ids of the files to evict to fit the incoming ones, least recently used first.
+
+    A file counts as used when it is uploaded or downloaded, its size includes
+    the pre-compressed variants and the patches from it, which are deleted
+    along with it. The files the manifests or their rules refer to by version
+    or by URL are never evicted but still count.
+    """
+
+    file = UpdateFileEntity
+    variant = func.jsonb_each_text(file.variants).table_valued("value")
+    variants_size = (
+        select(func.coalesce(func.sum(cast(variant.c.value, BigInteger)), 0))
+        .select_from(variant)
+        .scalar_subquery()
+    )
+    patch = UpdateFilePatchEntity
+    # By the source, the first column of the primary key
+    patches_size = (
+        select(func.coalesce(func.sum(patch.size), 0))
+        .where(patch.source_id == file.id)
+        .scalar_subquery()
+    )
+    stored_size = func.coalesce(file.size, 0) + variants_size + patches_size
+    referenced = or_(
+        _referenced_by(UpdateManifestEntity), _referenced_by(UpdateManifestRuleEntity)
+    )
+    totals = select(
+        func.count().label("count"),
+        func.coalesce(func.sum(stored_size), 0).label("size"),
+    ).cte("totals")
+    recency = func.coalesce(file.last_downloaded_at, file.created_at)
+    order = (recency, file.created_at)
+    candidates = (
+        select(
+            file.id,
+            stored_size.label("size"),
+            func.row_number().over(order_by=order).label("position"),
+            func.sum(stored_size)
+            .over(order_by=order, rows=(None, 0))
+            .label("evicted_size"),
+        )
+        .where(~referenced)
+        .cte("candidates")
+    )
+    # Evicting a prefix of the candidates, each one is evicted if the limits
+    # are still exceeded with the ones before it gone
+    remaining_count = totals.c.count - candidates.c.position + 1
+    over_limits = [remaining_count + incoming_count > limits.max_count]
+    if limits.max_bytes:
+        remaining_size = totals.c.size - candidates.c.evicted_size + candidates.c.size
+        over_limits.append(remaining_size + incoming_size > limits.max_bytes)
+    return (
+        select(candidates.c.id)
+        .select_from(candidates.join(totals, true()))
+        .where(or_(*over_limits))
+    )
+
+
+def _referenced_by(
+    manifest: type[UpdateManifestEntity] | type[UpdateManifestRuleEntity],
+) -> Exists:
+    file = UpdateFileEntity
+    file_id = cast(file.id, Text)
+    return exists().where(
+        or_(
+            manifest.version == file.version,
+            func.strpos(manifest.url, func.replace(file_id, "-", "")) > 0,
+            func.strpos(manifest.url, file_id) > 0,
+        )
+    )
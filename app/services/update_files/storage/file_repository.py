@@ -1,14 +1,105 @@
-from io import BytesIO
+import asyncio
+import fcntl
+import hashlib
+import itertools
+import mmap
+import os
+import shutil
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generator,
+    Iterator,
+    Sequence,
+)
+from concurrent.futures import Executor
+from datetime import UTC, datetime
+from functools import partial
 from logging import Logger
 from pathlib import Path
 
 import aiofiles
 import aiofiles.os
-from fastapi import UploadFile
 
-from app.services.update_files.storage.interfaces import BLOBRepositoryInterface
+from app.services.update_files.storage.interfaces import (
+    BLOBConflictError,
+    BLOBDigest,
+    BLOBEntry,
+    BLOBRepositoryInterface,
+    BLOBSizeLimitError,
+    BLOBStat,
+)
 from app.settings import AppSettings
 
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+
+class ClosingContent(AsyncIterator[bytes | memoryview]):
+    """Content iterator calling back once it is closed or exhausted.
+
+    Unlike the finally clause of a generator, the callback is called even if
+    the iteration has never started, e.g. when the file is sent directly.
+    """
+
+    def __init__(
+        self,
+        content: AsyncIterator[bytes | memoryview],
+        on_close: Callable[[], Awaitable[None]],
+    ):
+        self.content = content
+        self.on_close: Callable[[], Awaitable[None]] | None = on_close
+
+    async def __anext__(self) -> bytes | memoryview:
+        try:
+            return await self.content.__anext__()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self) -> None:
+        if self.on_close is None:
+            return
+        on_close, self.on_close = self.on_close, None
+        try:
+            aclose = getattr(self.content, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            await on_close()
+
+
+class _SharedMapping:
+    """Read-only memory mapping of a file shared by its concurrent readers."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.readers = 0
+        self._mmap: mmap.mmap | None = None
+        self._mapped = False
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> mmap.mmap | None:
+        """Raises: FileNotFoundError and other OSError-based exceptions"""
+
+        async with self._lock:
+            if not self._mapped:
+                self._mmap = await asyncio.to_thread(_map_file, self.path)
+                self._mapped = True
+        return self._mmap
+
+    def close(self) -> None:
+        if self._mmap is None:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Slices are still referenced, the mapping is released along with them
+            pass
+        self._mmap = None
+
 
 class BLOBRepository(BLOBRepositoryInterface):
     def __init__(
@@ -17,24 +108,448 @@ class BLOBRepository(BLOBRepositoryInterface):
         logger: Logger,
     ):
         self.storage_path = Path(config.file_storage_path)
+        self.chunk_size = config.file_chunk_size
+        self.hash_chunk_size = config.file_hash_chunk_size
+        self.use_mmap = config.file_mmap
+        self.fsync = config.file_storage_fsync
+        self.delete_timeout = config.file_delete_timeout
         self.logger = logger
+        self._mappings: dict[str, _SharedMapping] = {}
+        # Number of the current readers by object id
+        self._readers: dict[str, int] = {}
+        # Objects deleted while being read, set once the last reader is gone
+        self._deleted: dict[str, asyncio.Event] = {}
+        self._deletions: set[asyncio.Task] = set()
+
+    async def create(
+        self,
+        object_id: str,
+        content: AsyncIterable[bytes],
+        max_size: int | None = None,
+    ) -> BLOBDigest:
+        """Raises: BLOBSizeLimitError, OSError"""
+
+        self.logger.debug(f"Writing {object_id=}")
+        path = self.storage_path / object_id
+        temp_path = _temp_path(path)
+        hasher = _Hasher(self.hash_chunk_size)
+        try:
+            async with aiofiles.open(temp_path, mode="wb") as f:
+                async for data in _rebatch(content, UPLOAD_BUFFER_SIZE):
+                    if max_size is not None and hasher.size + len(data) > max_size:
+                        raise BLOBSizeLimitError
+                    # hashlib releases the GIL, so hashing runs alongside the write
+                    await asyncio.gather(
+                        asyncio.to_thread(hasher.update, data), f.write(data)
+                    )
+            await asyncio.to_thread(_persist, temp_path, path, self.fsync)
+        except BaseException:
+            # No partial object is left behind
+            await asyncio.to_thread(temp_path.unlink, missing_ok=True)
+            raise
+        return hasher.digest()
 
-    async def create(self, object_id: str, file: UploadFile) -> None:
+    async def append(
+        self,
+        object_id: str,
+        content: AsyncIterable[bytes],
+        offset: int,
+        max_size: int | None = None,
+    ) -> int:
+        """Raises: BLOBConflictError, BLOBSizeLimitError, OSError"""
+
+        path = self.storage_path / object_id
+        flags = os.O_WRONLY | os.O_APPEND | (0 if offset else os.O_CREAT)
+        fd = await asyncio.to_thread(os.open, path, flags, 0o644)
+        try:
+            # The lock is released along with the descriptor
+            await asyncio.to_thread(_lock_exclusively, fd, path, offset)
+            size = offset
+            async with aiofiles.open(fd, mode="ab", closefd=False) as f:
+                async for data in _rebatch(content, UPLOAD_BUFFER_SIZE):
+                    if max_size is not None and size + len(data) > max_size:
+                        raise BLOBSizeLimitError
+                    await f.write(data)
+                    size += len(data)
+            return size
+        finally:
+            await asyncio.to_thread(os.close, fd)
+
+    async def seal(self, object_id: str, new_object_id: str) -> BLOBDigest:
+        """Raises: BLOBConflictError, OSError"""
+
+        self.logger.debug(f"Sealing {object_id=} as {new_object_id=}")
+        return await asyncio.to_thread(
+            _seal,
+            self.storage_path / object_id,
+            self.storage_path / new_object_id,
+            self.hash_chunk_size,
+            self.fsync,
+        )
+
+    async def unseal(self, object_id: str, new_object_id: str) -> None:
         """Raises: OSError"""
 
-        async with aiofiles.open(self.storage_path / object_id, mode="wb") as f:
-            # load the entire file into memory
-            content = await file.read()
-            self.logger.debug(f"Writing {file.filename=}")
-            await f.write(content)
+        self.logger.debug(f"Unsealing {object_id=} as {new_object_id=}")
+        new_path = self.storage_path / new_object_id
+        await aiofiles.os.replace(self.storage_path / object_id, new_path)
+        if self.fsync:
+            await asyncio.to_thread(_fsync_directory, new_path.parent)
 
-    async def get(self, object_id: str) -> BytesIO:
+    async def create_derived(
+        self,
+        object_id: str,
+        source_ids: Sequence[str],
+        transform: Callable[..., None],
+        executor: Executor | None = None,
+    ) -> BLOBStat:
         """Raises: FileNotFoundError and other OSError-based exceptions"""
 
-        async with aiofiles.open(self.storage_path / object_id, mode="rb") as f:
-            # load the entire file into memory
-            content = await f.read()
-            return BytesIO(content)
+        self.logger.debug(f"Deriving {object_id=} from {source_ids=}")
+        source_paths = [self.storage_path / source_id for source_id in source_ids]
+        path = self.storage_path / object_id
+        temp_path = _temp_path(path)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(
+                executor, partial(transform, *source_paths, temp_path)
+            )
+            await asyncio.to_thread(_persist, temp_path, path, self.fsync)
+        except BaseException:
+            # No partial object is left behind
+            await asyncio.to_thread(temp_path.unlink, missing_ok=True)
+            raise
+        return await self.stat(object_id)
+
+    async def digest(
+        self, object_id: str, executor: Executor | None = None
+    ) -> BLOBDigest:
+        """Raises: FileNotFoundError and other OSError-based exceptions"""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor,
+            partial(_digest_file, self.storage_path / object_id, self.hash_chunk_size),
+        )
+
+    async def stat(self, object_id: str) -> BLOBStat:
+        """Raises: FileNotFoundError and other OSError-based exceptions"""
+
+        self._check_not_deleted(object_id)
+        result = await aiofiles.os.stat(self.storage_path / object_id)
+        return BLOBStat(
+            size=result.st_size,
+            modified_at=datetime.fromtimestamp(result.st_mtime, UTC),
+        )
+
+    async def get(
+        self, object_id: str, offset: int = 0, length: int | None = None
+    ) -> AsyncIterator[bytes | memoryview]:
+        """Raises: FileNotFoundError and other OSError-based exceptions"""
+
+        self._check_not_deleted(object_id)
+        path = self.storage_path / object_id
+        # The reader holds the object until the content is closed, which may
+        # be long after the file is opened by the server to send it directly.
+        # It is counted before any await, for a concurrent delete to see it.
+        self._readers[object_id] = self._readers.get(object_id, 0) + 1
+        try:
+            # Fail before the response starts, the file itself is opened lazily
+            await aiofiles.os.stat(path)
+        except BaseException:
+            await self._release(object_id)
+            raise
+        content: AsyncIterator[bytes | memoryview]
+        if self.use_mmap:
+            content = self._read_mapped(object_id, path, offset, length)
+        else:
+            content = self._read_chunks(path, offset, length)
+        return ClosingContent(content, partial(self._release, object_id))
 
     async def delete(self, object_id: str) -> None:
-        await aiofiles.os.remove(self.storage_path / object_id)
+        """Delete the object, or hide it until its current readers are done.
+
+        New readers do not find a deleted object right away. The file is
+        removed once the last reader closes its content, or after the timeout.
+        """
+
+        self._check_not_deleted(object_id)
+        path = self.storage_path / object_id
+        # Current readers keep their mapping, new ones will not find the file
+        self._mappings.pop(object_id, None)
+        if not self._readers.get(object_id):
+            await aiofiles.os.remove(path)
+            return
+
+        # Registered before any await, for the last reader to signal it
+        released = self._deleted[object_id] = asyncio.Event()
+        try:
+            await aiofiles.os.stat(path)
+        except BaseException:
+            del self._deleted[object_id]
+            raise
+        task = asyncio.create_task(self._remove_released(object_id, path, released))
+        self._deletions.add(task)
+        task.add_done_callback(self._deletions.discard)
+
+    async def scan(self, batch_size: int) -> AsyncIterator[list[BLOBEntry]]:
+        entries = await asyncio.to_thread(os.scandir, self.storage_path)
+        try:
+            while True:
+                batch = await asyncio.to_thread(_scan_batch, entries, batch_size)
+                if batch is None:
+                    return
+                yield batch
+        finally:
+            entries.close()
+
+    async def get_free_space(self) -> int | None:
+        usage = await asyncio.to_thread(shutil.disk_usage, self.storage_path)
+        return usage.free
+
+    def get_path(self, object_id: str) -> Path | None:
+        return self.storage_path / object_id
+
+    def _check_not_deleted(self, object_id: str) -> None:
+        if object_id in self._deleted:
+            raise FileNotFoundError(f"{object_id} is deleted")
+
+    async def _release(self, object_id: str) -> None:
+        self._readers[object_id] -= 1
+        if self._readers[object_id]:
+            return
+        del self._readers[object_id]
+        released = self._deleted.get(object_id)
+        if released is not None:
+            released.set()
+
+    async def _remove_released(
+        self, object_id: str, path: Path, released: asyncio.Event
+    ) -> None:
+        try:
+            await asyncio.wait_for(released.wait(), self.delete_timeout)
+        except TimeoutError:
+            self.logger.warning(f"Deleting {object_id} while it is still being read")
+        try:
+            await aiofiles.os.remove(path)
+        except FileNotFoundError:
+            pass
+        finally:
+            del self._deleted[object_id]
+
+    async def _read_chunks(
+        self, path: Path, offset: int, length: int | None
+    ) -> AsyncGenerator[bytes]:
+        async with aiofiles.open(path, mode="rb") as f:
+            if offset:
+                await f.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                read_size = (
+                    self.chunk_size
+                    if remaining is None
+                    else min(self.chunk_size, remaining)
+                )
+                chunk = await f.read(read_size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def _read_mapped(
+        self, object_id: str, path: Path, offset: int, length: int | None
+    ) -> AsyncGenerator[memoryview]:
+        # Concurrent readers of the object share one mapping of the page cache
+        mapping = self._mappings.get(object_id)
+        if mapping is None:
+            mapping = self._mappings[object_id] = _SharedMapping(path)
+        mapping.readers += 1
+        chunks = None
+        try:
+            content = await mapping.open()
+            if content is not None:
+                chunks = iter_chunks(content, offset, length, self.chunk_size)
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            if chunks is not None:
+                chunks.close()
+            mapping.readers -= 1
+            if not mapping.readers:
+                if self._mappings.get(object_id) is mapping:
+                    del self._mappings[object_id]
+                mapping.close()
+
+
+def iter_chunks(
+    content: bytes | mmap.mmap, offset: int, length: int | None, chunk_size: int
+) -> Generator[memoryview]:
+    """Slice the content (or its part) into chunks without copying it."""
+
+    view = memoryview(content)
+    end = len(view) if length is None else min(offset + length, len(view))
+    for start in range(offset, end, chunk_size):
+        yield view[start : min(start + chunk_size, end)]
+
+
+def _map_file(path: Path) -> mmap.mmap | None:
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            # Empty files cannot be mapped
+            return None
+        # The mapping stays valid after the file is closed
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _lock_exclusively(fd: int, path: Path, size: int | None = None) -> None:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise BLOBConflictError
+    stat = os.fstat(fd)
+    # The file could have been sealed while it was being opened
+    if os.stat(path).st_ino != stat.st_ino:
+        raise FileNotFoundError(path)
+    if size is not None and stat.st_size != size:
+        raise BLOBConflictError
+
+
+def _seal(path: Path, new_path: Path, chunk_size: int, fsync: bool) -> BLOBDigest:
+    with open(path, "rb") as f:
+        _lock_exclusively(f.fileno(), path)
+        hasher = _Hasher(chunk_size)
+        while data := f.read(UPLOAD_BUFFER_SIZE):
+            hasher.update(data)
+        # Recent as a new file, the reconciliation leaves it until it is recorded
+        os.utime(f.fileno())
+        if fsync:
+            os.fsync(f.fileno())
+        # Renamed while locked, so nothing is appended after hashing
+        os.replace(path, new_path)
+    if fsync:
+        _fsync_directory(new_path.parent)
+    return hasher.digest()
+
+
+def _digest_file(path: Path, chunk_size: int) -> BLOBDigest:
+    hasher = _Hasher(chunk_size)
+    with open(path, "rb") as f:
+        while data := f.read(UPLOAD_BUFFER_SIZE):
+            hasher.update(data)
+    return hasher.digest()
+
+
+def _scan_batch(
+    entries: Iterator[os.DirEntry[str]], size: int
+) -> list[BLOBEntry] | None:
+    """Stat the next entries of the directory, None when there are none left."""
+
+    batch: list[BLOBEntry] = []
+    count = 0
+    for entry in itertools.islice(entries, size):
+        count += 1
+        try:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            # Deleted since it was listed
+            continue
+        batch.append(
+            BLOBEntry(
+                object_id=entry.name,
+                size=stat.st_size,
+                modified_at=datetime.fromtimestamp(stat.st_mtime, UTC),
+            )
+        )
+    return batch if count else None
+
+
+def _temp_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.tmp")
+
+
+def _persist(temp_path: Path, path: Path, fsync: bool) -> None:
+    """Move a complete file into place, so it is never seen half-written.
+
+    With fsync the content reaches the disk before the rename, and the rename
+    itself right after it, so neither is lost or reordered on a crash.
+    """
+
+    if fsync:
+        fd = os.open(temp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    os.replace(temp_path, path)
+    if fsync:
+        _fsync_directory(path.parent)
+
+
+def _fsync_directory(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+async def _rebatch(
+    content: AsyncIterable[bytes], size: int
+) -> AsyncGenerator[bytes | bytearray]:
+    """Join small pieces of the content, e.g. of a request body, into batches.
+
+    Fewer batches mean fewer writes and fewer hand-offs to the hashing thread.
+    """
+
+    buffer = bytearray()
+    async for data in content:
+        if not buffer and len(data) >= size:
+            yield data
+            continue
+        buffer += data
+        if len(buffer) >= size:
+            yield buffer
+            buffer = bytearray()
+    if buffer:
+        yield buffer
+
+
+class _Hasher:
+    """Computes the digests of content fed in pieces of any size."""
+
+    def __init__(self, chunk_size: int):
+        self.size = 0
+        self.chunk_size = chunk_size
+        self._sha256 = hashlib.sha256()
+        self._chunk = hashlib.sha256()
+        self._chunk_filled = 0
+        self._chunk_sha256: list[str] = []
+
+    def update(self, data: bytes | bytearray) -> None:
+        self.size += len(data)
+        self._sha256.update(data)
+        view = memoryview(data)
+        while view:
+            part = view[: self.chunk_size - self._chunk_filled]
+            self._chunk.update(part)
+            self._chunk_filled += len(part)
+            view = view[len(part) :]
+            if self._chunk_filled == self.chunk_size:
+                self._chunk_sha256.append(self._chunk.hexdigest())
+                self._chunk = hashlib.sha256()
+                self._chunk_filled = 0
+
+    def digest(self) -> BLOBDigest:
+        chunk_sha256 = list(self._chunk_sha256)
+        if self._chunk_filled:
+            # The last chunk may be shorter
+            chunk_sha256.append(self._chunk.hexdigest())
+        return BLOBDigest(
+            size=self.size,
+            sha256=self._sha256.hexdigest(),
+            chunk_size=self.chunk_size,
+            chunk_sha256=chunk_sha256,
+        )
@@ -1,15 +1,129 @@
 from abc import ABC, abstractmethod
-from io import BytesIO
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Sequence
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
 
-from fastapi import UploadFile
+from app.models.update_file import UpdateFileCacheStats
+
+
+@dataclass(frozen=True)
+class BLOBStat:
+    size: int
+    modified_at: datetime
+
+
+@dataclass(frozen=True)
+class BLOBEntry(BLOBStat):
+    object_id: str
+
+
+class BLOBSizeLimitError(Exception):
+    pass
+
+
+class BLOBConflictError(Exception):
+    """The object is being written, or it is not of the expected size."""
+
+
+@dataclass(frozen=True)
+class BLOBDigest:
+    size: int
+    # SHA-256 hex digests of the whole object and of its fixed-size chunks
+    sha256: str
+    chunk_size: int
+    chunk_sha256: list[str]
 
 
 class BLOBRepositoryInterface(ABC):
     @abstractmethod
-    async def create(self, object_id: str, file: UploadFile) -> None: ...
+    async def create(
+        self,
+        object_id: str,
+        content: AsyncIterable[bytes],
+        max_size: int | None = None,
+    ) -> BLOBDigest:
+        """Store the object and return its size and digests.
+
+        The content is written as it arrives, in bounded chunks. BLOBSizeLimitError is raised,
+        and nothing is stored, if the content turns out larger than max_size.
+        """
+
+    @abstractmethod
+    async def append(
+        self,
+        object_id: str,
+        content: AsyncIterable[bytes],
+        offset: int,
+        max_size: int | None = None,
+    ) -> int:
+        """Append the content to the object of the given size, return the new size.
+
+        The object is created when the offset is 0. BLOBConflictError is raised
+        if it is of another size or if someone else is appending to it. The
+        content written before a failure, e.g. a disconnect, stays appended.
+        """
+
+    @abstractmethod
+    async def seal(self, object_id: str, new_object_id: str) -> BLOBDigest:
+        """Move an appended object to its final id and return its digests.
+
+        BLOBConflictError is raised if someone is appending to the object.
+        """
+
+    @abstractmethod
+    async def unseal(self, object_id: str, new_object_id: str) -> None:
+        """Move a sealed object back to the id it was appended at."""
+
+    @abstractmethod
+    async def create_derived(
+        self,
+        object_id: str,
+        source_ids: Sequence[str],
+        transform: Callable[..., None],
+        executor: Executor | None = None,
+    ) -> BLOBStat:
+        """Store the object produced from other ones by a blocking transform.
+
+        The transform is called with the paths of the sources and of the new
+        object in the executor, the default one of the event loop if None.
+        """
+
+    @abstractmethod
+    async def digest(
+        self, object_id: str, executor: Executor | None = None
+    ) -> BLOBDigest:
+        """Compute the digests of the stored object in the executor."""
 
     @abstractmethod
-    async def get(self, object_id: str) -> BytesIO: ...
+    async def stat(self, object_id: str) -> BLOBStat: ...
+
+    @abstractmethod
+    async def get(
+        self, object_id: str, offset: int = 0, length: int | None = None
+    ) -> AsyncIterator[bytes | memoryview]:
+        """Get the object content (or its part) as an iterator of chunks.
+
+        Missing objects are reported by this call, while the content itself
+        is read only when the iterator is consumed.
+        """
 
     @abstractmethod
     async def delete(self, object_id: str) -> None: ...
+
+    @abstractmethod
+    def scan(self, batch_size: int) -> AsyncIterator[list[BLOBEntry]]:
+        """List all the stored objects in batches, including incomplete ones."""
+
+    async def get_free_space(self) -> int | None:
+        """Get the free space of the storage in bytes, if it is limited."""
+        return None
+
+    def get_path(self, object_id: str) -> Path | None:
+        """Get the local file path of the object, if it can be sent directly."""
+        return None
+
+    def get_cache_stats(self) -> UpdateFileCacheStats | None:
+        """Get the statistics of the in-memory cache, if the objects are cached."""
+        return None
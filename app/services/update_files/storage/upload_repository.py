@@ -0,0 +1,132 @@
+from collections.abc import Sequence
+from contextlib import AbstractAsyncContextManager
+from datetime import datetime
+from logging import Logger
+from typing import Callable
+from uuid import UUID
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from app.entities.update_file import UpdateFileEntity
+from app.entities.update_file_upload import UpdateFileUploadEntity
+from app.models.update_file import (
+    StorageLimits,
+    UpdateFileChunks,
+    UpdateFileEviction,
+    UpdateFileInfo,
+    UpdateFileInfoToCreate,
+)
+from app.models.update_file_upload import (
+    UpdateFileUploadInfo,
+    UpdateFileUploadToCreate,
+)
+from app.services.update_files.storage.file_info_repository import evict_txn
+from app.services.update_jobs.storage.repository import enqueue_txn
+
+
+class UpdateFileUploadRepository:
+    def __init__(
+        self,
+        db_session: Callable[..., AbstractAsyncContextManager[AsyncSession]],
+        logger: Logger,
+    ):
+        self.db_session: Callable[..., AbstractAsyncContextManager[AsyncSession]] = (
+            db_session
+        )
+        self.logger = logger
+
+    async def create(
+        self, new_upload: UpdateFileUploadToCreate
+    ) -> UpdateFileUploadInfo:
+        async with self.db_session() as session:
+            db_object = UpdateFileUploadEntity(**new_upload.model_dump())
+            session.add(db_object)
+            await session.commit()
+            await session.refresh(db_object)
+            return UpdateFileUploadInfo.model_validate(db_object)
+
+    async def get(self, id: str) -> UpdateFileUploadInfo | None:
+        try:
+            db_id = UUID(hex=id)
+        except ValueError:
+            return None
+
+        async with self.db_session() as session:
+            query = select(UpdateFileUploadEntity).filter_by(id=db_id)
+            db_object = (await session.execute(query)).scalar_one_or_none()
+            if db_object is None:
+                return None
+            return UpdateFileUploadInfo.model_validate(db_object)
+
+    async def touch(self, id: str) -> None:
+        async with self.db_session() as session:
+            query = (
+                update(UpdateFileUploadEntity)
+                .filter_by(id=UUID(hex=id))
+                .values(updated_at=func.now())
+            )
+            await session.execute(query)
+            await session.commit()
+
+    async def finalize(
+        self,
+        id: str,
+        file_id: str,
+        new_file_info: UpdateFileInfoToCreate,
+        chunks: UpdateFileChunks,
+        limits: StorageLimits,
+        jobs: Sequence[str] = (),
+    ) -> tuple[UpdateFileInfo, UpdateFileEviction] | None:
+        """Replace the upload with the file info, None if the upload is gone.
+
+        Both happen in one transaction along with the eviction of the files
+        over the limits and the queueing of the file's jobs, so an upload is
+        finalized only once.
+        """
+
+        async with self.db_session() as session:
+            query = (
+                delete(UpdateFileUploadEntity)
+                .filter_by(id=UUID(hex=id))
+                .returning(UpdateFileUploadEntity.id)
+            )
+            if (await session.execute(query)).scalar_one_or_none() is None:
+                await session.rollback()
+                return None
+            eviction = await evict_txn(session, limits, new_file_info.size or 0)
+            db_object = UpdateFileEntity(
+                id=UUID(hex=file_id),
+                chunk_hashes=chunks.model_dump(exclude={"size"}),
+                **new_file_info.model_dump(),
+            )
+            session.add(db_object)
+            await enqueue_txn(session, file_id, jobs)
+            await session.commit()
+            await session.refresh(db_object)
+            return UpdateFileInfo.model_validate(db_object), eviction
+
+    async def delete(self, id: str) -> bool:
+        try:
+            db_id = UUID(hex=id)
+        except ValueError:
+            return False
+
+        async with self.db_session() as session:
+            query = delete(UpdateFileUploadEntity).filter_by(id=db_id)
+            result = await session.execute(query)
+            await session.commit()
+            return bool(result.rowcount)
+
+    async def delete_stale(self, updated_before: datetime) -> list[str]:
+        """Delete the uploads inactive since the time, return their ids."""
+
+        async with self.db_session() as session:
+            query = (
+                delete(UpdateFileUploadEntity)
+                .where(UpdateFileUploadEntity.updated_at < updated_before)
+                .returning(UpdateFileUploadEntity.id)
+            )
+            ids = (await session.execute(query)).scalars().all()
+            await session.commit()
+            return [id.hex for id in ids]
@@ -0,0 +1,176 @@
+"""Resumable uploads of update files, in the spirit of the tus protocol."""
+
+from collections.abc import AsyncIterable
+from datetime import UTC, datetime, timedelta
+from logging import Logger
+from uuid import uuid4
+
+from app.api.errors import (
+    ApiConflictError,
+    ApiNotFoundError,
+    ApiRequestEntityTooLargeError,
+)
+from app.models.update_file import (
+    UpdateFileChunks,
+    UpdateFileInfo,
+    UpdateFileInfoToCreate,
+)
+from app.models.update_file_upload import (
+    UpdateFileUploadInfo,
+    UpdateFileUploadToCreate,
+)
+from app.models.update_job import UpdateJobKind
+from app.services.update_files.service import UpdateFileService, normalize_version
+from app.services.update_files.storage.interfaces import (
+    BLOBConflictError,
+    BLOBRepositoryInterface,
+    BLOBSizeLimitError,
+)
+from app.services.update_files.storage.upload_repository import (
+    UpdateFileUploadRepository,
+)
+from app.settings import AppSettings
+
+
+def upload_object_id(upload_id: str) -> str:
+    """Id of the temporary object the upload is received into."""
+    return f"{upload_id}.upload"
+
+
+class UpdateFileUploadService:
+    def __init__(
+        self,
+        repository: UpdateFileUploadRepository,
+        blob_repository: BLOBRepositoryInterface,
+        file_service: UpdateFileService,
+        config: AppSettings,
+        logger: Logger,
+    ) -> None:
+        self.uploads = repository
+        self.blob_repository = blob_repository
+        self.file_service = file_service
+        self.max_upload_size = config.file_max_upload_size
+        self.ttl = timedelta(seconds=config.file_upload_ttl)
+        self.logger = logger
+
+    async def create(
+        self,
+        name: str | None,
+        comment: str | None,
+        version: str | None = None,
+        length: int | None = None,
+    ) -> UpdateFileUploadInfo:
+        version = normalize_version(version)
+        if length is not None:
+            await self.file_service.check_upload_size(length)
+        return await self.uploads.create(
+            UpdateFileUploadToCreate(
+                name=name, comment=comment, version=version, length=length
+            )
+        )
+
+    async def get(self, upload_id: str) -> UpdateFileUploadInfo:
+        upload = await self.uploads.get(upload_id)
+        if upload is None:
+            raise ApiNotFoundError
+        try:
+            stat = await self.blob_repository.stat(upload_object_id(upload.id))
+        except FileNotFoundError:
+            # Nothing has been received yet
+            return upload
+        return upload.model_copy(update={"offset": stat.size})
+
+    async def append(
+        self, upload_id: str, offset: int, content: AsyncIterable[bytes]
+    ) -> int:
+        """Append a chunk at the offset, return the new offset."""
+
+        upload = await self.uploads.get(upload_id)
+        if upload is None:
+            raise ApiNotFoundError
+        max_size = upload.length or self.max_upload_size or None
+        try:
+            return await self.blob_repository.append(
+                upload_object_id(upload.id), content, offset, max_size
+            )
+        except BLOBConflictError:
+            raise ApiConflictError("Offset mismatch or a concurrent upload")
+        except BLOBSizeLimitError:
+            raise ApiRequestEntityTooLargeError
+        except FileNotFoundError:
+            raise ApiConflictError("Offset mismatch")
+        finally:
+            await self.uploads.touch(upload.id)
+
+    async def finalize(self, upload_id: str) -> UpdateFileInfo:
+        """Turn a complete upload into an update file."""
+
+        upload = await self.get(upload_id)
+        if upload.length is not None and upload.offset != upload.length:
+            raise ApiConflictError("Upload is incomplete")
+
+        object_id = uuid4().hex
+        try:
+            digest = await self.blob_repository.seal(
+                upload_object_id(upload.id), object_id
+            )
+        except BLOBConflictError:
+            raise ApiConflictError("Upload is in progress")
+        except FileNotFoundError:
+            raise ApiConflictError("Upload is empty")
+        try:
+            finalized = await self.uploads.finalize(
+                upload.id,
+                object_id,
+                UpdateFileInfoToCreate(
+                    name=upload.name,
+                    size=digest.size,
+                    comment=upload.comment,
+                    sha256=digest.sha256,
+                    version=upload.version,
+                ),
+                UpdateFileChunks(
+                    chunk_size=digest.chunk_size, sha256=digest.chunk_sha256
+                ),
+                self.file_service.storage_limits,
+                list(UpdateJobKind),
+            )
+        except Exception:
+            # The received data is kept for the client to retry the finalization
+            await self._unseal(object_id, upload.id)
+            raise
+        if finalized is None:
+            # Finalized or dropped concurrently
+            await self.blob_repository.delete(object_id)
+            raise ApiNotFoundError
+        file_info, eviction = finalized
+        self.logger.info(f"Finalized upload {upload.id} as {object_id=}")
+        await self.file_service.delete_evicted(eviction)
+        return file_info
+
+    async def delete(self, upload_id: str) -> None:
+        if not await self.uploads.delete(upload_id):
+            raise ApiNotFoundError
+        await self._delete_blob(upload_id)
+
+    async def collect_stale(self) -> int:
+        """Drop the uploads inactive for longer than the TTL, return their number."""
+
+        stale_ids = await self.uploads.delete_stale(datetime.now(UTC) - self.ttl)
+        for upload_id in stale_ids:
+            self.logger.info(f"Dropping stale upload {upload_id}")
+            await self._delete_blob(upload_id)
+        return len(stale_ids)
+
+    async def _unseal(self, object_id: str, upload_id: str) -> None:
+        try:
+            await self.blob_repository.unseal(object_id, upload_object_id(upload_id))
+        except OSError:
+            # Left to the storage reconciliation
+            self.logger.exception(f"Failed to restore upload {upload_id} data")
+
+    async def _delete_blob(self, upload_id: str) -> None:
+        try:
+            await self.blob_repository.delete(upload_object_id(upload_id))
+        except FileNotFoundError:
+            pass
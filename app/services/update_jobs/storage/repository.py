@@ -0,0 +1,152 @@
+from collections.abc import Sequence
+from contextlib import AbstractAsyncContextManager
+from datetime import timedelta
+from logging import Logger
+from typing import Callable
+from uuid import UUID
+
+from pydantic import TypeAdapter
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from app.entities.update_file_job import UpdateFileJobEntity
+from app.models.update_job import UpdateJobInfo, UpdateJobStatus
+
+
+class UpdateJobRepository:
+    def __init__(
+        self,
+        db_session: Callable[..., AbstractAsyncContextManager[AsyncSession]],
+        logger: Logger,
+    ):
+        self.db_session: Callable[..., AbstractAsyncContextManager[AsyncSession]] = (
+            db_session
+        )
+        self.logger = logger
+
+    async def claim(self, lease: timedelta, max_attempts: int) -> UpdateJobInfo | None:
+        """Lease the next due job, skipping the ones claimed concurrently.
+
+        Jobs whose lease expired are claimed again, unless they have used up
+        their attempts, e.g. crashing the worker each time. Those are failed.
+        """
+
+        now = func.now()
+        job = UpdateFileJobEntity
+        expired = and_(job.status == UpdateJobStatus.RUNNING, job.locked_until < now)
+        exhausted = (
+            update(job)
+            .where(expired, job.attempts >= max_attempts)
+            .values(
+                status=UpdateJobStatus.FAILED,
+                locked_until=None,
+                error="Lease expired on the last attempt",
+                updated_at=now,
+            )
+        )
+        due = (
+            select(job.id)
+            .where(
+                or_(
+                    and_(job.status == UpdateJobStatus.PENDING, job.run_at <= now),
+                    and_(expired, job.attempts < max_attempts),
+                )
+            )
+            .order_by(job.run_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        query = (
+            update(job)
+            .where(job.id == due)
+            .values(
+                status=UpdateJobStatus.RUNNING,
+                attempts=job.attempts + 1,
+                locked_until=now + lease,
+                updated_at=now,
+            )
+            .returning(job)
+        )
+        async with self.db_session() as session:
+            failed = await session.execute(exhausted)
+            if failed.rowcount:
+                self.logger.warning(
+                    f"Failed {failed.rowcount} jobs with expired leases"
+                )
+            db_object = (await session.execute(query)).scalar_one_or_none()
+            # Read before the commit expires it
+            claimed = None
+            if db_object is not None:
+                claimed = UpdateJobInfo.model_validate(db_object)
+            await session.commit()
+            return claimed
+
+    async def extend(self, id: str, lease: timedelta) -> None:
+        await self._update(id, locked_until=func.now() + lease)
+
+    async def complete(self, id: str) -> None:
+        await self._update(id, status=UpdateJobStatus.DONE, locked_until=None)
+
+    async def retry(self, id: str, delay: timedelta, error: str) -> None:
+        await self._update(
+            id,
+            status=UpdateJobStatus.PENDING,
+            run_at=func.now() + delay,
+            locked_until=None,
+            error=error,
+        )
+
+    async def fail(self, id: str, error: str) -> None:
+        await self._update(
+            id, status=UpdateJobStatus.FAILED, locked_until=None, error=error
+        )
+
+    async def get_for_file(self, file_id: str) -> list[UpdateJobInfo]:
+        try:
+            file_uuid = UUID(hex=file_id)
+        except ValueError:
+            return []
+
+        async with self.db_session() as session:
+            query = (
+                select(UpdateFileJobEntity)
+                .filter_by(file_id=file_uuid)
+                .order_by(UpdateFileJobEntity.created_at, UpdateFileJobEntity.kind)
+            )
+            db_objects = (await session.execute(query)).scalars().all()
+            return TypeAdapter(list[UpdateJobInfo]).validate_python(db_objects)
+
+    async def delete_for_file(self, file_id: str) -> None:
+        try:
+            file_uuid = UUID(hex=file_id)
+        except ValueError:
+            return
+
+        async with self.db_session() as session:
+            query = delete(UpdateFileJobEntity).filter_by(file_id=file_uuid)
+            await session.execute(query)
+            await session.commit()
+
+    async def _update(self, id: str, **values) -> None:
+        async with self.db_session() as session:
+            query = (
+                update(UpdateFileJobEntity)
+                .filter_by(id=UUID(hex=id))
+                .values(updated_at=func.now(), **values)
+            )
+            await session.execute(query)
+            await session.commit()
+
+
+async def enqueue_txn(
+    session: AsyncSession, file_id: str, kinds: Sequence[str]
+) -> None:
+    """Queue the jobs of a file in the transaction creating it."""
+
+    if not kinds:
+        return
+    query = insert(UpdateFileJobEntity).values(
+        [{"file_id": UUID(hex=file_id), "kind": kind} for kind in kinds]
+    )
+    await session.execute(query)
@@ -0,0 +1,98 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Mapping
+from datetime import timedelta
+from logging import Logger
+
+from app.models.update_job import UpdateJobInfo
+from app.services.update_jobs.storage.repository import UpdateJobRepository
+from app.settings import AppSettings
+
+JobHandler = Callable[[str], Awaitable[None]]
+
+
+class UpdateJobWorker:
+    """Runs the post-upload jobs queued in the database.
+
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so workers of any
+    number of processes share the queue. A claimed job is leased and the lease
+    is extended while it runs, jobs of a crashed process are claimed again once
+    their lease expires. Failed jobs are retried with an exponential backoff.
+    Either way a job is failed for good after job_max_attempts claims.
+    """
+
+    def __init__(
+        self,
+        repository: UpdateJobRepository,
+        handlers: Mapping[str, JobHandler],
+        config: AppSettings,
+        logger: Logger,
+    ):
+        self.jobs = repository
+        self.handlers = handlers
+        self.workers = config.job_workers
+        self.poll_interval = config.job_poll_interval
+        self.lease = timedelta(seconds=config.job_lease_timeout)
+        self.max_attempts = config.job_max_attempts
+        self.retry_delay = config.job_retry_delay
+        self.logger = logger
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run_next(self) -> bool:
+        """Run a due job, False if there are none."""
+
+        job = await self.jobs.claim(self.lease, self.max_attempts)
+        if job is None:
+            return False
+        await self._run_job(job)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self.run_next():
+                    continue
+            except Exception:
+                self.logger.exception("Failed to claim a job")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run_job(self, job: UpdateJobInfo) -> None:
+        self.logger.info(f"Running {job.kind} job {job.id} of {job.file_id=}")
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise ValueError(f"Unknown job kind {job.kind}")
+            await handler(job.file_id)
+        except asyncio.CancelledError:
+            # Shutting down, the job is picked up again after a restart
+            await self.jobs.retry(job.id, timedelta(0), "Interrupted")
+            raise
+        except Exception as e:
+            self.logger.exception(f"{job.kind} job {job.id} failed")
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts >= self.max_attempts:
+                await self.jobs.fail(job.id, error)
+            else:
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                await self.jobs.retry(job.id, timedelta(seconds=delay), error)
+        else:
+            await self.jobs.complete(job.id)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                await self.jobs.extend(id, self.lease)
+            except Exception:
+                self.logger.exception(f"Failed to extend the lease of job {id}")
@@ -0,0 +1,58 @@
+"""Staged rollouts of the update manifests."""
+
+import hashlib
+from dataclasses import dataclass
+
+from app.models.update_manifest import UpdateManifest
+
+# Clients are spread over the buckets, a hundredth of a percent each
+BUCKETS = 10_000
+# The id of the clients sending none, held back until a rollout reaches all
+ANONYMOUS_CLIENT_ID = ""
+
+
+@dataclass(frozen=True)
+class Rollout:
+    """Admits a stable share of the clients, growing over the ramp if any."""
+
+    percentage: float
+    # Epoch seconds
+    started_at: float
+    ramp_seconds: int
+    # Varies the share admitted first from a release to another
+    salt: str
+
+    @classmethod
+    def of(cls, manifest: UpdateManifest) -> "Rollout | None":
+        """The rollout of the manifest, None if it is served to everyone."""
+
+        if manifest.rollout_percentage >= 100 and not manifest.rollout_ramp_seconds:
+            return None
+        key = manifest.key
+        return cls(
+            percentage=manifest.rollout_percentage,
+            started_at=(
+                manifest.published_at.timestamp() if manifest.published_at else 0
+            ),
+            ramp_seconds=manifest.rollout_ramp_seconds,
+            salt=f"{key.product}/{key.channel}/{key.platform}/{manifest.version}",
+        )
+
+    def percentage_at(self, now: float) -> float:
+        if self.ramp_seconds <= 0:
+            return self.percentage
+        progress = (now - self.started_at) / self.ramp_seconds
+        return self.percentage * min(max(progress, 0), 1)
+
+    def admits(self, client_id: str, now: float) -> bool:
+        percentage = self.percentage_at(now)
+        if client_id == ANONYMOUS_CLIENT_ID:
+            return percentage >= 100
+        return client_bucket(client_id, self.salt) < percentage * BUCKETS / 100
+
+
+def client_bucket(client_id: str, salt: str) -> int:
+    """A uniformly distributed bucket, the same for the client each time."""
+
+    digest = hashlib.sha256(f"{salt}:{client_id}".encode()).digest()
+    return int.from_bytes(digest[:8]) % BUCKETS
@@ -1,53 +1,407 @@
+import asyncio
+import hashlib
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass, field, replace
+from datetime import UTC, datetime
 from logging import Logger
+from time import monotonic, time
 
 from packaging.version import InvalidVersion, Version
 
-from app.api.errors import ApiForbiddenError, ApiNotFoundError, WrongDataError
-from app.models.update_manifest import UpdateManifest
+from app.api.errors import (
+    ApiConflictError,
+    ApiForbiddenError,
+    ApiNotFoundError,
+    WrongDataError,
+)
+from app.models.update_manifest import (
+    ClientUpdateManifest,
+    UpdateManifest,
+    UpdateManifestKey,
+    UpdateManifestRelease,
+    UpdateManifestRule,
+    UpdateManifestRuleToCreate,
+)
+from app.services.update_manifest.rollout import Rollout
 from app.services.update_manifest.storage.interface import (
     UpdateManifestRepositoryInterface,
 )
+from app.services.update_patches.service import UpdatePatchService
+from app.settings import AppSettings
+
+# Answers kept per cached manifest, by the requester version
+ANSWERS_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class UpdateManifestAnswer:
+    """The manifest for a requester, serialized with its strong entity tag."""
+
+    body: bytes
+    etag: str
+
+    @classmethod
+    def serialize(cls, manifest: ClientUpdateManifest) -> "UpdateManifestAnswer":
+        body = manifest.model_dump_json(exclude_none=True).encode()
+        return cls(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+@dataclass(frozen=True)
+class CachedManifest:
+    manifest: UpdateManifestRelease
+    version: Version
+    # None when served to everyone
+    rollout: Rollout | None = None
+    # Expire with the manifest, the patches available may change by then.
+    # None when there is no update for the requester version.
+    answers: OrderedDict[Version, UpdateManifestAnswer | None] = field(
+        default_factory=OrderedDict
+    )
+
+    @classmethod
+    def latest(cls, manifest: UpdateManifest) -> "CachedManifest":
+        return cls(manifest, Version(manifest.version), Rollout.of(manifest))
+
+    def admits(self, client_id: str | None) -> bool:
+        """Whether the manifest is served to the client, by its rollout.
+
+        Only the clients are rolled out to, service requests have no client id.
+        """
+
+        if self.rollout is None or client_id is None:
+            return True
+        return self.rollout.admits(client_id, time())
+
+
+@dataclass(frozen=True)
+class ManifestTargets:
+    """The manifests of a key, resolved by the requester version."""
+
+    latest: CachedManifest | None = None
+    # The requester versions from bounds[i - 1] up to bounds[i] are served
+    # targets[i], None stands for the latest manifest
+    bounds: list[Version] = field(default_factory=list)
+    targets: list[CachedManifest | None] = field(default_factory=lambda: [None])
+
+    @classmethod
+    def compile(
+        cls, latest: CachedManifest | None, rules: list[UpdateManifestRule]
+    ) -> "ManifestTargets":
+        """Flatten the rules, which do not overlap, into sorted boundaries."""
+
+        ranges = sorted(
+            ((_parse_range(rule), rule) for rule in rules),
+            # Unbounded below first, it can only be one
+            key=lambda item: (item[0][0] is not None, item[0][0] or Version("0")),
+        )
+        bounds: list[Version] = []
+        targets: list[CachedManifest | None] = [None]
+        for (min_version, max_version), rule in ranges:
+            target = CachedManifest(rule, Version(rule.version))
+            if min_version is None:
+                targets[0] = target
+            else:
+                bounds.append(min_version)
+                targets.append(target)
+            if max_version is not None:
+                bounds.append(max_version)
+                targets.append(None)
+        return cls(latest, bounds, targets)
+
+    def resolve(self, requester_version: Version) -> CachedManifest | None:
+        """The manifest to serve, found by a binary search of the boundaries.
+
+        A rule target the requester has already reached gives way to the
+        latest manifest, so the requesters move on past it.
+        """
+
+        target = self.targets[bisect_right(self.bounds, requester_version)]
+        if target is None or target.version <= requester_version:
+            return self.latest
+        return target
+
+
+@dataclass(frozen=True)
+class ManifestIndex:
+    # The keys without a manifest or rules are absent
+    manifests: dict[UpdateManifestKey, ManifestTargets]
+    loaded_at: float
 
 
 class UpdateManifestService:
+    """Serves the manifests from memory, refreshed after the cache TTL.
+
+    All the manifests and rules are loaded at once into an index by their
+    product, channel and platform, the rules of each are compiled for a
+    binary search by the requester version. The index is updated
+    synchronously by the changes, the TTL only bounds how long the changes
+    made by other processes remain unseen.
+    """
+
     def __init__(
         self,
         repository: UpdateManifestRepositoryInterface,
+        patch_service: UpdatePatchService,
+        config: AppSettings,
         logger: Logger,
     ) -> None:
         self.repository = repository
+        self.patch_service = patch_service
+        self.cache_ttl = config.manifest_cache_ttl
         self.logger = logger
+        self._index: ManifestIndex | None = None
+        # Incremented on each change, a load started before it is not cached
+        self._generation = 0
+        self._load_lock = asyncio.Lock()
 
     async def set(self, manifest: UpdateManifest) -> None:
+        """Publish a newer version, or change the rollout of the current one.
+
+        The rollout ramp starts when a version is published.
+
+        Raises: WrongDataError, ApiForbiddenError, ApiConflictError
+        """
+
         try:
             new_version = Version(manifest.version)
         except InvalidVersion:
             raise WrongDataError(loc="version", message="Invalid version")
 
-        current_manifest = await self.repository.get()
+        # Checked against the stored manifest, the cached one may be stale
+        current_manifest = await self.repository.get(manifest.key)
 
-        if not current_manifest or Version(current_manifest.version) < new_version:
-            await self.repository.set(manifest)
-        else:
+        if current_manifest and Version(current_manifest.version) > new_version:
             raise ApiForbiddenError(
                 "Automatic version downgrade is not supported, remove current manifest explicitly"
             )
+        if current_manifest and Version(current_manifest.version) == new_version:
+            # The clients rolled out to keep what they were served
+            if manifest.url != current_manifest.url:
+                raise ApiConflictError(
+                    "The version is published with another URL, publish a newer version"
+                )
+            published_at = current_manifest.published_at
+        else:
+            published_at = datetime.now(UTC)
+        manifest = manifest.model_copy(update={"published_at": published_at})
+
+        try:
+            await self.repository.set(manifest)
+        except Exception:
+            self._invalidate()
+            raise
+        latest = CachedManifest.latest(manifest)
+        self._update(manifest.key, lambda targets: replace(targets, latest=latest))
+
+    async def get(
+        self,
+        requester_version: str,
+        key: UpdateManifestKey = UpdateManifestKey(),
+        client_id: str | None = None,
+    ) -> ClientUpdateManifest:
+        requester_version_obj = _parse_requester_version(requester_version)
+        return await self._get(
+            await self._get_cached(key, requester_version_obj, client_id),
+            requester_version_obj,
+        )
+
+    async def get_answer(
+        self,
+        requester_version: str,
+        key: UpdateManifestKey = UpdateManifestKey(),
+        client_id: str | None = None,
+    ) -> UpdateManifestAnswer:
+        """Get the serialized manifest, memoized by the requester version.
 
-    async def get(self, requester_version: str) -> UpdateManifest:
+        The clients outside of the manifest rollout get no update.
+
+        Raises: WrongDataError, ApiNotFoundError
+        """
+
+        requester_version_obj = _parse_requester_version(requester_version)
+        cached = await self._get_cached(key, requester_version_obj, client_id)
+        if cached is None:
+            raise ApiNotFoundError
+
+        if requester_version_obj in cached.answers:
+            answer = cached.answers[requester_version_obj]
+            cached.answers.move_to_end(requester_version_obj)
+        else:
+            try:
+                manifest = await self._get(cached, requester_version_obj)
+            except ApiNotFoundError:
+                answer = None
+            else:
+                answer = UpdateManifestAnswer.serialize(manifest)
+            cached.answers[requester_version_obj] = answer
+            if len(cached.answers) > ANSWERS_CACHE_SIZE:
+                cached.answers.popitem(last=False)
+
+        if answer is None:
+            raise ApiNotFoundError
+        return answer
+
+    async def delete(self, key: UpdateManifestKey = UpdateManifestKey()) -> None:
         try:
-            requester_version_obj = Version(requester_version)
+            await self.repository.delete(key)
+        except Exception:
+            self._invalidate()
+            raise
+        self._update(key, lambda targets: replace(targets, latest=None))
+
+    async def get_rules(self) -> list[UpdateManifestRule]:
+        return await self.repository.get_rules()
+
+    async def add_rule(self, rule: UpdateManifestRuleToCreate) -> UpdateManifestRule:
+        """Add a rule, its version range may not overlap the others of the key.
+
+        Raises: WrongDataError, ApiConflictError
+        """
+
+        try:
+            Version(rule.version)
         except InvalidVersion:
-            raise WrongDataError(loc="current_version", message="Invalid version")
+            raise WrongDataError(loc="version", message="Invalid version")
+        try:
+            min_version, max_version = _parse_range(rule)
+        except InvalidVersion:
+            raise WrongDataError(loc="version_range", message="Invalid version")
+        if (
+            min_version is not None
+            and max_version is not None
+            and min_version >= max_version
+        ):
+            raise WrongDataError(loc="version_range", message="Empty version range")
+
+        rules = await self.repository.get_rules(rule.key)
+        for other in rules:
+            if _ranges_overlap((min_version, max_version), _parse_range(other)):
+                raise ApiConflictError(f"The version range overlaps rule {other.id}")
+
+        try:
+            new_rule = await self.repository.add_rule(rule)
+        except Exception:
+            self._invalidate()
+            raise
+        self._update_rules(rule.key, [*rules, new_rule])
+        return new_rule
 
-        current_manifest = await self.repository.get()
-        if not current_manifest:
+    async def delete_rule(self, id: str) -> None:
+        try:
+            rule = await self.repository.delete_rule(id)
+        except Exception:
+            self._invalidate()
+            raise
+        if rule is None:
+            raise ApiNotFoundError
+        self._update_rules(rule.key, await self.repository.get_rules(rule.key))
+
+    async def _get(
+        self, cached: CachedManifest | None, requester_version_obj: Version
+    ) -> ClientUpdateManifest:
+        if cached is None:
             raise ApiNotFoundError
 
-        manifest_version = Version(current_manifest.version)
-        if requester_version_obj and manifest_version <= requester_version_obj:
+        if requester_version_obj and cached.version <= requester_version_obj:
             raise ApiNotFoundError
 
-        return current_manifest
+        manifest = ClientUpdateManifest.model_validate(cached.manifest.model_dump())
+        patch = await self.patch_service.find_patch(
+            str(requester_version_obj), cached.manifest.url
+        )
+        if patch is not None:
+            manifest.patch_url = self.patch_service.get_patch_url(patch)
+            manifest.patch_size = patch.size
+        return manifest
+
+    async def _get_cached(
+        self,
+        key: UpdateManifestKey,
+        requester_version_obj: Version,
+        client_id: str | None,
+    ) -> CachedManifest | None:
+        index = self._index
+        if index is None or monotonic() - index.loaded_at >= self.cache_ttl:
+            index = await self._load()
+        targets = index.manifests.get(key)
+        if targets is None:
+            return None
+        cached = targets.resolve(requester_version_obj)
+        if cached is None or not cached.admits(client_id):
+            return None
+        return cached
+
+    async def _load(self) -> ManifestIndex:
+        # Concurrent requests wait for one load instead of each querying
+        async with self._load_lock:
+            index = self._index
+            if index is not None and monotonic() - index.loaded_at < self.cache_ttl:
+                return index
+            generation = self._generation
+            latest = {
+                manifest.key: CachedManifest.latest(manifest)
+                for manifest in await self.repository.get_all()
+            }
+            rules: defaultdict[UpdateManifestKey, list[UpdateManifestRule]]
+            rules = defaultdict(list)
+            for rule in await self.repository.get_rules():
+                rules[rule.key].append(rule)
+            manifests = {
+                key: ManifestTargets.compile(latest.get(key), rules[key])
+                for key in latest.keys() | rules.keys()
+            }
+            index = ManifestIndex(manifests, monotonic())
+            # Not cached if changed meanwhile, the read may have missed it
+            if generation == self._generation:
+                self._index = index
+            return index
+
+    def _update(
+        self,
+        key: UpdateManifestKey,
+        change: Callable[[ManifestTargets], ManifestTargets],
+    ) -> None:
+        self._generation += 1
+        if self._index is None:
+            return
+        targets = self._index.manifests.get(key, ManifestTargets())
+        self._index.manifests[key] = change(targets)
+
+    def _update_rules(
+        self, key: UpdateManifestKey, rules: list[UpdateManifestRule]
+    ) -> None:
+        # Compiled once per change, not per request
+        self._update(
+            key, lambda targets: ManifestTargets.compile(targets.latest, rules)
+        )
+
+    def _invalidate(self) -> None:
+        self._generation += 1
+        self._index = None
+
+
+def _parse_requester_version(requester_version: str) -> Version:
+    try:
+        return Version(requester_version)
+    except InvalidVersion:
+        raise WrongDataError(loc="current_version", message="Invalid version")
+
+
+VersionRange = tuple[Version | None, Version | None]
+
+
+def _parse_range(rule: UpdateManifestRuleToCreate) -> VersionRange:
+    return (
+        Version(rule.min_version) if rule.min_version is not None else None,
+        Version(rule.max_version) if rule.max_version is not None else None,
+    )
+
 
-    async def delete(self) -> None:
-        await self.repository.delete()
+def _ranges_overlap(first: VersionRange, second: VersionRange) -> bool:
+    first_min, first_max = first
+    second_min, second_max = second
+    return (first_min is None or second_max is None or first_min < second_max) and (
+        second_min is None or first_max is None or second_min < first_max
+    )
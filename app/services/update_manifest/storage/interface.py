@@ -1,6 +1,11 @@
 from abc import ABC, abstractmethod
 
-from app.models.update_manifest import UpdateManifest
+from app.models.update_manifest import (
+    UpdateManifest,
+    UpdateManifestKey,
+    UpdateManifestRule,
+    UpdateManifestRuleToCreate,
+)
 
 
 class UpdateManifestRepositoryInterface(ABC):
@@ -8,7 +13,23 @@ class UpdateManifestRepositoryInterface(ABC):
     async def set(self, manifest: UpdateManifest) -> None: ...
 
     @abstractmethod
-    async def get(self) -> UpdateManifest | None: ...
+    async def get(self, key: UpdateManifestKey) -> UpdateManifest | None: ...
 
     @abstractmethod
-    async def delete(self) -> None: ...
+    async def get_all(self) -> list[UpdateManifest]: ...
+
+    @abstractmethod
+    async def delete(self, key: UpdateManifestKey) -> None: ...
+
+    @abstractmethod
+    async def add_rule(
+        self, rule: UpdateManifestRuleToCreate
+    ) -> UpdateManifestRule: ...
+
+    @abstractmethod
+    async def get_rules(
+        self, key: UpdateManifestKey | None = None
+    ) -> list[UpdateManifestRule]: ...
+
+    @abstractmethod
+    async def delete_rule(self, id: str) -> UpdateManifestRule | None: ...
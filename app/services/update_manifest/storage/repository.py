@@ -1,12 +1,21 @@
 from contextlib import AbstractAsyncContextManager
 from logging import Logger
 from typing import Callable
+from uuid import UUID
 
-from sqlalchemy import select, text
+from pydantic import TypeAdapter
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
 from app.entities.update_manifest import UpdateManifestEntity
-from app.models.update_manifest import UpdateManifest
+from app.entities.update_manifest_rule import UpdateManifestRuleEntity
+from app.models.update_manifest import (
+    UpdateManifest,
+    UpdateManifestKey,
+    UpdateManifestRule,
+    UpdateManifestRuleToCreate,
+)
 from app.services.update_manifest.storage.interface import (
     UpdateManifestRepositoryInterface,
 )
@@ -24,29 +33,81 @@ class UpdateManifestRepositoryDB(UpdateManifestRepositoryInterface):
         self.logger = logger
 
     async def set(self, new_manifest: UpdateManifest) -> None:
+        """Replace the manifest of the same product, channel and platform."""
+
+        values = new_manifest.model_dump(exclude_none=True)
+        key = list(UpdateManifestKey.model_fields)
+        query = insert(UpdateManifestEntity).values(**values)
+        query = query.on_conflict_do_update(
+            index_elements=key,
+            set_={
+                column: query.excluded[column] for column in values if column not in key
+            },
+        )
         async with self.db_session() as session:
-            await self._remove_all_txn(session)
-            db_object = UpdateManifestEntity(
-                version=new_manifest.version,
-                url=new_manifest.url,
-            )
-            session.add(db_object)
+            await session.execute(query)
             await session.commit()
 
-    async def get(self) -> UpdateManifest | None:
+    async def get(self, key: UpdateManifestKey) -> UpdateManifest | None:
         async with self.db_session() as session:
-            query = select(UpdateManifestEntity)
+            query = select(UpdateManifestEntity).filter_by(**key.model_dump())
             db_object = (await session.execute(query)).scalar_one_or_none()
             if db_object is None:
                 return None
             return UpdateManifest.model_validate(db_object, from_attributes=True)
 
-    async def delete(self) -> None:
+    async def get_all(self) -> list[UpdateManifest]:
         async with self.db_session() as session:
-            await self._remove_all_txn(session)
+            db_objects = (await session.execute(select(UpdateManifestEntity))).scalars()
+            return TypeAdapter(list[UpdateManifest]).validate_python(
+                db_objects.all(), from_attributes=True
+            )
+
+    async def delete(self, key: UpdateManifestKey) -> None:
+        async with self.db_session() as session:
+            await session.execute(
+                delete(UpdateManifestEntity).filter_by(**key.model_dump())
+            )
             await session.commit()
 
-    async def _remove_all_txn(self, session: AsyncSession) -> None:
-        await session.execute(
-            text(f"TRUNCATE TABLE {UpdateManifestEntity.__tablename__}")
+    async def add_rule(self, rule: UpdateManifestRuleToCreate) -> UpdateManifestRule:
+        async with self.db_session() as session:
+            db_object = UpdateManifestRuleEntity(**rule.model_dump())
+            session.add(db_object)
+            await session.commit()
+            await session.refresh(db_object)
+            return UpdateManifestRule.model_validate(db_object)
+
+    async def get_rules(
+        self, key: UpdateManifestKey | None = None
+    ) -> list[UpdateManifestRule]:
+        """Get the rules, of the key if given, in the order of creation."""
+
+        query = select(UpdateManifestRuleEntity).order_by(
+            UpdateManifestRuleEntity.created_at
+        )
+        if key is not None:
+            query = query.filter_by(**key.model_dump())
+        async with self.db_session() as session:
+            db_objects = (await session.execute(query)).scalars().all()
+            return TypeAdapter(list[UpdateManifestRule]).validate_python(db_objects)
+
+    async def delete_rule(self, id: str) -> UpdateManifestRule | None:
+        try:
+            db_id = UUID(hex=id)
+        except ValueError:
+            return None
+
+        query = (
+            delete(UpdateManifestRuleEntity)
+            .filter_by(id=db_id)
+            .returning(UpdateManifestRuleEntity)
         )
+        async with self.db_session() as session:
+            db_object = (await session.execute(query)).scalar_one_or_none()
+            # Read before the commit expires it
+            deleted = None
+            if db_object is not None:
+                deleted = UpdateManifestRule.model_validate(db_object)
+            await session.commit()
+            return deleted
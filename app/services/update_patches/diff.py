@@ -0,0 +1,17 @@
+"""Binary delta patches between update files."""
+
+from pathlib import Path
+
+import bsdiff4  # type: ignore[import-untyped]
+
+PATCH_FORMAT = "bsdiff4"
+
+
+def patch_object_id(source_id: str, target_id: str) -> str:
+    return f"{target_id}.from-{source_id}.{PATCH_FORMAT}"
+
+
+def make_patch(source_path: Path, target_path: Path, patch_path: Path) -> None:
+    """Blocking and CPU-bound, meant for a worker process."""
+
+    bsdiff4.file_diff(str(source_path), str(target_path), str(patch_path))
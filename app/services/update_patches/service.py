@@ -0,0 +1,160 @@
+import asyncio
+import re
+from collections.abc import Iterable
+from concurrent.futures import Executor
+from logging import Logger
+from uuid import UUID
+
+from packaging.version import InvalidVersion, Version
+
+from app.api.errors import ApiNotFoundError
+from app.models.update_patch import UpdatePatchInfo
+from app.services.update_files.conditional import format_http_date, if_range_matches
+from app.services.update_files.downloads import UpdateFileDownload, get_download
+from app.services.update_files.scheduler import DownloadScheduler
+from app.services.update_files.storage.file_info_repository import FileInfoRepository
+from app.services.update_files.storage.interfaces import BLOBRepositoryInterface
+from app.services.update_patches.diff import make_patch, patch_object_id
+from app.services.update_patches.storage.repository import UpdatePatchRepository
+from app.settings import AppSettings
+
+# File ids in URLs, as the manifests refer to the stored files
+FILE_ID_PATTERN = re.compile(
+    r"[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}", re.IGNORECASE
+)
+
+
+class UpdatePatchService:
+    def __init__(
+        self,
+        repository: UpdatePatchRepository,
+        blob_repository: BLOBRepositoryInterface,
+        file_info_repository: FileInfoRepository,
+        executor: Executor,
+        scheduler: DownloadScheduler,
+        config: AppSettings,
+        logger: Logger,
+    ) -> None:
+        self.patches = repository
+        self.blob_repository = blob_repository
+        self.file_infos = file_info_repository
+        self.executor = executor
+        self.scheduler = scheduler
+        self.public_base_url = config.public_base_url.rstrip("/")
+        self.zero_copy = config.file_zero_copy
+        self.logger = logger
+
+    async def build_patches(self, target_id: str) -> None:
+        """Build patches to a new file from the retained older versions.
+
+        Meant for the background, the diffs are computed in worker processes.
+        """
+
+        target = await self.file_infos.get(target_id)
+        if target is None or target.version is None or target.size is None:
+            return
+
+        target_version = Version(target.version)
+        for source in await self.file_infos.get_all():
+            if source.version is None or Version(source.version) >= target_version:
+                continue
+
+            patch_id = patch_object_id(source.id, target.id)
+            try:
+                patch = await self.blob_repository.create_derived(
+                    patch_id, [source.id, target.id], make_patch, self.executor
+                )
+            except FileNotFoundError:
+                # The file has been deleted meanwhile
+                continue
+            if patch.size >= target.size:
+                self.logger.info(f"Dropping patch {patch_id=}, no gain")
+                await self.blob_repository.delete(patch_id)
+                continue
+            if not await self.patches.create(source.id, target.id, patch.size):
+                await self.blob_repository.delete(patch_id)
+                continue
+            self.logger.info(f"Stored patch {patch_id=}: {target.size} -> {patch.size}")
+
+    async def find_patch(
+        self, from_version: str, to_url: str
+    ) -> UpdatePatchInfo | None:
+        """Find a patch to the stored file the URL refers to, if any.
+
+        The source is the newest retained file of the version with a patch to
+        the target, matched in its normalized form, as stored at upload.
+        """
+
+        target_id = file_id_in_url(to_url)
+        if target_id is None:
+            return None
+        try:
+            source_version = Version(from_version)
+        except InvalidVersion:
+            return None
+        return await self.patches.find(str(source_version), target_id)
+
+    def get_patch_url(self, patch: UpdatePatchInfo) -> str:
+        return (
+            f"{self.public_base_url}/update-patches/{patch.source_id}/{patch.target_id}"
+        )
+
+    async def get_patch(
+        self,
+        source_id: str,
+        target_id: str,
+        range_header: str | None = None,
+        if_range: str | None = None,
+    ) -> UpdateFileDownload:
+        patch = await self.patches.get(source_id, target_id)
+        if patch is None:
+            raise ApiNotFoundError
+
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Last-Modified": format_http_date(patch.created_at),
+        }
+        if not if_range_matches(if_range, None, patch.created_at):
+            range_header = None
+        try:
+            download = await get_download(
+                self.blob_repository,
+                patch_object_id(source_id, target_id),
+                headers,
+                range_header,
+                self.zero_copy,
+            )
+        except FileNotFoundError:
+            raise ApiNotFoundError
+        return await self.scheduler.schedule(download)
+
+    async def delete_for_file(self, file_id: str) -> None:
+        """Delete the patches from and to the file."""
+
+        patches = await self.patches.delete_for_file(file_id)
+        await self.delete_blobs((patch.source_id, patch.target_id) for patch in patches)
+
+    async def delete_blobs(self, patches: Iterable[tuple[str, str]]) -> None:
+        """Delete the blobs of the patches by their source and target ids at once."""
+
+        await asyncio.gather(
+            *(
+                self._delete_blob(patch_object_id(source_id, target_id))
+                for source_id, target_id in patches
+            )
+        )
+
+    async def _delete_blob(self, object_id: str) -> None:
+        try:
+            await self.blob_repository.delete(object_id)
+        except FileNotFoundError:
+            pass
+
+
+def file_id_in_url(url: str) -> str | None:
+    """The id of the stored file the URL refers to, by its last one."""
+
+    ids = FILE_ID_PATTERN.findall(url)
+    if not ids:
+        return None
+    return UUID(ids[-1]).hex
@@ -0,0 +1,118 @@
+from contextlib import AbstractAsyncContextManager
+from logging import Logger
+from typing import Callable
+from uuid import UUID
+
+from pydantic import TypeAdapter
+from sqlalchemy import BigInteger, Uuid, delete, desc, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from app.entities.update_file import UpdateFileEntity
+from app.entities.update_file_patch import UpdateFilePatchEntity
+from app.models.update_patch import UpdatePatchInfo
+
+
+class UpdatePatchRepository:
+    def __init__(
+        self,
+        db_session: Callable[..., AbstractAsyncContextManager[AsyncSession]],
+        logger: Logger,
+    ):
+        self.db_session: Callable[..., AbstractAsyncContextManager[AsyncSession]] = (
+            db_session
+        )
+        self.logger = logger
+
+    async def create(self, source_id: str, target_id: str, size: int) -> bool:
+        """Record a patch, False if any of its files is gone."""
+
+        source_uuid, target_uuid = UUID(hex=source_id), UUID(hex=target_id)
+        files_count = (
+            select(func.count())
+            .select_from(UpdateFileEntity)
+            .where(UpdateFileEntity.id.in_([source_uuid, target_uuid]))
+            .scalar_subquery()
+        )
+        values = select(
+            literal(source_uuid, Uuid),
+            literal(target_uuid, Uuid),
+            literal(size, BigInteger),
+        ).where(files_count == 2)
+        query = (
+            insert(UpdateFilePatchEntity)
+            .from_select(["source_id", "target_id", "size"], values)
+            .on_conflict_do_update(
+                index_elements=["source_id", "target_id"],
+                set_={"size": size, "created_at": func.now()},
+            )
+        )
+        async with self.db_session() as session:
+            result = await session.execute(query)
+            await session.commit()
+            return bool(result.rowcount)
+
+    async def get(self, source_id: str, target_id: str) -> UpdatePatchInfo | None:
+        try:
+            source_uuid, target_uuid = UUID(hex=source_id), UUID(hex=target_id)
+        except ValueError:
+            return None
+
+        async with self.db_session() as session:
+            query = select(UpdateFilePatchEntity).filter_by(
+                source_id=source_uuid, target_id=target_uuid
+            )
+            db_object = (await session.execute(query)).scalar_one_or_none()
+            if db_object is None:
+                return None
+            return UpdatePatchInfo.model_validate(db_object)
+
+    async def find(self, source_version: str, target_id: str) -> UpdatePatchInfo | None:
+        """Get the patch to the target from the newest file of the version with one."""
+
+        try:
+            target_uuid = UUID(hex=target_id)
+        except ValueError:
+            return None
+
+        patch = UpdateFilePatchEntity
+        file = UpdateFileEntity
+        # Files of the version may be of other products or platforms, with no
+        # patch worth keeping to the target
+        query = (
+            select(patch)
+            .join(file, file.id == patch.source_id)
+            .where(file.version == source_version, patch.target_id == target_uuid)
+            .order_by(desc(file.created_at), desc(file.id))
+            .limit(1)
+        )
+        async with self.db_session() as session:
+            db_object = (await session.execute(query)).scalar_one_or_none()
+            if db_object is None:
+                return None
+            return UpdatePatchInfo.model_validate(db_object)
+
+    async def delete_for_file(self, file_id: str) -> list[UpdatePatchInfo]:
+        """Delete the patches from and to the file, return the deleted ones."""
+
+        try:
+            file_uuid = UUID(hex=file_id)
+        except ValueError:
+            return []
+
+        async with self.db_session() as session:
+            query = (
+                delete(UpdateFilePatchEntity)
+                .where(
+                    or_(
+                        UpdateFilePatchEntity.source_id == file_uuid,
+                        UpdateFilePatchEntity.target_id == file_uuid,
+                    )
+                )
+                .returning(UpdateFilePatchEntity)
+            )
+            db_objects = (await session.execute(query)).scalars().all()
+            # Read before the commit expires them
+            deleted = TypeAdapter(list[UpdatePatchInfo]).validate_python(db_objects)
+            await session.commit()
+            return deleted
@@ -20,6 +20,34 @@ class AppSettings(BaseSettings):
     crm_url_base: str = ""
     file_storage_path: str = "/persistent/file_storage"
     file_storage_capacity: int = 10
+    file_storage_capacity_bytes: int = 0
+    file_chunk_size: int = 64 * 1024
+    file_hash_chunk_size: int = 4 * 1024 * 1024
+    file_max_upload_size: int = 0
+    file_upload_ttl: int = 24 * 60 * 60
+    file_reconcile_interval: int = 6 * 60 * 60
+    file_reconcile_grace_period: int = 24 * 60 * 60
+    file_reconcile_rate: int = 500
+    file_zero_copy: bool = True
+    file_storage_fsync: bool = True
+    file_delete_timeout: int = 60 * 60
+    file_mmap: bool = False
+    file_cache_max_bytes: int = 0
+    file_compression_encodings: list[str] = []
+    file_compression_min_saving: float = 0.1
+    file_patch_workers: int = 1
+    download_max_concurrent: int = 0
+    download_max_queued: int = 0
+    download_queue_timeout: float = 30
+    download_rate_limit: int = 0
+    download_global_rate_limit: int = 0
+    public_base_url: str = ""
+    manifest_cache_ttl: float = 30
+    job_workers: int = 1
+    job_poll_interval: float = 1
+    job_lease_timeout: float = 300
+    job_max_attempts: int = 5
+    job_retry_delay: float = 10
 
     model_config = SettingsConfigDict(
         env_prefix="app_",
@@ -0,0 +1,24 @@
+"""Add file info sha256
+
+Revision ID: 3b8d4f1e6a2c
+Revises: 08ea19acb0a3
+Create Date: 2026-10-18 09:10:31.402117
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b8d4f1e6a2c"
+down_revision = "08ea19acb0a3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("update_files", sa.Column("sha256", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("update_files", "sha256")
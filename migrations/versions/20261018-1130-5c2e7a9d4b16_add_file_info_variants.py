@@ -0,0 +1,33 @@
+"""Add file info variants
+
+Revision ID: 5c2e7a9d4b16
+Revises: 3b8d4f1e6a2c
+Create Date: 2026-10-18 11:30:12.584310
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "5c2e7a9d4b16"
+down_revision = "3b8d4f1e6a2c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "update_files",
+        sa.Column(
+            "variants",
+            postgresql.JSONB(astext_type=sa.Text()),
+            server_default=sa.text("'{}'::jsonb"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("update_files", "variants")
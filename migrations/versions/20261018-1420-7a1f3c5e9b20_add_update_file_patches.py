@@ -0,0 +1,38 @@
+"""Add update file patches
+
+Revision ID: 7a1f3c5e9b20
+Revises: 5c2e7a9d4b16
+Create Date: 2026-10-18 14:20:47.118023
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7a1f3c5e9b20"
+down_revision = "5c2e7a9d4b16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("update_files", sa.Column("version", sa.String(), nullable=True))
+    op.create_table(
+        "update_file_patches",
+        sa.Column("source_id", sa.Uuid(), nullable=False),
+        sa.Column("target_id", sa.Uuid(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("source_id", "target_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("update_file_patches")
+    op.drop_column("update_files", "version")
@@ -0,0 +1,32 @@
+"""Add file info chunk hashes
+
+Revision ID: 9d3b6e2f8a41
+Revises: 7a1f3c5e9b20
+Create Date: 2026-10-18 16:10:36.402917
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "9d3b6e2f8a41"
+down_revision = "7a1f3c5e9b20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "update_files",
+        sa.Column(
+            "chunk_hashes",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("update_files", "chunk_hashes")
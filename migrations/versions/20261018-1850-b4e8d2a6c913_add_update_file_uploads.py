@@ -0,0 +1,67 @@
+"""Add update file uploads
+
+Revision ID: b4e8d2a6c913
+Revises: 9d3b6e2f8a41
+Create Date: 2026-10-18 18:50:03.771254
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b4e8d2a6c913"
+down_revision = "9d3b6e2f8a41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "update_file_uploads",
+        sa.Column(
+            "id", sa.Uuid(), server_default=sa.text("gen_random_uuid()"), nullable=False
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("comment", sa.String(), nullable=True),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("version", sa.String(), nullable=True),
+        sa.Column("length", sa.BigInteger(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # Multi-gigabyte files do not fit into 32 bits
+    op.alter_column(
+        "update_files", "size", type_=sa.BigInteger(), existing_type=sa.Integer()
+    )
+    op.alter_column(
+        "update_file_patches",
+        "size",
+        type_=sa.BigInteger(),
+        existing_type=sa.Integer(),
+        existing_nullable=False,
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "update_file_patches",
+        "size",
+        type_=sa.Integer(),
+        existing_type=sa.BigInteger(),
+        existing_nullable=False,
+    )
+    op.alter_column(
+        "update_files", "size", type_=sa.Integer(), existing_type=sa.BigInteger()
+    )
+    op.drop_table("update_file_uploads")
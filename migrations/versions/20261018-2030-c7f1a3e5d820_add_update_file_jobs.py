@@ -0,0 +1,65 @@
+"""Add update file jobs
+
+Revision ID: c7f1a3e5d820
+Revises: b4e8d2a6c913
+Create Date: 2026-10-18 20:30:41.905162
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c7f1a3e5d820"
+down_revision = "b4e8d2a6c913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "update_file_jobs",
+        sa.Column(
+            "id", sa.Uuid(), server_default=sa.text("gen_random_uuid()"), nullable=False
+        ),
+        sa.Column("file_id", sa.Uuid(), nullable=False),
+        sa.Column("kind", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), server_default="pending", nullable=False),
+        sa.Column("attempts", sa.Integer(), server_default="0", nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "run_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_update_file_jobs_file_id", "update_file_jobs", ["file_id"], unique=False
+    )
+    op.create_index(
+        "ix_update_file_jobs_status_run_at",
+        "update_file_jobs",
+        ["status", "run_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_update_file_jobs_status_run_at", table_name="update_file_jobs")
+    op.drop_index("ix_update_file_jobs_file_id", table_name="update_file_jobs")
+    op.drop_table("update_file_jobs")
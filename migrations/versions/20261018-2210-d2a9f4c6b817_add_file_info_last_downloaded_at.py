@@ -0,0 +1,27 @@
+"""Add file info last downloaded at
+
+Revision ID: d2a9f4c6b817
+Revises: c7f1a3e5d820
+Create Date: 2026-10-18 22:10:12.518304
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d2a9f4c6b817"
+down_revision = "c7f1a3e5d820"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "update_files",
+        sa.Column("last_downloaded_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("update_files", "last_downloaded_at")
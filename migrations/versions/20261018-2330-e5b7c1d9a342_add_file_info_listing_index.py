@@ -0,0 +1,28 @@
+"""Add file info listing index
+
+Revision ID: e5b7c1d9a342
+Revises: d2a9f4c6b817
+Create Date: 2026-10-18 23:30:47.120935
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e5b7c1d9a342"
+down_revision = "d2a9f4c6b817"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_update_files_created_at_id",
+        "update_files",
+        ["created_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_update_files_created_at_id", table_name="update_files")
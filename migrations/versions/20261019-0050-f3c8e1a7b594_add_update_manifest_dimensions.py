@@ -0,0 +1,48 @@
+"""Add update manifest dimensions
+
+Revision ID: f3c8e1a7b594
+Revises: e5b7c1d9a342
+Create Date: 2026-10-19 00:50:12.384106
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3c8e1a7b594"
+down_revision = "e5b7c1d9a342"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The existing manifest becomes the one of the default dimensions
+    op.add_column(
+        "update_manifests",
+        sa.Column("product", sa.String(), server_default="default", nullable=False),
+    )
+    op.add_column(
+        "update_manifests",
+        sa.Column("channel", sa.String(), server_default="stable", nullable=False),
+    )
+    op.add_column(
+        "update_manifests",
+        sa.Column("platform", sa.String(), server_default="any", nullable=False),
+    )
+    op.drop_constraint("update_manifests_pkey", "update_manifests", type_="primary")
+    op.create_primary_key(
+        "update_manifests_pkey", "update_manifests", ["product", "channel", "platform"]
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "DELETE FROM update_manifests"
+        " WHERE (product, channel, platform) <> ('default', 'stable', 'any')"
+    )
+    op.drop_constraint("update_manifests_pkey", "update_manifests", type_="primary")
+    op.create_primary_key("update_manifests_pkey", "update_manifests", ["version"])
+    op.drop_column("update_manifests", "platform")
+    op.drop_column("update_manifests", "channel")
+    op.drop_column("update_manifests", "product")
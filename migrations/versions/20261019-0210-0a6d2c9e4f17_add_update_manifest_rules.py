@@ -0,0 +1,50 @@
+"""Add update manifest rules
+
+Revision ID: 0a6d2c9e4f17
+Revises: f3c8e1a7b594
+Create Date: 2026-10-19 02:10:36.502918
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0a6d2c9e4f17"
+down_revision = "f3c8e1a7b594"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "update_manifest_rules",
+        sa.Column(
+            "id", sa.Uuid(), server_default=sa.text("gen_random_uuid()"), nullable=False
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("product", sa.String(), nullable=False),
+        sa.Column("channel", sa.String(), nullable=False),
+        sa.Column("platform", sa.String(), nullable=False),
+        sa.Column("min_version", sa.String(), nullable=True),
+        sa.Column("max_version", sa.String(), nullable=True),
+        sa.Column("version", sa.String(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_update_manifest_rules_key",
+        "update_manifest_rules",
+        ["product", "channel", "platform"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_update_manifest_rules_key", table_name="update_manifest_rules")
+    op.drop_table("update_manifest_rules")
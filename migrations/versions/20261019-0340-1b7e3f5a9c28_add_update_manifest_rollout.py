@@ -0,0 +1,47 @@
+"""Add update manifest rollout
+
+Revision ID: 1b7e3f5a9c28
+Revises: 0a6d2c9e4f17
+Create Date: 2026-10-19 03:40:21.649370
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "1b7e3f5a9c28"
+down_revision = "0a6d2c9e4f17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The existing manifests stay fully rolled out
+    op.add_column(
+        "update_manifests",
+        sa.Column(
+            "rollout_percentage", sa.Float(), server_default="100", nullable=False
+        ),
+    )
+    op.add_column(
+        "update_manifests",
+        sa.Column(
+            "rollout_ramp_seconds", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+    op.add_column(
+        "update_manifests",
+        sa.Column(
+            "published_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("update_manifests", "published_at")
+    op.drop_column("update_manifests", "rollout_ramp_seconds")
+    op.drop_column("update_manifests", "rollout_percentage")
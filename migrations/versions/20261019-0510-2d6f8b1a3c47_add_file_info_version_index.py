@@ -0,0 +1,28 @@
+"""Add file info version index
+
+Revision ID: 2d6f8b1a3c47
+Revises: 1b7e3f5a9c28
+Create Date: 2026-10-19 05:10:32.518406
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2d6f8b1a3c47"
+down_revision = "1b7e3f5a9c28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_update_files_version_created_at_id",
+        "update_files",
+        ["version", "created_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_update_files_version_created_at_id", table_name="update_files")
@@ -1,8 +1,18 @@
 from datetime import datetime
+from pathlib import Path
 
 import pytest
+from dependency_injector import providers
 
+from app.core.containers import Container
 from app.entities.update_file import UpdateFileEntity
+from app.entities.update_file_job import UpdateFileJobEntity
+from app.entities.update_file_patch import UpdateFilePatchEntity
+from app.entities.update_file_upload import UpdateFileUploadEntity
+from app.entities.update_manifest import UpdateManifestEntity
+from app.entities.update_manifest_rule import UpdateManifestRuleEntity
+from app.services.update_files.storage.file_repository import BLOBRepository
+from app.settings import AppSettings
 from tests.integration.utils.db.db_seeder import DbTestDataHandler
 
 
@@ -24,9 +34,26 @@ async def prepare_db_data(db_client, update_files):
     """Prepare test DB for tests."""
 
     restore_db = DbTestDataHandler(db_client)
+    restore_db.add_entity_info(UpdateFileJobEntity, [])
     restore_db.add_entity_info(UpdateFileEntity, update_files)
+    restore_db.add_entity_info(UpdateFilePatchEntity, [])
+    restore_db.add_entity_info(UpdateFileUploadEntity, [])
+    restore_db.add_entity_info(UpdateManifestEntity, [])
+    restore_db.add_entity_info(UpdateManifestRuleEntity, [])
 
     await restore_db.clear_database()
     await restore_db.seed_database()
     yield
     await restore_db.clear_database()
+
+
+@pytest.fixture(autouse=True)
+def file_storage(app_container: Container, app_config: AppSettings, tmp_path: Path):
+    """Point the file storage to a temporary directory."""
+
+    config = app_config.model_copy(update={"file_storage_path": str(tmp_path)})
+    app_container.update_file_repository.override(
+        providers.Factory(BLOBRepository, config=config, logger=app_container.logger)
+    )
+    yield tmp_path
+    app_container.update_file_repository.reset_override()
@@ -1,11 +1,16 @@
+import hashlib
 import io
-from datetime import datetime
+from datetime import datetime, timedelta
+from pathlib import Path
 from unittest import mock
+from uuid import uuid4
 
 import pytest
 from fastapi import status
 from httpx import AsyncClient
 
+from app.core.containers import Container
+from app.models.update_file import StorageLimits, UpdateFileEviction
 from app.settings import AppSettings
 
 
@@ -25,7 +30,42 @@ async def test_getting_update_file_infos(
         assert datetime.fromisoformat(resulted["created_at"]) == expected["created_at"]
 
 
-async def test_get_update_file(app_client: AsyncClient, app_config: AppSettings):
+async def test_paginating_update_file_infos(
+    app_client: AsyncClient, app_config: AppSettings, update_files: list[dict]
+):
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    ids: list[str] = []
+    params: dict[str, int | str] = {"limit": 1}
+    while True:
+        response = await app_client.get(
+            "/service/update-files", headers=headers, params=params
+        )
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 1
+        ids.extend(info["id"] for info in page)
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    response = await app_client.get("/service/update-files", headers=headers)
+    assert ids == [info["id"] for info in response.json()]
+    assert len(ids) == len(update_files)
+
+
+async def test_paginating_update_file_infos_invalid_cursor(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get(
+        "/service/update-files", headers=headers, params={"cursor": "invalid"}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_get_update_file(
+    app_client: AsyncClient, app_config: AppSettings, file_storage: Path
+):
     """Test downloading a specific update file."""
 
     # Get available update files to retrieve ID
@@ -42,21 +82,111 @@ async def test_get_update_file(app_client: AsyncClient, app_config: AppSettings)
     if not file_id:
         pytest.skip("No file ID available for testing")
 
-    # Mock the file retrieval
-    with mock.patch(
-        "app.services.update_files.storage.file_repository.aiofiles.open"
-    ) as mock_open:
-        # Setup the mock
-        mock_file = mock.AsyncMock()
-        mock_file.__aenter__.return_value.read = mock.AsyncMock(
-            return_value=b"test content"
-        )
-        mock_open.return_value = mock_file
+    (file_storage / file_id).write_bytes(b"test content")
 
-        # Test the endpoint
-        download_response = await app_client.get(f"/update-files/{file_id}")
-        assert download_response.status_code == 200
-        assert download_response.headers["content-type"] == "application/octet-stream"
+    # Test the endpoint
+    download_response = await app_client.get(f"/update-files/{file_id}")
+    assert download_response.status_code == 200
+    assert download_response.headers["content-type"] == "application/octet-stream"
+    assert download_response.headers["accept-ranges"] == "bytes"
+    assert download_response.headers["content-length"] == "12"
+    assert download_response.content == b"test content"
+
+
+@pytest.mark.parametrize(
+    "range_header,expected_status,expected_content",
+    [
+        pytest.param("bytes=5-", 206, b"content", id="resume"),
+        pytest.param("bytes=-4", 206, b"tent", id="suffix"),
+        pytest.param("bytes=12-", 416, None, id="not_satisfiable"),
+        pytest.param("lines=1-2", 200, b"test content", id="unknown_unit"),
+    ],
+)
+async def test_get_update_file_range(
+    app_client: AsyncClient,
+    app_config: AppSettings,
+    file_storage: Path,
+    range_header: str,
+    expected_status: int,
+    expected_content: bytes | None,
+):
+    """Test downloading a part of an update file."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get("/service/update-files", headers=headers)
+    file_id = response.json()[0]["id"]
+    (file_storage / file_id).write_bytes(b"test content")
+
+    response = await app_client.get(
+        f"/update-files/{file_id}", headers={"Range": range_header}
+    )
+    assert response.status_code == expected_status
+    if expected_content is not None:
+        assert response.content == expected_content
+    if expected_status == 206:
+        assert response.headers["content-range"].endswith("/12")
+    if expected_status == 416:
+        assert response.headers["content-range"] == "bytes */12"
+
+
+async def test_get_update_file_multiple_ranges(
+    app_client: AsyncClient, app_config: AppSettings, file_storage: Path
+):
+    """Test downloading several parts of an update file at once."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get("/service/update-files", headers=headers)
+    file_id = response.json()[0]["id"]
+    (file_storage / file_id).write_bytes(b"test content")
+
+    response = await app_client.get(
+        f"/update-files/{file_id}", headers={"Range": "bytes=0-3,5-11"}
+    )
+    assert response.status_code == 206
+    assert response.headers["content-type"].startswith("multipart/byteranges")
+    assert int(response.headers["content-length"]) == len(response.content)
+    assert b"Content-Range: bytes 0-3/12\r\n\r\ntest\r\n" in response.content
+    assert b"Content-Range: bytes 5-11/12\r\n\r\ncontent\r\n" in response.content
+
+
+async def test_get_update_file_conditional(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test revalidating an update file that a client already holds."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.post(
+        "/service/update-files",
+        headers=headers,
+        files={"file": ("etag.bin", io.BytesIO(b"etag content"))},
+    )
+    assert response.status_code == 200
+    uploaded = response.json()
+    assert uploaded["sha256"] == hashlib.sha256(b"etag content").hexdigest()
+
+    response = await app_client.get(f"/update-files/{uploaded['id']}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+    assert etag == f'"{uploaded["sha256"]}"'
+
+    response = await app_client.get(
+        f"/update-files/{uploaded['id']}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+    response = await app_client.get(
+        f"/update-files/{uploaded['id']}",
+        headers={"If-Modified-Since": last_modified},
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    response = await app_client.get(
+        f"/update-files/{uploaded['id']}", headers={"If-None-Match": '"outdated"'}
+    )
+    assert response.status_code == 200
+    assert response.content == b"etag content"
 
 
 async def test_get_update_file_not_found(app_client: AsyncClient):
@@ -67,6 +197,22 @@ async def test_get_update_file_not_found(app_client: AsyncClient):
     assert response.status_code == 404
 
 
+async def test_get_update_file_chunks_not_found(app_client: AsyncClient):
+    """Test getting the chunk hashes of a non-existent file."""
+
+    response = await app_client.get(f"/update-files/{uuid4().hex}/chunks")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_get_update_patch_not_found(app_client: AsyncClient):
+    """Test getting a patch which has not been built."""
+
+    response = await app_client.get(
+        f"/update-patches/{uuid4().hex}/{uuid4().hex}", headers={"Range": "bytes=0-"}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
 async def test_getting_update_file_infos_unauthorized(app_client: AsyncClient):
     """Test getting file info without authorization."""
 
@@ -85,21 +231,14 @@ async def test_getting_update_file_infos_unauthorized(app_client: AsyncClient):
         pytest.param("valid.bin", None, 200, id="no_comment"),
     ],
 )
-@mock.patch("app.services.update_files.storage.file_repository.aiofiles.open")
 async def test_upload_update_file_parametrized(
-    mock_open,
     app_client: AsyncClient,
     app_config: AppSettings,
     filename: str,
     comment: str | None,
     expected_status: int,
 ):
-    """Test uploading files."""
-
-    # Mock the file operations
-    mock_file = mock.AsyncMock()
-    mock_file.__aenter__.return_value.write = mock.AsyncMock()
-    mock_open.return_value = mock_file
+    """Test uploading files, stored in the temporary file storage."""
 
     # Create directory path mock
     with mock.patch(
@@ -134,15 +273,10 @@ async def test_upload_update_file_parametrized(
                 assert "id" in result
 
 
-@mock.patch("app.services.update_files.storage.file_repository.aiofiles.open")
 async def test_upload_file_when_capacity_reached(
-    mock_open, app_client: AsyncClient, app_config: AppSettings
+    app_client: AsyncClient, app_config: AppSettings
 ):
     """Test that the oldest file is deleted when capacity is reached."""
-    # Mock the file operations
-    mock_file = mock.AsyncMock()
-    mock_file.__aenter__.return_value.write = mock.AsyncMock()
-    mock_open.return_value = mock_file
 
     # Check current file count
     headers = {"Authorization": f"Bearer {app_config.api_key}"}
@@ -223,6 +357,279 @@ async def test_upload_file_when_capacity_reached(
         assert new_file_data["id"] in file_ids
 
 
+async def test_upload_file_keeps_manifest_file(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test that the file the manifest refers to is not evicted."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get("/service/update-files", headers=headers)
+    files = sorted(response.json(), key=lambda x: x["created_at"])
+    response = await app_client.post(
+        "/service/update-manifest",
+        headers=headers,
+        json={
+            "version": "1.0.0",
+            "url": f"https://example.com/update-files/{files[0]['id']}",
+        },
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    # Fill the storage to capacity and beyond
+    for i in range(app_config.file_storage_capacity - len(files) + 1):
+        response = await app_client.post(
+            "/service/update-files/raw",
+            headers=headers,
+            params={"name": f"fill_capacity_{i}.bin"},
+            content=b"Test file content",
+        )
+        assert response.status_code == 200
+
+    response = await app_client.get("/service/update-files", headers=headers)
+    file_ids = [f["id"] for f in response.json()]
+    assert len(file_ids) == app_config.file_storage_capacity
+    # The least recently used file not referred to is evicted instead
+    assert files[0]["id"] in file_ids
+    assert files[1]["id"] not in file_ids
+
+
+async def test_evict_counts_patches(
+    app_client: AsyncClient, app_config: AppSettings, app_container: Container
+):
+    """Test that the patches count towards the byte limit of the storage."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get("/service/update-files", headers=headers)
+    files = sorted(response.json(), key=lambda x: x["created_at"])
+    file_infos = app_container.file_info_repository()
+    limits = StorageLimits(max_count=10, max_bytes=12000)
+
+    # The files take 10000 bytes
+    assert await file_infos.evict(limits) == UpdateFileEviction()
+
+    patches = app_container.update_patch_repository()
+    assert await patches.create(files[4]["id"], files[3]["id"], 3000)
+    eviction = await file_infos.evict(limits)
+
+    # The least recently used files are evicted, down to 12000 bytes
+    assert sorted(eviction.file_ids) == sorted([files[0]["id"], files[1]["id"]])
+
+
+async def test_find_patch_among_files_of_version(
+    app_client: AsyncClient, app_config: AppSettings, app_container: Container
+):
+    """Test that a patch is found from an older file of the version."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    ids = []
+    for name, version in [("app-mac", "1.0"), ("app-win", "1.0"), ("app-mac", "1.1")]:
+        response = await app_client.post(
+            "/service/update-files/raw",
+            headers=headers,
+            params={"name": name, "version": version},
+            content=name.encode(),
+        )
+        assert response.status_code == 200
+        ids.append(response.json()["id"])
+    mac_source, win_source, target = ids
+
+    # The newest file of the version, of another platform, has no patch
+    patches = app_container.update_patch_repository()
+    assert await patches.create(mac_source, target, 10)
+
+    patch = await patches.find("1.0", target)
+    assert patch is not None
+    assert (patch.source_id, patch.target_id) == (mac_source, target)
+    assert await patches.find("1.1", target) is None
+
+
+async def test_upload_raw_update_file(
+    app_client: AsyncClient, app_config: AppSettings, file_storage: Path
+):
+    """Test uploading a file as a raw request body."""
+
+    content = b"Test file content"
+    headers = {
+        "Authorization": f"Bearer {app_config.api_key}",
+        "Content-Type": "application/octet-stream",
+    }
+    response = await app_client.post(
+        "/service/update-files/raw",
+        headers=headers,
+        params={"name": "test-file.bin", "comment": "Raw upload", "version": "1.0"},
+        content=content,
+    )
+    assert response.status_code == 200
+    result = response.json()
+    assert result["name"] == "test-file.bin"
+    assert result["comment"] == "Raw upload"
+    assert result["size"] == len(content)
+    assert result["sha256"] == hashlib.sha256(content).hexdigest()
+    assert (file_storage / result["id"]).read_bytes() == content
+
+
+async def test_upload_update_file_enqueues_jobs(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test that an upload queues its post-processing jobs."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.post(
+        "/service/update-files/raw",
+        headers=headers,
+        params={"name": "test-file.bin"},
+        content=b"Test file content",
+    )
+    assert response.status_code == 200
+    file_id = response.json()["id"]
+
+    response = await app_client.get(
+        f"/service/update-files/{file_id}/jobs", headers=headers
+    )
+    assert response.status_code == 200
+    jobs = response.json()
+    assert sorted(job["kind"] for job in jobs) == [
+        "build_patches",
+        "compress",
+        "verify",
+    ]
+    assert all(job["status"] == "pending" for job in jobs)
+    assert all(job["file_id"] == file_id for job in jobs)
+
+
+async def test_expired_job_fails_after_max_attempts(
+    app_client: AsyncClient, app_config: AppSettings, app_container: Container
+):
+    """Test that a job crashing its worker each time is not claimed forever."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.post(
+        "/service/update-files/raw",
+        headers=headers,
+        params={"name": "test-file.bin"},
+        content=b"Test file content",
+    )
+    assert response.status_code == 200
+    file_id = response.json()["id"]
+
+    # The lease of the claimed job expires right away, as if its worker crashed
+    jobs = app_container.update_job_repository()
+    crashed = await jobs.claim(timedelta(0), max_attempts=1)
+    assert crashed is not None
+    claimed = await jobs.claim(timedelta(minutes=5), max_attempts=1)
+    assert claimed is not None
+    assert claimed.id != crashed.id
+
+    response = await app_client.get(
+        f"/service/update-files/{file_id}/jobs", headers=headers
+    )
+    statuses = {job["id"]: job["status"] for job in response.json()}
+    assert statuses[crashed.id] == "failed"
+    assert statuses[claimed.id] == "running"
+
+
+async def test_resumable_upload(
+    app_client: AsyncClient, app_config: AppSettings, file_storage: Path
+):
+    """Test uploading a file in chunks, with a retry and finalization."""
+
+    content = b"Test file content"
+    auth = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.post(
+        "/service/update-files/uploads",
+        headers={**auth, "Upload-Length": str(len(content))},
+        params={"name": "test-file.bin", "version": "2.0"},
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    location = response.headers["Location"]
+    assert location.endswith(f"/service/update-files/uploads/{response.json()['id']}")
+
+    response = await app_client.head(location, headers=auth)
+    assert response.headers["Upload-Offset"] == "0"
+    assert response.headers["Upload-Length"] == str(len(content))
+
+    response = await app_client.patch(
+        location, headers={**auth, "Upload-Offset": "0"}, content=content[:5]
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert response.headers["Upload-Offset"] == "5"
+
+    # A retried chunk at a stale offset is rejected
+    response = await app_client.patch(
+        location, headers={**auth, "Upload-Offset": "0"}, content=content[:5]
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = await app_client.post(f"{location}/finalize", headers=auth)
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = await app_client.patch(
+        location, headers={**auth, "Upload-Offset": "5"}, content=content[5:]
+    )
+    assert response.headers["Upload-Offset"] == str(len(content))
+
+    response = await app_client.post(f"{location}/finalize", headers=auth)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["name"] == "test-file.bin"
+    assert result["version"] == "2.0"
+    assert result["size"] == len(content)
+    assert result["sha256"] == hashlib.sha256(content).hexdigest()
+    assert (file_storage / result["id"]).read_bytes() == content
+
+    response = await app_client.head(location, headers=auth)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_upload_update_file_too_large(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test that an upload which cannot be stored is rejected early."""
+
+    async def content():
+        raise AssertionError("The body should not be read")
+        yield b""
+
+    headers = {
+        "Authorization": f"Bearer {app_config.api_key}",
+        "Content-Type": "multipart/form-data; boundary=boundary",
+        "Content-Length": str(2**62),
+    }
+    response = await app_client.post(
+        "/service/update-files", headers=headers, content=content()
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+async def test_upload_update_file_too_large_unauthorized(app_client: AsyncClient):
+    """Test that the storage space is not disclosed to unauthorized callers."""
+
+    async def content():
+        raise AssertionError("The body should not be read")
+        yield b""
+
+    headers = {
+        "Authorization": "Bearer invalid_key",
+        "Content-Type": "multipart/form-data; boundary=boundary",
+        "Content-Length": str(2**62),
+    }
+    response = await app_client.post(
+        "/service/update-files", headers=headers, content=content()
+    )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_upload_update_file_without_file(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test uploading a form without the file."""
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.post(
+        "/service/update-files", headers=headers, data={"comment": "Test"}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 async def test_upload_update_file_unauthorized(app_client: AsyncClient):
     """Test uploading a file without authorization."""
 
@@ -306,3 +713,58 @@ async def test_delete_update_file_unauthorized(
         f"/update-files/{non_existent_id}", headers=wrong_headers
     )
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_get_update_file_cache_stats(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test getting the statistics of the update file cache."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get(
+        "/service/update-files/cache-stats", headers=headers
+    )
+    assert response.status_code == 200
+    assert set(response.json()) == {
+        "max_bytes",
+        "size_bytes",
+        "entries",
+        "hits",
+        "misses",
+        "evictions",
+    }
+
+    response = await app_client.get("/service/update-files/cache-stats")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+async def test_get_update_file_download_stats(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test getting the statistics of the download scheduler."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get(
+        "/service/update-files/download-stats", headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()["active"] == 0
+
+    response = await app_client.get("/service/update-files/download-stats")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+async def test_get_update_file_reconcile_stats(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test getting the statistics of the storage reconciliation."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    response = await app_client.get(
+        "/service/update-files/reconcile-stats", headers=headers
+    )
+    assert response.status_code == 200
+    assert "orphans_deleted" in response.json()
+
+    response = await app_client.get("/service/update-files/reconcile-stats")
+    assert response.status_code == status.HTTP_403_FORBIDDEN
@@ -1,7 +1,10 @@
 import pytest
 
 from app.core.containers import Container
+from app.entities.update_file import UpdateFileEntity
+from app.entities.update_file_patch import UpdateFilePatchEntity
 from app.entities.update_manifest import UpdateManifestEntity
+from app.entities.update_manifest_rule import UpdateManifestRuleEntity
 from tests.integration.utils.db.db_seeder import DbTestDataHandler
 
 
@@ -14,11 +17,18 @@ def update_manifest() -> dict:
 
 
 @pytest.fixture(autouse=True)
-async def prepare_db_data(db_client, update_manifest):
+async def prepare_db_data(db_client, app_container: Container, update_manifest):
     """Prepare test DB for tests."""
 
+    # The manifest cached by the previous test is seeded over
+    app_container.update_manifest_service.reset()
+
     restore_db = DbTestDataHandler(db_client)
     restore_db.add_entity_info(UpdateManifestEntity, [update_manifest])
+    restore_db.add_entity_info(UpdateManifestRuleEntity, [])
+    # Looked up for patches from the requester version
+    restore_db.add_entity_info(UpdateFileEntity, [])
+    restore_db.add_entity_info(UpdateFilePatchEntity, [])
 
     await restore_db.clear_database()
     await restore_db.seed_database()
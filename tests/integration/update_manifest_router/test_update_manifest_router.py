@@ -37,6 +37,36 @@ async def test_get_update_manifest(
         result = response.json()
         assert result["version"] == update_manifest["version"]
         assert result["url"] == update_manifest["url"]
+        # No patch is available, the field is omitted
+        assert "patch_url" not in result
+
+
+async def test_get_update_manifest_not_modified(
+    app_client: AsyncClient, app_config: AppSettings
+):
+    """Test revalidating an update manifest by its entity tag."""
+
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    url = "/update-manifest?currentVersion=1.0.0"
+    response = await app_client.get(url, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+
+    response = await app_client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    # A changed manifest gets another tag
+    new_manifest = {"version": "1.3.0", "url": "https://example.com/app-1.3.0.zip"}
+    response = await app_client.post(
+        "/service/update-manifest", headers=headers, json=new_manifest
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await app_client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+    assert response.json()["version"] == "1.3.0"
 
 
 async def test_get_update_manifest_unauthorized(app_client: AsyncClient):
@@ -180,6 +210,52 @@ async def test_delete_update_manifest(app_client: AsyncClient, app_config: AppSe
     assert get_response.status_code == status.HTTP_404_NOT_FOUND
 
 
+async def test_update_manifests_by_channel(
+    app_client: AsyncClient, app_config: AppSettings, update_manifest: dict
+):
+    """Test the manifests of several channels side by side."""
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    beta_params = {"currentVersion": "1.0.0", "channel": "beta", "platform": "win"}
+
+    # An older version is accepted in another channel
+    beta_manifest = {
+        "version": "1.1.0",
+        "url": "https://example.com/downloads/app-1.1.0.zip",
+        "channel": "beta",
+        "platform": "win",
+    }
+    response = await app_client.post(
+        "/service/update-manifest", headers=headers, json=beta_manifest
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = await app_client.get(
+        "/update-manifest", headers=headers, params=beta_params
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["version"] == "1.1.0"
+    response = await app_client.get(
+        "/update-manifest?currentVersion=1.0.0", headers=headers
+    )
+    assert response.json()["version"] == update_manifest["version"]
+
+    # Deleting one leaves the others
+    response = await app_client.delete(
+        "/service/update-manifest",
+        headers=headers,
+        params={"channel": "beta", "platform": "win"},
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await app_client.get(
+        "/update-manifest", headers=headers, params=beta_params
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await app_client.get(
+        "/update-manifest?currentVersion=1.0.0", headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
 async def test_delete_update_manifest_unauthorized(app_client: AsyncClient):
     """Test deleting an update manifest without authorization."""
 
@@ -194,3 +270,119 @@ async def test_delete_update_manifest_unauthorized(app_client: AsyncClient):
         headers=headers,
     )
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_update_manifest_rules(
+    app_client: AsyncClient, app_config: AppSettings, update_manifest: dict
+):
+    """Test routing a version range to a migration release."""
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    rule = {
+        "version": "1.1.5",
+        "url": "https://example.com/downloads/app-1.1.5.zip",
+        "max_version": "1.1.0",
+    }
+
+    response = await app_client.post(
+        "/service/update-manifest/rules", headers=headers, json=rule
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    rule_id = response.json()["id"]
+
+    # The range may not overlap another one
+    response = await app_client.post(
+        "/service/update-manifest/rules",
+        headers=headers,
+        json={**rule, "max_version": "1.0.5"},
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    response = await app_client.get("/service/update-manifest/rules", headers=headers)
+    assert [rule["id"] for rule in response.json()] == [rule_id]
+
+    response = await app_client.get(
+        "/update-manifest?currentVersion=1.0.0", headers=headers
+    )
+    assert response.json()["version"] == "1.1.5"
+    response = await app_client.get(
+        "/update-manifest?currentVersion=1.1.0", headers=headers
+    )
+    assert response.json()["version"] == update_manifest["version"]
+
+    response = await app_client.delete(
+        f"/service/update-manifest/rules/{rule_id}", headers=headers
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await app_client.get(
+        "/update-manifest?currentVersion=1.0.0", headers=headers
+    )
+    assert response.json()["version"] == update_manifest["version"]
+
+    response = await app_client.delete(
+        f"/service/update-manifest/rules/{rule_id}", headers=headers
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_update_manifest_rollout(
+    app_client: AsyncClient, app_config: AppSettings, update_manifest: dict
+):
+    """Test holding a manifest back from the clients outside of its rollout."""
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    client_headers = {"Authorization": "Bearer crm-token-123"}
+    url = "/update-manifest?currentVersion=1.0.0"
+
+    # The current version is not rolled out to anyone anymore
+    response = await app_client.post(
+        "/service/update-manifest",
+        headers=headers,
+        json={**update_manifest, "rollout_percentage": 0},
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = await app_client.get(url, headers=client_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await app_client.get(
+        url, headers={**client_headers, "X-Client-Id": "workplace-1"}
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    # Service requests are not rolled out to
+    response = await app_client.get(url, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await app_client.post(
+        "/service/update-manifest",
+        headers=headers,
+        json={**update_manifest, "rollout_percentage": 100},
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await app_client.get(url, headers=client_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+
+async def test_update_manifest_rollout_by_client_id(
+    app_client: AsyncClient, app_config: AppSettings, update_manifest: dict
+):
+    """Test picking the clients of a partial rollout by their X-Client-Id."""
+    headers = {"Authorization": f"Bearer {app_config.api_key}"}
+    client_headers = {"Authorization": "Bearer crm-token-123"}
+    url = "/update-manifest?currentVersion=1.0.0"
+
+    response = await app_client.post(
+        "/service/update-manifest",
+        headers=headers,
+        json={**update_manifest, "rollout_percentage": 50},
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    statuses = set()
+    for i in range(20):
+        response = await app_client.get(
+            url, headers={**client_headers, "X-Client-Id": f"workplace-{i}"}
+        )
+        statuses.add(response.status_code)
+    assert statuses == {status.HTTP_200_OK, status.HTTP_404_NOT_FOUND}
+
+    # The CRM token rotates, a client without an id is held back
+    response = await app_client.get(url, headers=client_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
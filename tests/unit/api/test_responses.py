@@ -0,0 +1,106 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.api.responses import PATH_SEND, ZERO_COPY_SEND, BLOBResponse
+
+
+@pytest.fixture
+def blob_file(tmp_path: Path) -> Path:
+    path = tmp_path / "test-id"
+    path.write_bytes(b"test content")
+    return path
+
+
+class ContentIterator:
+    """Content iterator that tracks whether it was consumed and closed."""
+
+    def __init__(self, data: bytes):
+        self.chunks = [data]
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        if not self.chunks:
+            raise StopAsyncIteration
+        return self.chunks.pop()
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+async def call_response(
+    response: BLOBResponse, extensions: dict
+) -> list[dict[str, Any]]:
+    messages: list[dict[str, Any]] = []
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"spec_version": "2.4"},
+        "method": "GET",
+        "extensions": extensions,
+    }
+    await response(scope, receive, send)
+    return messages
+
+
+class TestBLOBResponse:
+    async def test_zero_copy_send(self, blob_file: Path) -> None:
+        # Given
+        content = ContentIterator(b"test content")
+        response = BLOBResponse(content, file_path=blob_file, offset=5, count=7)
+
+        # When
+        messages = await call_response(response, {ZERO_COPY_SEND: {}})
+
+        # Then - the file is handed over to the server
+        assert messages[0]["type"] == "http.response.start"
+        assert messages[1]["type"] == ZERO_COPY_SEND
+        assert messages[1]["file"].name == str(blob_file)
+        assert (messages[1]["offset"], messages[1]["count"]) == (5, 7)
+        assert content.chunks and content.closed
+
+    async def test_path_send_whole_file(self, blob_file: Path) -> None:
+        # Given
+        content = ContentIterator(b"test content")
+        response = BLOBResponse(content, file_path=blob_file)
+
+        # When
+        messages = await call_response(response, {PATH_SEND: {}})
+
+        # Then
+        assert messages[1] == {"type": PATH_SEND, "path": str(blob_file)}
+        assert content.chunks and content.closed
+
+    async def test_path_send_not_used_for_ranges(self, blob_file: Path) -> None:
+        # Given
+        content = ContentIterator(b"content")
+        response = BLOBResponse(content, file_path=blob_file, offset=5, count=7)
+
+        # When
+        messages = await call_response(response, {PATH_SEND: {}})
+
+        # Then - the content is streamed
+        assert messages[1]["body"] == b"content"
+        assert content.closed
+
+    async def test_fallback_to_streaming(self, blob_file: Path) -> None:
+        # Given
+        content = ContentIterator(b"test content")
+        response = BLOBResponse(content, file_path=blob_file)
+
+        # When - the server does not support sending files
+        messages = await call_response(response, {})
+
+        # Then
+        assert messages[1]["body"] == b"test content"
+        assert content.closed
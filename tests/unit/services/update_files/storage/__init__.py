@@ -0,0 +1 @@
+"""Unit tests for update_files storage"""
@@ -0,0 +1,187 @@
+import asyncio
+from logging import Logger
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.update_files.storage.cached_file_repository import (
+    CachedBLOBRepository,
+)
+from app.services.update_files.storage.file_repository import BLOBRepository
+from app.settings import AppSettings
+
+
+@pytest.fixture
+def mock_config(tmp_path: Path) -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.file_storage_path = str(tmp_path)
+    config.file_chunk_size = 4
+    config.file_hash_chunk_size = 4
+    config.file_mmap = False
+    config.file_storage_fsync = True
+    config.file_delete_timeout = 60
+    config.file_cache_max_bytes = 20
+    return config
+
+
+@pytest.fixture
+def mock_logger() -> MagicMock:
+    return MagicMock(spec=Logger)
+
+
+@pytest.fixture
+def blob_repository(mock_config: MagicMock, mock_logger: MagicMock) -> BLOBRepository:
+    return BLOBRepository(config=mock_config, logger=mock_logger)
+
+
+@pytest.fixture
+def cached_repository(
+    blob_repository: BLOBRepository, mock_config: MagicMock, mock_logger: MagicMock
+) -> CachedBLOBRepository:
+    return CachedBLOBRepository(
+        repository=blob_repository, config=mock_config, logger=mock_logger
+    )
+
+
+async def read(repository: CachedBLOBRepository, object_id: str, *args) -> list:
+    return [chunk async for chunk in await repository.get(object_id, *args)]
+
+
+class TestCachedBLOBRepository:
+    async def test_get_serves_from_memory(
+        self, cached_repository: CachedBLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        path = tmp_path / "test-id"
+        path.write_bytes(b"0123456789")
+        await read(cached_repository, "test-id")
+
+        # When - the file is gone, but it has been cached
+        path.unlink()
+        chunks = await read(cached_repository, "test-id", 3, 5)
+
+        # Then
+        assert all(isinstance(chunk, memoryview) for chunk in chunks)
+        assert b"".join(chunks) == b"34567"
+        assert (await cached_repository.stat("test-id")).size == 10
+        stats = cached_repository.get_cache_stats()
+        assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+        assert stats.size_bytes == 10
+
+    async def test_get_evicts_least_recently_used(
+        self, cached_repository: CachedBLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        for object_id in ("first", "second", "third"):
+            (tmp_path / object_id).write_bytes(b"x" * 8)
+
+        # When - 24 bytes do not fit into 20, "first" was used most recently
+        await read(cached_repository, "first")
+        await read(cached_repository, "second")
+        await read(cached_repository, "first")
+        await read(cached_repository, "third")
+
+        # Then
+        assert list(cached_repository._entries) == ["first", "third"]
+        stats = cached_repository.get_cache_stats()
+        assert (stats.hits, stats.misses, stats.evictions) == (1, 3, 1)
+        assert stats.size_bytes == 16
+
+    async def test_get_passes_large_objects_through(
+        self, cached_repository: CachedBLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"x" * 21)
+
+        # When
+        chunks = await read(cached_repository, "test-id")
+
+        # Then
+        assert b"".join(chunks) == b"x" * 21
+        stats = cached_repository.get_cache_stats()
+        assert (stats.hits, stats.misses, stats.entries) == (0, 0, 0)
+
+    async def test_get_loads_once_for_concurrent_reads(
+        self, cached_repository: CachedBLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When
+        results = await asyncio.gather(
+            *(read(cached_repository, "test-id") for _ in range(3))
+        )
+
+        # Then
+        assert all(b"".join(chunks) == b"0123456789" for chunks in results)
+        stats = cached_repository.get_cache_stats()
+        assert (stats.hits, stats.misses) == (2, 1)
+
+    async def test_get_loads_on_first_read(
+        self, cached_repository: CachedBLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When - the content is not consumed, e.g. the file was sent directly
+        content = await cached_repository.get("test-id")
+        await content.aclose()  # type: ignore[attr-defined]
+
+        # Then
+        assert cached_repository.get_cache_stats().entries == 0
+
+    async def test_get_not_found(self, cached_repository: CachedBLOBRepository) -> None:
+        # When/Then
+        with pytest.raises(FileNotFoundError):
+            await cached_repository.get("non-existent-id")
+
+    async def test_delete_invalidates(
+        self, cached_repository: CachedBLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+        await read(cached_repository, "test-id")
+
+        # When
+        await cached_repository.delete("test-id")
+
+        # Then
+        assert not (tmp_path / "test-id").exists()
+        with pytest.raises(FileNotFoundError):
+            await cached_repository.get("test-id")
+        stats = cached_repository.get_cache_stats()
+        assert (stats.entries, stats.size_bytes) == (0, 0)
+
+    async def test_delete_while_read(
+        self,
+        cached_repository: CachedBLOBRepository,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+    ) -> None:
+        # Given - not loaded yet, e.g. the file is sent directly
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+        content = await cached_repository.get("test-id")
+
+        # When
+        await cached_repository.delete("test-id")
+
+        # Then - the file is kept until the reader is done
+        assert (tmp_path / "test-id").exists()
+        await content.aclose()  # type: ignore[attr-defined]
+        await asyncio.gather(*blob_repository._deletions)
+        assert not (tmp_path / "test-id").exists()
+
+    async def test_disabled(
+        self, cached_repository: CachedBLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        cached_repository.max_bytes = 0
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When
+        chunks = await read(cached_repository, "test-id")
+
+        # Then
+        assert chunks == [b"0123", b"4567", b"89"]
+        assert cached_repository.get_cache_stats().misses == 0
@@ -0,0 +1,531 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+from collections.abc import AsyncGenerator, Callable, Iterator
+from contextlib import ExitStack
+from logging import Logger
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.update_files.storage import file_repository
+from app.services.update_files.storage.file_repository import BLOBRepository
+from app.services.update_files.storage.interfaces import (
+    BLOBConflictError,
+    BLOBSizeLimitError,
+)
+from app.settings import AppSettings
+
+
+@pytest.fixture
+def mock_config(tmp_path: Path) -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.file_storage_path = str(tmp_path)
+    config.file_chunk_size = 4
+    config.file_hash_chunk_size = 4
+    config.file_mmap = False
+    config.file_storage_fsync = True
+    config.file_delete_timeout = 60
+    return config
+
+
+@pytest.fixture
+def mock_logger() -> MagicMock:
+    return MagicMock(spec=Logger)
+
+
+@pytest.fixture
+def blob_repository(mock_config: MagicMock, mock_logger: MagicMock) -> BLOBRepository:
+    return BLOBRepository(config=mock_config, logger=mock_logger)
+
+
+@pytest.fixture
+def lock_file(tmp_path: Path) -> Iterator[Callable[[str, bytes], None]]:
+    """Write a file and hold an exclusive lock on it, as a concurrent writer."""
+
+    with ExitStack() as stack:
+
+        def lock(name: str, content: bytes) -> None:
+            path = tmp_path / name
+            path.write_bytes(content)
+            f = stack.enter_context(path.open("rb"))
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+        yield lock
+
+
+async def read(*pieces: bytes) -> AsyncGenerator[bytes]:
+    for piece in pieces:
+        yield piece
+
+
+class TestBLOBRepository:
+    async def test_create_returns_digests(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        content = read(b"0123", b"456", b"789")
+
+        # When
+        digest = await blob_repository.create("test-id", content)
+
+        # Then
+        assert (tmp_path / "test-id").read_bytes() == b"0123456789"
+        assert digest.size == 10
+        assert digest.sha256 == hashlib.sha256(b"0123456789").hexdigest()
+        assert digest.chunk_size == 4
+        assert digest.chunk_sha256 == [
+            hashlib.sha256(chunk).hexdigest() for chunk in (b"0123", b"4567", b"89")
+        ]
+
+    async def test_create_is_atomic(
+        self,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        # Given
+        fsync = MagicMock(wraps=os.fsync)
+        monkeypatch.setattr(os, "fsync", fsync)
+        seen = []
+
+        async def content() -> AsyncGenerator[bytes]:
+            yield b"01234"
+            seen.append((tmp_path / "test-id").exists())
+            yield b"56789"
+
+        # When
+        await blob_repository.create("test-id", content())
+
+        # Then - the object appears only when complete, the file and dir synced
+        assert seen == [False]
+        assert (tmp_path / "test-id").read_bytes() == b"0123456789"
+        assert list(tmp_path.iterdir()) == [tmp_path / "test-id"]
+        assert fsync.call_count == 2
+
+    async def test_create_without_fsync(
+        self,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        # Given
+        blob_repository.fsync = False
+        fsync = MagicMock()
+        monkeypatch.setattr(os, "fsync", fsync)
+
+        # When
+        await blob_repository.create("test-id", read(b"0123456789"))
+
+        # Then
+        assert (tmp_path / "test-id").read_bytes() == b"0123456789"
+        fsync.assert_not_called()
+
+    async def test_create_batches_pieces(
+        self,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        # Given - the batches do not match the hashed chunks
+        monkeypatch.setattr(file_repository, "UPLOAD_BUFFER_SIZE", 3)
+        content = read(b"01", b"2", b"3", b"456789")
+
+        # When
+        digest = await blob_repository.create("test-id", content)
+
+        # Then
+        assert (tmp_path / "test-id").read_bytes() == b"0123456789"
+        assert digest.size == 10
+        assert digest.sha256 == hashlib.sha256(b"0123456789").hexdigest()
+        assert digest.chunk_sha256 == [
+            hashlib.sha256(chunk).hexdigest() for chunk in (b"0123", b"4567", b"89")
+        ]
+
+    async def test_create_over_max_size(
+        self,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        # Given
+        monkeypatch.setattr(file_repository, "UPLOAD_BUFFER_SIZE", 3)
+        content = read(b"0123", b"456", b"789")
+
+        # When/Then - no partial object is left behind
+        with pytest.raises(BLOBSizeLimitError):
+            await blob_repository.create("test-id", content, max_size=9)
+        assert not list(tmp_path.iterdir())
+
+    async def test_get_free_space(self, blob_repository: BLOBRepository) -> None:
+        # When
+        free_space = await blob_repository.get_free_space()
+
+        # Then
+        assert free_space is not None and free_space > 0
+
+    async def test_scan(self, blob_repository: BLOBRepository, tmp_path: Path) -> None:
+        # Given
+        for name in ["first", "second", "third.tmp"]:
+            (tmp_path / name).write_bytes(b"0123")
+        (tmp_path / "directory").mkdir()
+
+        # When
+        batches = [batch async for batch in blob_repository.scan(2)]
+
+        # Then - only the files are listed
+        assert all(len(batch) <= 2 for batch in batches)
+        entries = [entry for batch in batches for entry in batch]
+        assert sorted(entry.object_id for entry in entries) == [
+            "first",
+            "second",
+            "third.tmp",
+        ]
+        assert all(entry.size == 4 for entry in entries)
+
+    async def test_append(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # When
+        first = await blob_repository.append("test-id", read(b"01234"), 0)
+        second = await blob_repository.append("test-id", read(b"56", b"789"), first)
+
+        # Then
+        assert (first, second) == (5, 10)
+        assert (tmp_path / "test-id").read_bytes() == b"0123456789"
+
+    async def test_append_offset_mismatch(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"01234")
+
+        # When/Then
+        with pytest.raises(BLOBConflictError):
+            await blob_repository.append("test-id", read(b"56789"), 3)
+        assert (tmp_path / "test-id").read_bytes() == b"01234"
+
+    async def test_append_missing(self, blob_repository: BLOBRepository) -> None:
+        # When/Then - only the first chunk creates the object
+        with pytest.raises(FileNotFoundError):
+            await blob_repository.append("test-id", read(b"56789"), 5)
+
+    async def test_append_concurrently(
+        self, blob_repository: BLOBRepository, lock_file: Callable[[str, bytes], None]
+    ) -> None:
+        # Given
+        lock_file("test-id", b"01234")
+
+        # When/Then
+        with pytest.raises(BLOBConflictError):
+            await blob_repository.append("test-id", read(b"56789"), 5)
+
+    async def test_append_over_max_size(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # When/Then
+        with pytest.raises(BLOBSizeLimitError):
+            await blob_repository.append("test-id", read(b"0123456789"), 0, 9)
+
+    async def test_seal(self, blob_repository: BLOBRepository, tmp_path: Path) -> None:
+        # Given - last appended to long ago
+        (tmp_path / "test-id.upload").write_bytes(b"0123456789")
+        os.utime(tmp_path / "test-id.upload", (0, 0))
+
+        # When
+        digest = await blob_repository.seal("test-id.upload", "test-id")
+
+        # Then
+        assert not (tmp_path / "test-id.upload").exists()
+        assert (tmp_path / "test-id").read_bytes() == b"0123456789"
+        assert digest.size == 10
+        assert digest.sha256 == hashlib.sha256(b"0123456789").hexdigest()
+        assert len(digest.chunk_sha256) == 3
+        # Then - as recent as a new file
+        stat = await blob_repository.stat("test-id")
+        assert stat.modified_at.timestamp() > 0
+
+    async def test_seal_while_appending(
+        self,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+        lock_file: Callable[[str, bytes], None],
+    ) -> None:
+        # Given
+        lock_file("test-id.upload", b"0123456789")
+
+        # When/Then
+        with pytest.raises(BLOBConflictError):
+            await blob_repository.seal("test-id.upload", "test-id")
+        assert not (tmp_path / "test-id").exists()
+
+    async def test_unseal(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id.upload").write_bytes(b"0123456789")
+        await blob_repository.seal("test-id.upload", "test-id")
+
+        # When
+        await blob_repository.unseal("test-id", "test-id.upload")
+
+        # Then - appended to again from where it was
+        assert not (tmp_path / "test-id").exists()
+        assert await blob_repository.append("test-id.upload", read(b"ab"), 10) == 12
+        assert (tmp_path / "test-id.upload").read_bytes() == b"0123456789ab"
+
+    async def test_digest(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When
+        digest = await blob_repository.digest("test-id")
+
+        # Then
+        assert digest.size == 10
+        assert digest.sha256 == hashlib.sha256(b"0123456789").hexdigest()
+        assert len(digest.chunk_sha256) == 3
+
+    async def test_create_derived(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When
+        stat = await blob_repository.create_derived(
+            "test-id.rev",
+            ["test-id"],
+            lambda src, dst: dst.write_bytes(src.read_bytes()[::-1]),
+        )
+
+        # Then
+        assert (tmp_path / "test-id.rev").read_bytes() == b"9876543210"
+        assert stat.size == 10
+
+    async def test_create_derived_failure(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        def transform(source: Path, target: Path) -> None:
+            target.write_bytes(b"partial")
+            raise ValueError
+
+        # When/Then - no partial object is left behind
+        with pytest.raises(ValueError):
+            await blob_repository.create_derived("test-id.rev", ["test-id"], transform)
+        assert list(tmp_path.iterdir()) == [tmp_path / "test-id"]
+
+    async def test_get_reads_in_chunks(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When
+        chunks = [chunk async for chunk in await blob_repository.get("test-id")]
+
+        # Then
+        assert chunks == [b"0123", b"4567", b"89"]
+
+    async def test_get_not_found(self, blob_repository: BLOBRepository) -> None:
+        # When/Then - reported before the content is consumed
+        with pytest.raises(FileNotFoundError):
+            await blob_repository.get("non-existent-id")
+
+    async def test_get_opens_file_lazily(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        path = tmp_path / "test-id"
+        path.write_bytes(b"0123456789")
+
+        # When - the file is removed after the response was prepared
+        content = await blob_repository.get("test-id")
+        path.unlink()
+
+        # Then - the file is only opened on the first read
+        with pytest.raises(FileNotFoundError):
+            await anext(content)
+
+    async def test_get_mapped(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        blob_repository.use_mmap = True
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When
+        chunks = [chunk async for chunk in await blob_repository.get("test-id", 3, 6)]
+
+        # Then
+        assert all(isinstance(chunk, memoryview) for chunk in chunks)
+        assert [bytes(chunk) for chunk in chunks] == [b"3456", b"78"]
+        assert blob_repository._mappings == {}
+
+    async def test_get_mapped_shares_mapping(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        blob_repository.use_mmap = True
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+        first = await blob_repository.get("test-id")
+        second = await blob_repository.get("test-id")
+
+        # When - both readers are in the middle of the content
+        assert bytes(await anext(first)) == b"0123"
+        assert bytes(await anext(second)) == b"0123"
+
+        # Then - they share one mapping, which is closed after the last reader
+        mapping = blob_repository._mappings["test-id"]
+        assert mapping.readers == 2
+        await first.aclose()  # type: ignore[attr-defined]
+        assert blob_repository._mappings["test-id"] is mapping
+        assert [bytes(chunk) async for chunk in second] == [b"4567", b"89"]
+        assert blob_repository._mappings == {}
+
+    async def test_get_mapped_empty_file(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        blob_repository.use_mmap = True
+        (tmp_path / "test-id").write_bytes(b"")
+
+        # When
+        chunks = [chunk async for chunk in await blob_repository.get("test-id")]
+
+        # Then
+        assert chunks == []
+
+    async def test_delete(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+
+        # When
+        await blob_repository.delete("test-id")
+
+        # Then
+        assert not (tmp_path / "test-id").exists()
+        with pytest.raises(FileNotFoundError):
+            await blob_repository.delete("test-id")
+
+    async def test_delete_while_read(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given - e.g. the file is about to be sent directly by the server
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+        content = await blob_repository.get("test-id")
+
+        # When
+        await blob_repository.delete("test-id")
+
+        # Then - new readers do not find the file, the current one still does
+        with pytest.raises(FileNotFoundError):
+            await blob_repository.get("test-id")
+        with pytest.raises(FileNotFoundError):
+            await blob_repository.stat("test-id")
+        assert (tmp_path / "test-id").read_bytes() == b"0123456789"
+
+        # Then - it is removed after the last reader is done
+        await content.aclose()  # type: ignore[attr-defined]
+        await asyncio.gather(*blob_repository._deletions)
+        assert not (tmp_path / "test-id").exists()
+        assert blob_repository._deleted == {}
+
+    async def test_delete_while_getting(
+        self,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        # Given - get() is waiting for the file to be checked
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+        checking, checked = asyncio.Event(), asyncio.Event()
+        stat = file_repository.aiofiles.os.stat
+
+        async def slow_stat(path: Path):
+            if not checking.is_set():
+                checking.set()
+                await checked.wait()
+            return await stat(path)
+
+        monkeypatch.setattr(file_repository.aiofiles.os, "stat", slow_stat)
+        getting = asyncio.create_task(blob_repository.get("test-id"))
+        await checking.wait()
+
+        # When
+        await blob_repository.delete("test-id")
+        checked.set()
+        content = await getting
+
+        # Then - the file is kept for the reader
+        chunks = [chunk async for chunk in content]
+        assert b"".join(chunks) == b"0123456789"
+        await content.aclose()  # type: ignore[attr-defined]
+        await asyncio.gather(*blob_repository._deletions)
+        assert not (tmp_path / "test-id").exists()
+
+    async def test_read_done_while_deleting(
+        self,
+        blob_repository: BLOBRepository,
+        tmp_path: Path,
+        monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        # Given - delete() is checking the file being read
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+        content = await blob_repository.get("test-id")
+        checking, checked = asyncio.Event(), asyncio.Event()
+        stat = file_repository.aiofiles.os.stat
+
+        async def slow_stat(path: Path):
+            checking.set()
+            await checked.wait()
+            return await stat(path)
+
+        monkeypatch.setattr(file_repository.aiofiles.os, "stat", slow_stat)
+        deleting = asyncio.create_task(blob_repository.delete("test-id"))
+        await checking.wait()
+
+        # When - the last reader is done meanwhile
+        await content.aclose()  # type: ignore[attr-defined]
+        checked.set()
+        await deleting
+
+        # Then - the file is removed without waiting for the timeout
+        await asyncio.wait_for(asyncio.gather(*blob_repository._deletions), 1)
+        assert not (tmp_path / "test-id").exists()
+
+    async def test_get_missing_not_counted(
+        self, blob_repository: BLOBRepository
+    ) -> None:
+        # When
+        with pytest.raises(FileNotFoundError):
+            await blob_repository.get("test-id")
+
+        # Then
+        assert blob_repository._readers == {}
+
+    async def test_delete_while_read_times_out(
+        self, blob_repository: BLOBRepository, tmp_path: Path
+    ) -> None:
+        # Given
+        blob_repository.delete_timeout = 0.01
+        (tmp_path / "test-id").write_bytes(b"0123456789")
+        content = await blob_repository.get("test-id")
+        assert await anext(content) == b"0123"
+
+        # When - the reader never finishes
+        await blob_repository.delete("test-id")
+        await asyncio.gather(*blob_repository._deletions)
+
+        # Then
+        assert not (tmp_path / "test-id").exists()
+        await content.aclose()  # type: ignore[attr-defined]
@@ -0,0 +1,44 @@
+import pytest
+
+from app.api.errors import ApiRangeNotSatisfiableError
+from app.services.update_files.byte_ranges import ByteRange, parse_range_header
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        pytest.param("bytes=0-9", [ByteRange(0, 9)], id="first_bytes"),
+        pytest.param("bytes=90-", [ByteRange(90, 99)], id="open_ended"),
+        pytest.param("bytes=-10", [ByteRange(90, 99)], id="suffix"),
+        pytest.param("bytes=-200", [ByteRange(0, 99)], id="suffix_too_long"),
+        pytest.param("bytes=95-200", [ByteRange(95, 99)], id="end_clamped"),
+        pytest.param(
+            "bytes=50-59, 0-9", [ByteRange(0, 9), ByteRange(50, 59)], id="sorted"
+        ),
+        pytest.param("bytes=0-9,5-19,20-29", [ByteRange(0, 29)], id="coalesced"),
+        pytest.param("bytes=0-9,200-", [ByteRange(0, 9)], id="unsatisfiable_dropped"),
+        pytest.param("items=0-9", None, id="unknown_unit"),
+        pytest.param("bytes=9-0", None, id="reversed"),
+        pytest.param("bytes=abc", None, id="malformed"),
+        pytest.param(
+            "bytes=" + ",".join(f"{i}-{i}" for i in range(0, 40, 2)),
+            None,
+            id="too_many_ranges",
+        ),
+    ],
+)
+def test_parse_range_header(header: str, expected: list[ByteRange] | None):
+    assert parse_range_header(header, 100) == expected
+
+
+@pytest.mark.parametrize(
+    "header,size",
+    [
+        pytest.param("bytes=100-", 100, id="beyond_end"),
+        pytest.param("bytes=-0", 100, id="empty_suffix"),
+        pytest.param("bytes=0-", 0, id="empty_object"),
+    ],
+)
+def test_parse_range_header_not_satisfiable(header: str, size: int):
+    with pytest.raises(ApiRangeNotSatisfiableError):
+        parse_range_header(header, size)
@@ -0,0 +1,62 @@
+import gzip
+from pathlib import Path
+
+import pytest
+import zstandard
+
+from app.services.update_files.compression import ENCODINGS, choose_encoding
+
+VARIANTS = {"gzip": 60, "zstd": 50}
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,variants,expected",
+    [
+        pytest.param(None, VARIANTS, None, id="no_header"),
+        pytest.param("gzip", {}, None, id="no_variants"),
+        pytest.param("gzip, deflate, br", VARIANTS, "gzip", id="single_match"),
+        pytest.param("gzip, zstd", VARIANTS, "zstd", id="smallest"),
+        pytest.param("gzip, zstd;q=0.5", VARIANTS, "gzip", id="quality"),
+        pytest.param("GZIP;Q=1", VARIANTS, "gzip", id="case_insensitive"),
+        pytest.param("*", VARIANTS, "zstd", id="wildcard"),
+        pytest.param("*, zstd;q=0", VARIANTS, "gzip", id="wildcard_excluded"),
+        pytest.param("gzip;q=0", VARIANTS, None, id="excluded"),
+        pytest.param("gzip;q=0.5, identity", VARIANTS, None, id="identity_preferred"),
+        pytest.param("gzip;q=abc", VARIANTS, None, id="invalid_quality"),
+        pytest.param("br", VARIANTS, None, id="not_acceptable"),
+    ],
+)
+def test_choose_encoding(
+    accept_encoding: str | None, variants: dict[str, int], expected: str | None
+):
+    assert choose_encoding(accept_encoding, variants) == expected
+
+
+def test_gzip_compress(tmp_path: Path):
+    # Given
+    content = b"0123456789" * 1000
+    (tmp_path / "source").write_bytes(content)
+
+    # When
+    ENCODINGS["gzip"].compress(tmp_path / "source", tmp_path / "target")
+
+    # Then
+    compressed = (tmp_path / "target").read_bytes()
+    assert gzip.decompress(compressed) == content
+    assert len(compressed) < len(content)
+
+
+def test_zstd_compress(tmp_path: Path):
+    # Given
+    content = b"0123456789" * 1000
+    (tmp_path / "source").write_bytes(content)
+
+    # When
+    ENCODINGS["zstd"].compress(tmp_path / "source", tmp_path / "target")
+
+    # Then
+    compressed = (tmp_path / "target").read_bytes()
+    assert (
+        zstandard.ZstdDecompressor().decompressobj().decompress(compressed) == content
+    )
+    assert len(compressed) < len(content)
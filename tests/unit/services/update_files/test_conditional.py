@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pytest
+
+from app.services.update_files.conditional import (
+    format_http_date,
+    if_range_matches,
+    is_not_modified,
+)
+
+ETAG = '"abc123"'
+LAST_MODIFIED = datetime.fromisoformat("2023-01-01T00:00:00.250Z")
+
+
+def test_format_http_date():
+    assert format_http_date(LAST_MODIFIED) == "Sun, 01 Jan 2023 00:00:00 GMT"
+
+
+@pytest.mark.parametrize(
+    "if_none_match,if_modified_since,etag,expected",
+    [
+        pytest.param(None, None, ETAG, False, id="unconditional"),
+        pytest.param(ETAG, None, ETAG, True, id="etag_matches"),
+        pytest.param(f'"other", W/{ETAG}', None, ETAG, True, id="weak_etag_listed"),
+        pytest.param("*", None, ETAG, True, id="any_etag"),
+        pytest.param('"other"', None, ETAG, False, id="etag_differs"),
+        pytest.param(ETAG, None, None, False, id="no_etag"),
+        pytest.param(
+            '"other"',
+            "Sun, 01 Jan 2023 00:00:00 GMT",
+            ETAG,
+            False,
+            id="if_modified_since_ignored",
+        ),
+        pytest.param(
+            None, "Sun, 01 Jan 2023 00:00:00 GMT", ETAG, True, id="not_modified_since"
+        ),
+        pytest.param(
+            None, "Sat, 31 Dec 2022 00:00:00 GMT", ETAG, False, id="modified_since"
+        ),
+        pytest.param(None, "yesterday", ETAG, False, id="malformed_date"),
+    ],
+)
+def test_is_not_modified(
+    if_none_match: str | None,
+    if_modified_since: str | None,
+    etag: str | None,
+    expected: bool,
+):
+    result = is_not_modified(if_none_match, if_modified_since, etag, LAST_MODIFIED)
+    assert result is expected
+
+
+@pytest.mark.parametrize(
+    "validator,expected",
+    [
+        pytest.param(None, True, id="absent"),
+        pytest.param(ETAG, True, id="same_etag"),
+        pytest.param(f"W/{ETAG}", False, id="weak_etag"),
+        pytest.param('"other"', False, id="other_etag"),
+        pytest.param("Sun, 01 Jan 2023 00:00:00 GMT", True, id="same_date"),
+        pytest.param("Sat, 31 Dec 2022 00:00:00 GMT", False, id="other_date"),
+        pytest.param("yesterday", False, id="malformed"),
+    ],
+)
+def test_if_range_matches(validator: str | None, expected: bool):
+    assert if_range_matches(validator, ETAG, LAST_MODIFIED) is expected
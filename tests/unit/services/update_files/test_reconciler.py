@@ -0,0 +1,278 @@
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from logging import Logger
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.models.update_file import DownloadSchedulerStats, StorageReferences
+from app.services.update_files.reconciler import StorageReconciler
+from app.services.update_files.scheduler import DownloadScheduler
+from app.services.update_files.service import UpdateFileService
+from app.services.update_files.storage.file_info_repository import FileInfoRepository
+from app.services.update_files.storage.interfaces import (
+    BLOBEntry,
+    BLOBRepositoryInterface,
+)
+from app.services.update_files.uploads import UpdateFileUploadService
+from app.settings import AppSettings
+
+FILE_ID = "a" * 32
+SOURCE_ID = "b" * 32
+UPLOAD_ID = "c" * 32
+ORPHAN_ID = "d" * 32
+OLD = datetime.now(UTC) - timedelta(days=2)
+RECENT = datetime.now(UTC)
+
+
+@pytest.fixture
+def mock_blob_repository() -> MagicMock:
+    return MagicMock(spec=BLOBRepositoryInterface)
+
+
+@pytest.fixture
+def mock_file_info_repository() -> AsyncMock:
+    repository = AsyncMock(spec=FileInfoRepository)
+    repository.get_references.return_value = StorageReferences(
+        files={FILE_ID: OLD, SOURCE_ID: OLD},
+        uploads={UPLOAD_ID},
+        patches={(SOURCE_ID, FILE_ID)},
+    )
+    return repository
+
+
+@pytest.fixture
+def mock_file_service() -> AsyncMock:
+    return AsyncMock(spec=UpdateFileService)
+
+
+@pytest.fixture
+def mock_upload_service() -> AsyncMock:
+    service = AsyncMock(spec=UpdateFileUploadService)
+    service.collect_stale.return_value = 0
+    return service
+
+
+@pytest.fixture
+def mock_scheduler() -> MagicMock:
+    scheduler = MagicMock(spec=DownloadScheduler)
+    scheduler.get_stats.return_value = DownloadSchedulerStats(
+        max_active=1,
+        active=0,
+        queued=0,
+        admitted=0,
+        rejected=0,
+        average_wait=0,
+        max_wait=0,
+        average_duration=0,
+    )
+    return scheduler
+
+
+@pytest.fixture
+def mock_config() -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.file_reconcile_interval = 3600
+    config.file_reconcile_grace_period = 24 * 60 * 60
+    config.file_reconcile_rate = 1000
+    return config
+
+
+@pytest.fixture
+def reconciler(
+    mock_blob_repository: MagicMock,
+    mock_file_info_repository: AsyncMock,
+    mock_file_service: AsyncMock,
+    mock_upload_service: AsyncMock,
+    mock_scheduler: MagicMock,
+    mock_config: MagicMock,
+) -> StorageReconciler:
+    return StorageReconciler(
+        blob_repository=mock_blob_repository,
+        file_info_repository=mock_file_info_repository,
+        file_service=mock_file_service,
+        upload_service=mock_upload_service,
+        scheduler=mock_scheduler,
+        config=mock_config,
+        logger=MagicMock(spec=Logger),
+    )
+
+
+def stored(*entries: tuple[str, datetime]) -> AsyncIterator[list[BLOBEntry]]:
+    async def scan() -> AsyncIterator[list[BLOBEntry]]:
+        yield [
+            BLOBEntry(object_id=object_id, size=10, modified_at=modified_at)
+            for object_id, modified_at in entries
+        ]
+
+    return scan()
+
+
+class TestStorageReconciler:
+    async def test_run_keeps_referenced_blobs(
+        self,
+        reconciler: StorageReconciler,
+        mock_blob_repository: MagicMock,
+        mock_file_service: AsyncMock,
+    ) -> None:
+        # Given
+        mock_blob_repository.scan.return_value = stored(
+            (FILE_ID, OLD),
+            (f"{FILE_ID}.gz", OLD),
+            (SOURCE_ID, OLD),
+            (f"{FILE_ID}.from-{SOURCE_ID}.bsdiff4", OLD),
+            (f"{UPLOAD_ID}.upload", OLD),
+        )
+
+        # When
+        report = await reconciler.run()
+
+        # Then
+        assert report.scanned == 5
+        assert report.orphans_deleted == 0
+        mock_blob_repository.delete.assert_not_called()
+        mock_file_service.delete_file.assert_not_called()
+
+    async def test_run_collects_stale_uploads(
+        self,
+        reconciler: StorageReconciler,
+        mock_blob_repository: MagicMock,
+        mock_file_info_repository: AsyncMock,
+        mock_upload_service: AsyncMock,
+    ) -> None:
+        # Given - dropped before the references are read
+        async def collect_stale() -> int:
+            mock_file_info_repository.get_references.assert_not_called()
+            return 2
+
+        mock_upload_service.collect_stale.side_effect = collect_stale
+        mock_blob_repository.scan.return_value = stored()
+
+        # When
+        report = await reconciler.run()
+
+        # Then
+        assert report.uploads_expired == 2
+        assert reconciler.get_stats().uploads_expired == 2
+        mock_upload_service.collect_stale.assert_awaited_once()
+
+    async def test_run_deletes_orphans(
+        self,
+        reconciler: StorageReconciler,
+        mock_blob_repository: MagicMock,
+    ) -> None:
+        # Given
+        mock_blob_repository.delete = AsyncMock()
+        mock_blob_repository.scan.return_value = stored(
+            (FILE_ID, OLD),
+            (SOURCE_ID, OLD),
+            (ORPHAN_ID, OLD),
+            (f"{FILE_ID}.br.tmp", OLD),
+            (f"{UPLOAD_ID}.tmp", RECENT),
+            ("lost+found", OLD),
+        )
+
+        # When
+        report = await reconciler.run()
+
+        # Then - the recent and the unknown entries are left alone
+        assert mock_blob_repository.delete.call_count == 2
+        mock_blob_repository.delete.assert_any_call(ORPHAN_ID)
+        mock_blob_repository.delete.assert_any_call(f"{FILE_ID}.br.tmp")
+        assert report.orphans_deleted == 2
+        assert report.orphan_bytes_freed == 20
+        assert report.orphans_recent == 1
+        assert report.unknown == 1
+
+    async def test_run_keeps_blobs_recorded_meanwhile(
+        self,
+        reconciler: StorageReconciler,
+        mock_blob_repository: MagicMock,
+        mock_file_info_repository: AsyncMock,
+    ) -> None:
+        # Given - an upload is sealed as a file while the storage is listed
+        mock_blob_repository.delete = AsyncMock()
+        mock_file_info_repository.get_references.side_effect = [
+            StorageReferences(uploads={UPLOAD_ID}),
+            StorageReferences(files={ORPHAN_ID: RECENT}),
+        ]
+        mock_blob_repository.scan.return_value = stored((ORPHAN_ID, OLD))
+
+        # When
+        report = await reconciler.run()
+
+        # Then
+        mock_blob_repository.delete.assert_not_called()
+        assert report.orphans_deleted == 0
+
+    async def test_run_drops_missing_files(
+        self,
+        reconciler: StorageReconciler,
+        mock_blob_repository: MagicMock,
+        mock_file_info_repository: AsyncMock,
+        mock_file_service: AsyncMock,
+    ) -> None:
+        # Given - the blobs of both files are gone, one of them is new
+        mock_file_info_repository.get_references.return_value = StorageReferences(
+            files={FILE_ID: OLD, SOURCE_ID: RECENT}
+        )
+        mock_blob_repository.scan.return_value = stored()
+
+        # When
+        report = await reconciler.run()
+
+        # Then
+        mock_file_service.delete_file.assert_called_once_with(FILE_ID)
+        assert report.missing_deleted == 1
+
+    async def test_run_unlimited_rate(
+        self,
+        mock_blob_repository: MagicMock,
+        mock_file_info_repository: AsyncMock,
+        mock_file_service: AsyncMock,
+        mock_upload_service: AsyncMock,
+        mock_scheduler: MagicMock,
+        mock_config: MagicMock,
+    ) -> None:
+        # Given
+        mock_config.file_reconcile_rate = 0
+        reconciler = StorageReconciler(
+            blob_repository=mock_blob_repository,
+            file_info_repository=mock_file_info_repository,
+            file_service=mock_file_service,
+            upload_service=mock_upload_service,
+            scheduler=mock_scheduler,
+            config=mock_config,
+            logger=MagicMock(spec=Logger),
+        )
+        mock_blob_repository.scan.return_value = stored((FILE_ID, OLD))
+
+        # When
+        report = await reconciler.run()
+
+        # Then
+        assert reconciler.bucket is None
+        assert report.scanned == 1
+
+    async def test_get_stats(
+        self,
+        reconciler: StorageReconciler,
+        mock_blob_repository: MagicMock,
+    ) -> None:
+        # Given
+        mock_blob_repository.delete = AsyncMock()
+        mock_blob_repository.scan.side_effect = [
+            stored((ORPHAN_ID, OLD)),
+            stored(),
+        ]
+
+        # When
+        await reconciler.run()
+        last_run = await reconciler.run()
+
+        # Then
+        stats = reconciler.get_stats()
+        assert stats.runs == 2
+        assert stats.orphans_deleted == 1
+        assert stats.orphan_bytes_freed == 10
+        assert stats.last_run == last_run
@@ -0,0 +1,172 @@
+import asyncio
+from collections.abc import AsyncGenerator
+from logging import Logger
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.api.errors import ApiServiceUnavailableError
+from app.services.update_files.downloads import UpdateFileDownload
+from app.services.update_files.scheduler import DownloadScheduler, TokenBucket
+from app.settings import AppSettings
+
+
+@pytest.fixture
+def mock_config() -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.download_max_concurrent = 1
+    config.download_max_queued = 0
+    config.download_queue_timeout = 0
+    config.download_rate_limit = 0
+    config.download_global_rate_limit = 0
+    return config
+
+
+@pytest.fixture
+def mock_logger() -> MagicMock:
+    return MagicMock(spec=Logger)
+
+
+@pytest.fixture
+def scheduler(mock_config: MagicMock, mock_logger: MagicMock) -> DownloadScheduler:
+    return DownloadScheduler(config=mock_config, logger=mock_logger)
+
+
+async def chunks(*items: bytes) -> AsyncGenerator[bytes]:
+    for item in items:
+        yield item
+
+
+def download(*items: bytes) -> UpdateFileDownload:
+    return UpdateFileDownload(content=chunks(*items), file_path=Path("/storage/id"))
+
+
+class TestDownloadScheduler:
+    async def test_schedule_releases_on_close(
+        self, scheduler: DownloadScheduler
+    ) -> None:
+        # Given
+        scheduled = await scheduler.schedule(download(b"0123", b"45"))
+        assert scheduler.get_stats().active == 1
+
+        # When
+        assert scheduled.content is not None
+        result = [chunk async for chunk in scheduled.content]
+        await scheduled.content.aclose()  # type: ignore[attr-defined]
+
+        # Then
+        assert result == [b"0123", b"45"]
+        assert scheduled.file_path == Path("/storage/id")
+        stats = scheduler.get_stats()
+        assert (stats.active, stats.admitted) == (0, 1)
+
+    async def test_schedule_not_modified(self, scheduler: DownloadScheduler) -> None:
+        # When
+        result = await scheduler.schedule(UpdateFileDownload())
+
+        # Then - no content, no slot
+        assert result.content is None
+        assert scheduler.get_stats().active == 0
+
+    async def test_schedule_queues_in_order(self, scheduler: DownloadScheduler) -> None:
+        # Given
+        first = await scheduler.schedule(download(b"1"))
+        order: list[str] = []
+
+        async def wait(name: str) -> UpdateFileDownload:
+            scheduled = await scheduler.schedule(download(b"2"))
+            order.append(name)
+            return scheduled
+
+        second = asyncio.create_task(wait("second"))
+        third = asyncio.create_task(wait("third"))
+        await asyncio.sleep(0)
+        assert scheduler.get_stats().queued == 2
+
+        # When - the slot is handed over to the first in the queue
+        await first.content.aclose()  # type: ignore[union-attr]
+        await (await second).content.aclose()  # type: ignore[union-attr]
+        await (await third).content.aclose()  # type: ignore[union-attr]
+
+        # Then
+        assert order == ["second", "third"]
+        stats = scheduler.get_stats()
+        assert (stats.active, stats.queued, stats.admitted) == (0, 0, 3)
+
+    async def test_schedule_queue_full(
+        self, scheduler: DownloadScheduler, mock_config: MagicMock
+    ) -> None:
+        # Given
+        scheduler.max_queued = 1
+        await scheduler.schedule(download(b"1"))
+        waiting = asyncio.create_task(scheduler.schedule(download(b"2")))
+        await asyncio.sleep(0)
+
+        # When/Then
+        with pytest.raises(ApiServiceUnavailableError) as error:
+            await scheduler.schedule(download(b"3"))
+        # Two transfers ahead with no history of their duration
+        assert error.value.headers == {"Retry-After": "2"}
+        assert scheduler.get_stats().rejected == 1
+        waiting.cancel()
+
+    async def test_schedule_timeout(self, scheduler: DownloadScheduler) -> None:
+        # Given
+        scheduler.queue_timeout = 0.01
+        await scheduler.schedule(download(b"1"))
+
+        # When/Then
+        with pytest.raises(ApiServiceUnavailableError):
+            await scheduler.schedule(download(b"2"))
+        stats = scheduler.get_stats()
+        assert (stats.queued, stats.rejected) == (0, 1)
+
+    async def test_schedule_cancelled_while_waiting(
+        self, scheduler: DownloadScheduler
+    ) -> None:
+        # Given
+        first = await scheduler.schedule(download(b"1"))
+        waiting = asyncio.create_task(scheduler.schedule(download(b"2")))
+        await asyncio.sleep(0)
+
+        # When - the client has gone away
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        await first.content.aclose()  # type: ignore[union-attr]
+
+        # Then - the slot is not handed over to it
+        stats = scheduler.get_stats()
+        assert (stats.active, stats.queued) == (0, 0)
+
+    async def test_schedule_shaping_disables_zero_copy(
+        self, scheduler: DownloadScheduler
+    ) -> None:
+        # Given
+        scheduler.rate_limit = 1024
+
+        # When
+        scheduled = await scheduler.schedule(download(b"1"))
+
+        # Then
+        assert scheduled.file_path is None
+
+
+async def test_token_bucket(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Given
+    sleeps: list[float] = []
+
+    async def sleep(delay: float) -> None:
+        sleeps.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    bucket = TokenBucket(rate=100)
+
+    # When - a burst of one second is allowed, the rest has to wait
+    await bucket.consume(100)
+    await bucket.consume(50)
+
+    # Then
+    assert len(sleeps) == 1
+    assert sleeps[0] == pytest.approx(0.5, abs=0.01)
@@ -1,33 +1,99 @@
+from collections.abc import AsyncGenerator, AsyncIterator
+from concurrent.futures import Executor
 from datetime import datetime
-from io import BytesIO
 from logging import Logger
-from unittest.mock import AsyncMock, MagicMock
+from pathlib import Path
+from unittest.mock import ANY, AsyncMock, MagicMock, call
 
 import pytest
-from fastapi import UploadFile
-
-from app.api.errors import ApiNotFoundError
-from app.models.update_file import UpdateFileInfo, UpdateFileInfoToCreate
-from app.services.update_files.service import UpdateFileService
+from fastapi import UploadFile, status
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.api.errors import (
+    ApiNotFoundError,
+    ApiRangeNotSatisfiableError,
+    ApiRequestEntityTooLargeError,
+    WrongDataError,
+)
+from app.models.update_file import (
+    StorageLimits,
+    UpdateFileCacheStats,
+    UpdateFileChunks,
+    UpdateFileEviction,
+    UpdateFileInfo,
+    UpdateFileInfoToCreate,
+)
+from app.services.update_files.compression import ENCODINGS
+from app.services.update_files.scheduler import DownloadScheduler
+from app.services.update_files.service import (
+    LAST_DOWNLOAD_PRECISION,
+    UPLOAD_READ_SIZE,
+    UpdateFileIntegrityError,
+    UpdateFileService,
+)
 from app.services.update_files.storage.file_info_repository import FileInfoRepository
-from app.services.update_files.storage.interfaces import BLOBRepositoryInterface
+from app.services.update_files.storage.interfaces import (
+    BLOBDigest,
+    BLOBRepositoryInterface,
+    BLOBSizeLimitError,
+    BLOBStat,
+)
+from app.services.update_jobs.storage.repository import UpdateJobRepository
+from app.services.update_patches.service import UpdatePatchService
 from app.settings import AppSettings
 
 
 @pytest.fixture
 def mock_blob_repository() -> AsyncMock:
-    return AsyncMock(spec=BLOBRepositoryInterface)
+    repository = AsyncMock(spec=BLOBRepositoryInterface)
+    repository.create.return_value = BLOBDigest(
+        size=100, sha256="abc123", chunk_size=64, chunk_sha256=["def456", "789abc"]
+    )
+    return repository
 
 
 @pytest.fixture
 def mock_file_info_repository() -> AsyncMock:
-    return AsyncMock(spec=FileInfoRepository)
+    repository = AsyncMock(spec=FileInfoRepository)
+    repository.create.return_value = (
+        MagicMock(spec=UpdateFileInfo),
+        UpdateFileEviction(),
+    )
+    repository.evict.return_value = UpdateFileEviction()
+    return repository
+
+
+@pytest.fixture
+def mock_job_repository() -> AsyncMock:
+    return AsyncMock(spec=UpdateJobRepository)
+
+
+@pytest.fixture
+def mock_executor() -> MagicMock:
+    return MagicMock(spec=Executor)
+
+
+@pytest.fixture
+def mock_patch_service() -> AsyncMock:
+    return AsyncMock(spec=UpdatePatchService)
+
+
+@pytest.fixture
+def mock_scheduler() -> AsyncMock:
+    scheduler = AsyncMock(spec=DownloadScheduler)
+    scheduler.schedule.side_effect = lambda download: download
+    return scheduler
 
 
 @pytest.fixture
 def mock_config() -> MagicMock:
     config = MagicMock(spec=AppSettings)
     config.file_storage_capacity = 5
+    config.file_storage_capacity_bytes = 1000
+    config.file_max_upload_size = 0
+    config.file_zero_copy = True
+    config.file_compression_encodings = ["gzip"]
+    config.file_compression_min_saving = 0.1
     return config
 
 
@@ -40,12 +106,20 @@ def mock_logger() -> MagicMock:
 def update_file_service(
     mock_blob_repository: AsyncMock,
     mock_file_info_repository: AsyncMock,
+    mock_job_repository: AsyncMock,
+    mock_patch_service: AsyncMock,
+    mock_scheduler: AsyncMock,
+    mock_executor: MagicMock,
     mock_config: MagicMock,
     mock_logger: MagicMock,
 ) -> UpdateFileService:
     return UpdateFileService(
         repository=mock_blob_repository,
         file_info_repository=mock_file_info_repository,
+        job_repository=mock_job_repository,
+        patch_service=mock_patch_service,
+        scheduler=mock_scheduler,
+        executor=mock_executor,
         config=mock_config,
         logger=mock_logger,
     )
@@ -58,15 +132,36 @@ def sample_file_info() -> UpdateFileInfo:
         name="test-file.txt",
         size=100,
         comment="Test comment",
-        created_at=datetime.fromisoformat("2023-01-01T00:00:00"),
+        sha256="abc123",
+        created_at=datetime.fromisoformat("2023-01-01T00:00:00Z"),
+    )
+
+
+@pytest.fixture
+def blob_stat() -> BLOBStat:
+    return BLOBStat(
+        size=100, modified_at=datetime.fromisoformat("2023-01-01T00:00:00Z")
     )
 
 
+@pytest.fixture
+def stored_file(
+    mock_file_info_repository: AsyncMock,
+    mock_blob_repository: AsyncMock,
+    sample_file_info: UpdateFileInfo,
+    blob_stat: BLOBStat,
+) -> UpdateFileInfo:
+    mock_file_info_repository.get.return_value = sample_file_info
+    mock_blob_repository.stat.return_value = blob_stat
+    return sample_file_info
+
+
 @pytest.fixture
 def mock_upload_file() -> MagicMock:
     file = MagicMock(spec=UploadFile)
     file.filename = "test-file.txt"
-    file.size = 100
+    # Not known e.g. for chunked requests
+    file.size = None
     return file
 
 
@@ -76,25 +171,117 @@ class TestUpdateFileService:
         update_file_service: UpdateFileService,
         mock_blob_repository: AsyncMock,
         mock_file_info_repository: AsyncMock,
+        mock_job_repository: AsyncMock,
         mock_upload_file: MagicMock,
         sample_file_info: UpdateFileInfo,
     ) -> None:
         # Given
-        mock_file_info_repository.create.return_value = sample_file_info
+        mock_file_info_repository.create.return_value = (
+            sample_file_info,
+            UpdateFileEviction(),
+        )
 
         # When
         result = await update_file_service.create(mock_upload_file, "Test comment")
 
-        # Then
+        # Then - the blob is stored first, its digest is saved with the file info
+        mock_blob_repository.create.assert_called_once_with(
+            object_id=ANY, content=ANY, max_size=None
+        )
+        object_id = mock_blob_repository.create.call_args.kwargs["object_id"]
         mock_file_info_repository.create.assert_called_once_with(
+            object_id,
             UpdateFileInfoToCreate(
-                name="test-file.txt", size=100, comment="Test comment"
-            )
-        )
-        mock_blob_repository.create.assert_called_once_with(
-            object_id="test-id", file=mock_upload_file
+                name="test-file.txt", size=100, comment="Test comment", sha256="abc123"
+            ),
+            UpdateFileChunks(chunk_size=64, sha256=["def456", "789abc"]),
+            StorageLimits(max_count=5, max_bytes=1000),
+            # Queued along with the file info, for the job workers
+            ["verify", "compress", "build_patches"],
         )
         assert result == sample_file_info
+        mock_blob_repository.delete.assert_not_called()
+
+    async def test_create_reads_upload(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_upload_file: MagicMock,
+    ) -> None:
+        # Given
+        mock_upload_file.read = AsyncMock(side_effect=[b"012", b"345", b""])
+        received = []
+
+        async def create(object_id, content, max_size):
+            received.extend([data async for data in content])
+            return mock_blob_repository.create.return_value
+
+        mock_blob_repository.create.side_effect = create
+
+        # When
+        await update_file_service.create(mock_upload_file, None)
+
+        # Then - the upload is read in bounded pieces
+        assert received == [b"012", b"345"]
+        mock_upload_file.read.assert_called_with(UPLOAD_READ_SIZE)
+
+    async def test_create_from_stream(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+    ) -> None:
+        # Given
+        async def content() -> AsyncIterator[bytes]:
+            yield b"0123456789"
+
+        stream = content()
+
+        # When
+        await update_file_service.create_from_stream(
+            stream, "test-file.txt", "Test comment", version="1.0"
+        )
+
+        # Then
+        assert mock_blob_repository.create.call_args.kwargs["content"] is stream
+        mock_file_info_repository.create.assert_called_once_with(
+            ANY,
+            UpdateFileInfoToCreate(
+                name="test-file.txt",
+                size=100,
+                comment="Test comment",
+                sha256="abc123",
+                version="1.0",
+            ),
+            ANY,
+            ANY,
+            ANY,
+        )
+
+    async def test_create_with_version(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        mock_upload_file: MagicMock,
+    ) -> None:
+        # When
+        await update_file_service.create(mock_upload_file, None, version="v1.02")
+
+        # Then - the version is stored normalized
+        new_file_info = mock_file_info_repository.create.call_args.args[1]
+        assert new_file_info.version == "1.2"
+
+    async def test_create_with_invalid_version(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_upload_file: MagicMock,
+    ) -> None:
+        # When/Then
+        with pytest.raises(WrongDataError):
+            await update_file_service.create(mock_upload_file, None, version="latest")
+        mock_blob_repository.create.assert_not_called()
 
     async def test_create_with_blob_error(
         self,
@@ -102,73 +289,626 @@ class TestUpdateFileService:
         mock_blob_repository: AsyncMock,
         mock_file_info_repository: AsyncMock,
         mock_upload_file: MagicMock,
-        sample_file_info: UpdateFileInfo,
     ) -> None:
         # Given
-        mock_file_info_repository.create.return_value = sample_file_info
-        mock_blob_repository.create.side_effect = Exception("Storage error")
+        mock_blob_repository.create.side_effect = OSError("Storage error")
 
         # When/Then
-        with pytest.raises(Exception):
+        with pytest.raises(OSError, match="Storage error"):
             await update_file_service.create(mock_upload_file, "Test comment")
 
-        # Then the file info should be deleted
-        mock_file_info_repository.delete.assert_called_once_with("test-id")
+        # Then no file info should be created
+        mock_file_info_repository.create.assert_not_called()
 
-    async def test_get_all_infos(
+    async def test_create_too_large(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        mock_upload_file: MagicMock,
+    ) -> None:
+        # Given
+        update_file_service.max_upload_size = 50
+        mock_blob_repository.create.side_effect = BLOBSizeLimitError
+
+        # When/Then
+        with pytest.raises(ApiRequestEntityTooLargeError):
+            await update_file_service.create(mock_upload_file, "Test comment")
+
+        # Then
+        assert mock_blob_repository.create.call_args.kwargs["max_size"] == 50
+        mock_file_info_repository.create.assert_not_called()
+
+    async def test_check_upload_size(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+    ) -> None:
+        # Given
+        update_file_service.max_upload_size = 100
+        mock_blob_repository.get_free_space.return_value = 1000
+
+        # When/Then
+        await update_file_service.check_upload_size(100)
+        with pytest.raises(ApiRequestEntityTooLargeError):
+            await update_file_service.check_upload_size(101)
+
+    async def test_check_upload_size_free_space(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+    ) -> None:
+        # Given
+        mock_blob_repository.get_free_space.return_value = 1000
+
+        # When/Then
+        await update_file_service.check_upload_size(1000)
+        with pytest.raises(ApiRequestEntityTooLargeError):
+            await update_file_service.check_upload_size(1001)
+
+    async def test_create_with_file_info_error(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        mock_upload_file: MagicMock,
+    ) -> None:
+        # Given
+        mock_file_info_repository.create.side_effect = SQLAlchemyError("DB error")
+
+        # When/Then
+        with pytest.raises(SQLAlchemyError, match="DB error"):
+            await update_file_service.create(mock_upload_file, "Test comment")
+
+        # Then the stored blob should be deleted
+        object_id = mock_blob_repository.create.call_args.kwargs["object_id"]
+        mock_blob_repository.delete.assert_any_call(object_id)
+
+    async def test_get_infos_page(
         self,
         update_file_service: UpdateFileService,
         mock_file_info_repository: AsyncMock,
         sample_file_info: UpdateFileInfo,
+    ) -> None:
+        # Given - one more info than requested is found
+        newer = sample_file_info.model_copy(update={"id": "1" * 32})
+        mock_file_info_repository.get_page.return_value = [newer, sample_file_info]
+
+        # When
+        page = await update_file_service.get_infos_page(1)
+
+        # Then
+        assert page.items == [newer]
+        assert page.next_cursor is not None
+        mock_file_info_repository.get_page.assert_called_once_with(2, None)
+
+        # When - the next page is requested
+        mock_file_info_repository.get_page.return_value = [sample_file_info]
+        page = await update_file_service.get_infos_page(1, page.next_cursor)
+
+        # Then - it starts after the last info of the previous page
+        assert page.items == [sample_file_info]
+        assert page.next_cursor is None
+        mock_file_info_repository.get_page.assert_called_with(
+            2, (newer.created_at, newer.id)
+        )
+
+    @pytest.mark.parametrize(
+        "cursor",
+        ["", "not base64!", "bm90IGEgY3Vyc29y", "MjAyMy0wMS0wMVQwMDowMDowMCB4"],
+    )
+    async def test_get_infos_page_invalid_cursor(
+        self,
+        update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
+        cursor: str,
+    ) -> None:
+        # When/Then
+        with pytest.raises(WrongDataError):
+            await update_file_service.get_infos_page(1, cursor)
+        mock_file_info_repository.get_page.assert_not_called()
+
+    async def test_get_jobs(
+        self,
+        update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
+        mock_job_repository: AsyncMock,
+        sample_file_info: UpdateFileInfo,
     ) -> None:
         # Given
-        mock_file_info_repository.get_all.return_value = [sample_file_info]
+        mock_file_info_repository.get.return_value = sample_file_info
+        mock_job_repository.get_for_file.return_value = []
 
         # When
-        result = await update_file_service.get_all_infos()
+        result = await update_file_service.get_jobs("test-id")
 
         # Then
-        assert result == [sample_file_info]
-        mock_file_info_repository.get_all.assert_called_once()
+        assert result == []
+        mock_job_repository.get_for_file.assert_called_once_with("test-id")
+
+    async def test_get_jobs_not_found(
+        self,
+        update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
+    ) -> None:
+        # Given
+        mock_file_info_repository.get.return_value = None
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await update_file_service.get_jobs("test-id")
+
+    async def test_verify(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        mock_executor: MagicMock,
+        sample_file_info: UpdateFileInfo,
+    ) -> None:
+        # Given
+        mock_file_info_repository.get.return_value = sample_file_info
+        mock_blob_repository.digest.return_value = BLOBDigest(
+            size=100, sha256="abc123", chunk_size=64, chunk_sha256=[]
+        )
+
+        # When
+        await update_file_service.verify("test-id")
+
+        # Then - hashed in the worker processes
+        mock_blob_repository.digest.assert_called_once_with("test-id", mock_executor)
+
+    async def test_verify_mismatch(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        sample_file_info: UpdateFileInfo,
+    ) -> None:
+        # Given
+        mock_file_info_repository.get.return_value = sample_file_info
+        mock_blob_repository.digest.return_value = BLOBDigest(
+            size=100, sha256="def456", chunk_size=64, chunk_sha256=[]
+        )
+
+        # When/Then
+        with pytest.raises(UpdateFileIntegrityError):
+            await update_file_service.verify("test-id")
+
+    async def test_get_chunks(
+        self,
+        update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
+    ) -> None:
+        # Given
+        chunks = UpdateFileChunks(size=100, chunk_size=64, sha256=["def456", "789abc"])
+        mock_file_info_repository.get_chunks.return_value = chunks
+
+        # When
+        result = await update_file_service.get_chunks("test-id")
+
+        # Then
+        assert result == chunks
+        mock_file_info_repository.get_chunks.assert_called_once_with("test-id")
+
+    async def test_get_chunks_not_found(
+        self,
+        update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
+    ) -> None:
+        # Given - e.g. a file uploaded before the chunks were hashed
+        mock_file_info_repository.get_chunks.return_value = None
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await update_file_service.get_chunks("test-id")
 
     async def test_get_file_success(
         self,
         update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
         mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
     ) -> None:
         # Given
-        file_content = BytesIO(b"test content")
+        file_content = MagicMock(spec=AsyncIterator)
         mock_blob_repository.get.return_value = file_content
+        mock_blob_repository.get_path.return_value = Path("/storage/test-id")
 
         # When
         result = await update_file_service.get_file("test-id")
 
         # Then
-        assert result == file_content
+        assert result.content == file_content
+        assert result.status_code == status.HTTP_200_OK
+        assert result.headers["Content-Length"] == "100"
+        assert result.headers["Accept-Ranges"] == "bytes"
+        assert result.headers["ETag"] == '"abc123"'
+        assert result.headers["Last-Modified"] == "Sun, 01 Jan 2023 00:00:00 GMT"
+        assert result.file_path == Path("/storage/test-id")
+        mock_blob_repository.get.assert_called_once_with("test-id")
+        mock_file_info_repository.mark_downloaded.assert_called_once_with(
+            "test-id", LAST_DOWNLOAD_PRECISION
+        )
+
+    async def test_get_file_releases_on_error(
+        self,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        mock_job_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+        mock_executor: MagicMock,
+        mock_config: MagicMock,
+        mock_logger: MagicMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # Given - the download is recorded after it is admitted
+        mock_config.download_max_concurrent = 1
+        mock_config.download_max_queued = 0
+        mock_config.download_queue_timeout = 0
+        mock_config.download_rate_limit = 0
+        mock_config.download_global_rate_limit = 0
+        scheduler = DownloadScheduler(config=mock_config, logger=mock_logger)
+        service = UpdateFileService(
+            repository=mock_blob_repository,
+            file_info_repository=mock_file_info_repository,
+            job_repository=mock_job_repository,
+            patch_service=mock_patch_service,
+            scheduler=scheduler,
+            executor=mock_executor,
+            config=mock_config,
+            logger=mock_logger,
+        )
+        file_content = AsyncMock(spec=AsyncGenerator)
+        mock_blob_repository.get.return_value = file_content
+        mock_file_info_repository.mark_downloaded.side_effect = ConnectionError
+
+        # When/Then
+        with pytest.raises(ConnectionError):
+            await service.get_file("test-id")
+
+        # Then - neither the transfer slot nor the file reader is held
+        assert scheduler.get_stats().active == 0
+        file_content.aclose.assert_called_once()
+
+    async def test_get_file_encoded(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # Given
+        stored_file.variants = {"gzip": 40}
+
+        # When
+        result = await update_file_service.get_file(
+            "test-id", accept_encoding="gzip, deflate"
+        )
+
+        # Then - the pre-compressed variant is served
+        assert result.status_code == status.HTTP_200_OK
+        assert result.headers["Content-Encoding"] == "gzip"
+        assert result.headers["Vary"] == "Accept-Encoding"
+        assert result.headers["ETag"] == '"abc123-gzip"'
+        mock_blob_repository.stat.assert_called_once_with("test-id.gz")
+        mock_blob_repository.get.assert_called_once_with("test-id.gz")
+
+    async def test_get_file_identity_varies(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # Given
+        stored_file.variants = {"gzip": 40}
+
+        # When
+        result = await update_file_service.get_file("test-id", accept_encoding="br")
+
+        # Then
+        assert "Content-Encoding" not in result.headers
+        assert result.headers["Vary"] == "Accept-Encoding"
+        assert result.headers["ETag"] == '"abc123"'
+        mock_blob_repository.get.assert_called_once_with("test-id")
+
+    async def test_get_file_range_identity(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # Given
+        stored_file.variants = {"gzip": 40}
+
+        # When
+        result = await update_file_service.get_file(
+            "test-id", range_header="bytes=60-", accept_encoding="gzip"
+        )
+
+        # Then - the range is of the identity content the chunks are hashed from
+        assert result.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert "Content-Encoding" not in result.headers
+        assert result.headers["Vary"] == "Accept-Encoding"
+        assert result.headers["ETag"] == '"abc123"'
+        mock_blob_repository.get.assert_called_once_with("test-id", 60, 40)
+
+    async def test_get_file_variant_not_found(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+        blob_stat: BLOBStat,
+    ) -> None:
+        # Given
+        stored_file.variants = {"gzip": 40}
+        mock_blob_repository.stat.side_effect = [FileNotFoundError, blob_stat]
+
+        # When
+        result = await update_file_service.get_file("test-id", accept_encoding="gzip")
+
+        # Then - falls back to the identity content
+        assert "Content-Encoding" not in result.headers
         mock_blob_repository.get.assert_called_once_with("test-id")
 
     async def test_get_file_not_found(
         self,
         update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
         mock_blob_repository: AsyncMock,
     ) -> None:
         # Given
-        mock_blob_repository.get.side_effect = FileNotFoundError
+        mock_file_info_repository.get.return_value = None
 
         # When/Then
         with pytest.raises(ApiNotFoundError):
             await update_file_service.get_file("non-existent-id")
+        mock_blob_repository.stat.assert_not_called()
+
+    async def test_get_file_blob_not_found(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # Given
+        mock_blob_repository.stat.side_effect = FileNotFoundError
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await update_file_service.get_file("test-id")
+
+    @pytest.mark.parametrize(
+        "if_none_match,if_modified_since",
+        [
+            pytest.param('"abc123"', None, id="if_none_match"),
+            pytest.param(None, "Sun, 01 Jan 2023 00:00:00 GMT", id="if_modified_since"),
+        ],
+    )
+    async def test_get_file_not_modified(
+        self,
+        update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+        if_none_match: str | None,
+        if_modified_since: str | None,
+    ) -> None:
+        # When
+        result = await update_file_service.get_file(
+            "test-id",
+            if_none_match=if_none_match,
+            if_modified_since=if_modified_since,
+        )
+
+        # Then - answered without touching the blob
+        assert result.status_code == status.HTTP_304_NOT_MODIFIED
+        assert result.content is None
+        assert result.headers["ETag"] == '"abc123"'
+        mock_blob_repository.stat.assert_not_called()
+        mock_file_info_repository.mark_downloaded.assert_not_called()
+        mock_blob_repository.get.assert_not_called()
+
+    async def test_get_file_single_range(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # When - resuming a download from byte 60
+        result = await update_file_service.get_file(
+            "test-id", range_header="bytes=60-", if_range='"abc123"'
+        )
+
+        # Then - only the remaining bytes are read
+        assert result.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert result.headers["Content-Range"] == "bytes 60-99/100"
+        assert result.headers["Content-Length"] == "40"
+        assert (result.offset, result.count) == (60, 40)
+        mock_blob_repository.get.assert_called_once_with("test-id", 60, 40)
+
+    async def test_get_file_multiple_ranges(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # Given
+        async def read(object_id: str, offset: int, length: int):
+            async def chunks():
+                yield bytes(range(offset, offset + length))
+
+            return chunks()
+
+        mock_blob_repository.get.side_effect = read
+
+        # When
+        result = await update_file_service.get_file(
+            "test-id", range_header="bytes=0-1, 98-"
+        )
+        assert result.content is not None
+        body = b"".join([chunk async for chunk in result.content])
+
+        # Then
+        assert result.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert result.media_type.startswith("multipart/byteranges; boundary=")
+        assert result.headers["Content-Length"] == str(len(body))
+        assert b"Content-Range: bytes 0-1/100\r\n\r\n\x00\x01\r\n" in body
+        assert b"Content-Range: bytes 98-99/100\r\n\r\nbc\r\n" in body
+
+    async def test_get_file_multiple_ranges_deleted(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # Given - the file is deleted after the first part is opened
+        first_part = AsyncMock(spec=AsyncGenerator)
+        mock_blob_repository.get.side_effect = [first_part, FileNotFoundError]
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await update_file_service.get_file("test-id", range_header="bytes=0-1, 98-")
+
+        # Then - the opened part does not hold the file
+        first_part.aclose.assert_called_once()
+
+    async def test_get_file_range_not_satisfiable(
+        self,
+        update_file_service: UpdateFileService,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # When/Then
+        with pytest.raises(ApiRangeNotSatisfiableError) as exc_info:
+            await update_file_service.get_file("test-id", range_header="bytes=100-")
+        assert exc_info.value.headers == {"Content-Range": "bytes */100"}
+
+    async def test_get_file_range_with_outdated_if_range(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+    ) -> None:
+        # When - the file has changed since the partial download
+        result = await update_file_service.get_file(
+            "test-id", range_header="bytes=60-", if_range='"outdated"'
+        )
+
+        # Then - the whole file is served
+        assert result.status_code == status.HTTP_200_OK
+        mock_blob_repository.get.assert_called_once_with("test-id")
+
+    async def test_compress(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        mock_executor: MagicMock,
+        stored_file: UpdateFileInfo,
+        blob_stat: BLOBStat,
+    ) -> None:
+        # Given
+        mock_blob_repository.create_derived.return_value = BLOBStat(
+            size=40, modified_at=blob_stat.modified_at
+        )
+        mock_file_info_repository.add_variant.return_value = True
+
+        # When
+        await update_file_service.compress("test-id")
+
+        # Then
+        mock_blob_repository.create_derived.assert_called_once_with(
+            "test-id.gz", ["test-id"], ENCODINGS["gzip"].compress, mock_executor
+        )
+        mock_file_info_repository.add_variant.assert_called_once_with(
+            "test-id", "gzip", 40
+        )
+        mock_blob_repository.delete.assert_not_called()
+
+        # Then - the variant counts towards the byte limit
+        mock_file_info_repository.evict.assert_called_once_with(
+            StorageLimits(max_count=5, max_bytes=1000)
+        )
+
+    async def test_build_patches_evicts_files(
+        self,
+        update_file_service: UpdateFileService,
+        mock_file_info_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+    ) -> None:
+        # Given - the patches exceed the byte limit
+        mock_file_info_repository.evict.return_value = UpdateFileEviction(
+            file_ids=["id-1"]
+        )
+
+        # When
+        await update_file_service.build_patches("test-id")
+
+        # Then
+        mock_patch_service.build_patches.assert_called_once_with("test-id")
+        mock_file_info_repository.evict.assert_called_once_with(
+            StorageLimits(max_count=5, max_bytes=1000)
+        )
+        mock_blob_repository.delete.assert_any_call("id-1")
+
+    async def test_compress_no_gain(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+        blob_stat: BLOBStat,
+    ) -> None:
+        # Given - saves less than 10%
+        mock_blob_repository.create_derived.return_value = BLOBStat(
+            size=95, modified_at=blob_stat.modified_at
+        )
+
+        # When
+        await update_file_service.compress("test-id")
+
+        # Then
+        mock_blob_repository.delete.assert_called_once_with("test-id.gz")
+        mock_file_info_repository.add_variant.assert_not_called()
+
+    async def test_compress_file_deleted(
+        self,
+        update_file_service: UpdateFileService,
+        mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        stored_file: UpdateFileInfo,
+        blob_stat: BLOBStat,
+    ) -> None:
+        # Given - the file info is deleted while compressing
+        mock_blob_repository.create_derived.return_value = BLOBStat(
+            size=40, modified_at=blob_stat.modified_at
+        )
+        mock_file_info_repository.add_variant.return_value = False
+
+        # When
+        await update_file_service.compress("test-id")
+
+        # Then
+        mock_blob_repository.delete.assert_called_once_with("test-id.gz")
 
     async def test_delete_file_success(
         self,
         update_file_service: UpdateFileService,
         mock_blob_repository: AsyncMock,
+        mock_job_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
     ) -> None:
         # When
         await update_file_service.delete_file("test-id")
 
-        # Then
-        mock_blob_repository.delete.assert_called_once_with("test-id")
+        # Then - the jobs and the patches from and to the file are deleted
+        mock_job_repository.delete_for_file.assert_called_once_with("test-id")
+        mock_patch_service.delete_for_file.assert_called_once_with("test-id")
+
+        # Then - along with the pre-compressed variants
+        mock_blob_repository.delete.assert_has_calls(
+            [call("test-id"), call("test-id.gz")]
+        )
 
     async def test_delete_file_not_found(
         self,
@@ -182,101 +922,89 @@ class TestUpdateFileService:
         # Then - no exception is raised
         await update_file_service.delete_file("non-existent-id")
 
-    async def test_ensure_capacity_under_limit(
+    def test_get_cache_stats_without_cache(
         self,
         update_file_service: UpdateFileService,
-        mock_file_info_repository: AsyncMock,
-        sample_file_info: UpdateFileInfo,
+        mock_blob_repository: AsyncMock,
     ) -> None:
         # Given
-        mock_file_info_repository.get_all.return_value = [sample_file_info]
+        mock_blob_repository.get_cache_stats = MagicMock(return_value=None)
 
         # When
-        await update_file_service._ensure_capacity()
+        result = update_file_service.get_cache_stats()
 
-        # Then - no deletions should occur
-        mock_file_info_repository.delete.assert_not_called()
+        # Then
+        assert result == UpdateFileCacheStats()
 
-    async def test_ensure_capacity_at_exact_capacity(
+    async def test_create_evicts_files(
         self,
         update_file_service: UpdateFileService,
         mock_file_info_repository: AsyncMock,
         mock_blob_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+        mock_upload_file: MagicMock,
+        sample_file_info: UpdateFileInfo,
     ) -> None:
-        # Given - 5 files, capacity is 5 (exactly at capacity)
-        files: list[UpdateFileInfo] = [
-            UpdateFileInfo(
-                id=f"id-{i}",
-                name=f"file-{i}.txt",
-                size=100,
-                comment=None,
-                created_at=datetime.fromisoformat(f"2023-01-{i + 1:02d}T00:00:00"),
-            )
-            for i in range(5)
-        ]
-        mock_file_info_repository.get_all.return_value = files
-
-        # Reset any previous calls to the mock
-        mock_blob_repository.reset_mock()
-        mock_file_info_repository.reset_mock()
+        # Given - files are evicted along with the creation of the file info
+        mock_file_info_repository.create.return_value = (
+            sample_file_info,
+            UpdateFileEviction(file_ids=["id-1", "id-2"], patches=[("id-1", "id-2")]),
+        )
 
         # When
-        await update_file_service._ensure_capacity()
+        await update_file_service.create(mock_upload_file, None)
 
-        # Then - when exactly at capacity, should delete the oldest file to make space for a new one
-        # files_to_remove = 5 - 5 + 1 = 1
-        mock_blob_repository.delete.assert_called_once_with("id-4")
-        mock_file_info_repository.delete.assert_called_once_with("id-4")
+        # Then - only the blobs are left to delete
+        mock_blob_repository.delete.assert_any_call("id-1")
+        mock_blob_repository.delete.assert_any_call("id-2.gz")
+        mock_patch_service.delete_blobs.assert_called_once_with([("id-1", "id-2")])
+        mock_file_info_repository.delete.assert_not_called()
 
-    async def test_ensure_capacity_over_limit(
+    async def test_create_without_byte_limit(
         self,
-        update_file_service: UpdateFileService,
-        mock_file_info_repository: AsyncMock,
         mock_blob_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        mock_job_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+        mock_scheduler: AsyncMock,
+        mock_executor: MagicMock,
+        mock_config: MagicMock,
+        mock_logger: MagicMock,
     ) -> None:
-        # Given - 6 files, capacity is 5
-        files: list[UpdateFileInfo] = [
-            UpdateFileInfo(
-                id=f"id-{i}",
-                name=f"file-{i}.txt",
-                size=100,
-                comment=None,
-                created_at=datetime.fromisoformat(f"2023-01-{i + 1:02d}T00:00:00"),
-            )
-            for i in range(6)
-        ]
-        mock_file_info_repository.get_all.return_value = files
+        # Given
+        mock_config.file_storage_capacity_bytes = 0
 
         # When
-        await update_file_service._ensure_capacity()
+        service = UpdateFileService(
+            repository=mock_blob_repository,
+            file_info_repository=mock_file_info_repository,
+            job_repository=mock_job_repository,
+            patch_service=mock_patch_service,
+            scheduler=mock_scheduler,
+            executor=mock_executor,
+            config=mock_config,
+            logger=mock_logger,
+        )
+
+        # Then
+        assert service.storage_limits == StorageLimits(max_count=5)
 
-        # Then - should delete the two oldest files to make space for one new file
-        # files_to_remove = 6 - 5 + 1 = 2
-        mock_blob_repository.delete.assert_called_with("id-5")
-        mock_file_info_repository.delete.assert_called_with("id-5")
+        # Then - the variants and patches cannot exceed the count limit
+        await service.evict_over_limits()
+        mock_file_info_repository.evict.assert_not_called()
 
-    async def test_ensure_capacity_with_missing_blob(
+    async def test_delete_evicted_with_missing_blob(
         self,
         update_file_service: UpdateFileService,
-        mock_file_info_repository: AsyncMock,
         mock_blob_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
     ) -> None:
-        # Given - 6 files, capacity is 5, but the blob is missing
-        files: list[UpdateFileInfo] = [
-            UpdateFileInfo(
-                id=f"id-{i}",
-                name=f"file-{i}.txt",
-                size=100,
-                comment=None,
-                created_at=datetime.fromisoformat(f"2023-01-{i + 1:02d}T00:00:00"),
-            )
-            for i in range(6)
-        ]
-        mock_file_info_repository.get_all.return_value = files
+        # Given - the blob is missing
         mock_blob_repository.delete.side_effect = FileNotFoundError
 
         # When
-        await update_file_service._ensure_capacity()
+        await update_file_service.delete_evicted(UpdateFileEviction(file_ids=["id-5"]))
 
-        # Then - should still delete the file info record
-        mock_file_info_repository.delete.assert_called_with("id-5")
+        # Then - the variants are still deleted
+        mock_blob_repository.delete.assert_any_call("id-5")
+        mock_blob_repository.delete.assert_any_call("id-5.gz")
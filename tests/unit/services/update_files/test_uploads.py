@@ -0,0 +1,387 @@
+from collections.abc import AsyncIterator
+from datetime import datetime
+from logging import Logger
+from unittest.mock import ANY, AsyncMock, MagicMock
+
+import pytest
+
+from app.api.errors import (
+    ApiConflictError,
+    ApiNotFoundError,
+    ApiRequestEntityTooLargeError,
+    WrongDataError,
+)
+from app.models.update_file import (
+    StorageLimits,
+    UpdateFileChunks,
+    UpdateFileEviction,
+    UpdateFileInfo,
+    UpdateFileInfoToCreate,
+)
+from app.models.update_file_upload import (
+    UpdateFileUploadInfo,
+    UpdateFileUploadToCreate,
+)
+from app.services.update_files.service import UpdateFileService
+from app.services.update_files.storage.interfaces import (
+    BLOBConflictError,
+    BLOBDigest,
+    BLOBRepositoryInterface,
+    BLOBSizeLimitError,
+    BLOBStat,
+)
+from app.services.update_files.storage.upload_repository import (
+    UpdateFileUploadRepository,
+)
+from app.services.update_files.uploads import UpdateFileUploadService
+from app.settings import AppSettings
+
+CREATED_AT = datetime.fromisoformat("2023-01-01T00:00:00Z")
+
+
+@pytest.fixture
+def mock_repository() -> AsyncMock:
+    return AsyncMock(spec=UpdateFileUploadRepository)
+
+
+@pytest.fixture
+def mock_blob_repository() -> AsyncMock:
+    return AsyncMock(spec=BLOBRepositoryInterface)
+
+
+@pytest.fixture
+def mock_file_service() -> AsyncMock:
+    file_service = AsyncMock(spec=UpdateFileService)
+    file_service.storage_limits = StorageLimits(max_count=5)
+    return file_service
+
+
+@pytest.fixture
+def mock_config() -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.file_max_upload_size = 0
+    config.file_upload_ttl = 3600
+    return config
+
+
+@pytest.fixture
+def mock_logger() -> MagicMock:
+    return MagicMock(spec=Logger)
+
+
+@pytest.fixture
+def upload_service(
+    mock_repository: AsyncMock,
+    mock_blob_repository: AsyncMock,
+    mock_file_service: AsyncMock,
+    mock_config: MagicMock,
+    mock_logger: MagicMock,
+) -> UpdateFileUploadService:
+    return UpdateFileUploadService(
+        repository=mock_repository,
+        blob_repository=mock_blob_repository,
+        file_service=mock_file_service,
+        config=mock_config,
+        logger=mock_logger,
+    )
+
+
+@pytest.fixture
+def upload() -> UpdateFileUploadInfo:
+    return UpdateFileUploadInfo(
+        id="upload-id",
+        created_at=CREATED_AT,
+        updated_at=CREATED_AT,
+        name="test-file.bin",
+        comment="Test comment",
+        version="1.0",
+        length=10,
+    )
+
+
+async def content() -> AsyncIterator[bytes]:
+    yield b"0123456789"
+
+
+class TestUpdateFileUploadService:
+    async def test_create(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_file_service: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given
+        mock_repository.create.return_value = upload
+
+        # When
+        result = await upload_service.create("test-file.bin", None, "v1.0", 10)
+
+        # Then - the declared length is checked up front
+        assert result == upload
+        mock_file_service.check_upload_size.assert_called_once_with(10)
+        mock_repository.create.assert_called_once_with(
+            UpdateFileUploadToCreate(name="test-file.bin", version="1.0", length=10)
+        )
+
+    async def test_create_with_invalid_version(
+        self, upload_service: UpdateFileUploadService, mock_repository: AsyncMock
+    ) -> None:
+        # When/Then
+        with pytest.raises(WrongDataError):
+            await upload_service.create("test-file.bin", None, "latest")
+        mock_repository.create.assert_not_called()
+
+    async def test_get_offset(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = upload
+        mock_blob_repository.stat.return_value = BLOBStat(
+            size=4, modified_at=CREATED_AT
+        )
+
+        # When
+        result = await upload_service.get("upload-id")
+
+        # Then
+        assert result.offset == 4
+        mock_blob_repository.stat.assert_called_once_with("upload-id.upload")
+
+    async def test_get_nothing_received(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = upload
+        mock_blob_repository.stat.side_effect = FileNotFoundError
+
+        # When
+        result = await upload_service.get("upload-id")
+
+        # Then
+        assert result.offset == 0
+
+    async def test_get_not_found(
+        self, upload_service: UpdateFileUploadService, mock_repository: AsyncMock
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = None
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await upload_service.get("upload-id")
+
+    async def test_append(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = upload
+        mock_blob_repository.append.return_value = 10
+        chunk = content()
+
+        # When
+        offset = await upload_service.append("upload-id", 0, chunk)
+
+        # Then - the declared length limits the upload
+        assert offset == 10
+        mock_blob_repository.append.assert_called_once_with(
+            "upload-id.upload", chunk, 0, 10
+        )
+        mock_repository.touch.assert_called_once_with("upload-id")
+
+    @pytest.mark.parametrize(
+        "error, expected",
+        [
+            (BLOBConflictError, ApiConflictError),
+            (FileNotFoundError, ApiConflictError),
+            (BLOBSizeLimitError, ApiRequestEntityTooLargeError),
+        ],
+    )
+    async def test_append_errors(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        upload: UpdateFileUploadInfo,
+        error: type[Exception],
+        expected: type[Exception],
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = upload
+        mock_blob_repository.append.side_effect = error
+
+        # When/Then
+        with pytest.raises(expected):
+            await upload_service.append("upload-id", 5, content())
+
+        # Then - the upload is still alive
+        mock_repository.touch.assert_called_once_with("upload-id")
+
+    async def test_finalize(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        mock_file_service: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = upload
+        mock_blob_repository.stat.return_value = BLOBStat(
+            size=10, modified_at=CREATED_AT
+        )
+        mock_blob_repository.seal.return_value = BLOBDigest(
+            size=10, sha256="abc123", chunk_size=4, chunk_sha256=["a", "b", "c"]
+        )
+        file_info = UpdateFileInfo(id="file-id", created_at=CREATED_AT)
+        eviction = UpdateFileEviction(file_ids=["old-id"])
+        mock_repository.finalize.return_value = (file_info, eviction)
+
+        # When
+        result = await upload_service.finalize("upload-id")
+
+        # Then
+        assert result == file_info
+        mock_file_service.delete_evicted.assert_called_once_with(eviction)
+        mock_blob_repository.seal.assert_called_once_with("upload-id.upload", ANY)
+        object_id = mock_blob_repository.seal.call_args.args[1]
+        mock_repository.finalize.assert_called_once_with(
+            "upload-id",
+            object_id,
+            UpdateFileInfoToCreate(
+                name="test-file.bin",
+                size=10,
+                comment="Test comment",
+                sha256="abc123",
+                version="1.0",
+            ),
+            UpdateFileChunks(chunk_size=4, sha256=["a", "b", "c"]),
+            StorageLimits(max_count=5),
+            ["verify", "compress", "build_patches"],
+        )
+
+    async def test_finalize_incomplete(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = upload
+        mock_blob_repository.stat.return_value = BLOBStat(
+            size=4, modified_at=CREATED_AT
+        )
+
+        # When/Then
+        with pytest.raises(ApiConflictError):
+            await upload_service.finalize("upload-id")
+        mock_blob_repository.seal.assert_not_called()
+
+    async def test_finalize_concurrently(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given - the upload is finalized by another request meanwhile
+        mock_repository.get.return_value = upload.model_copy(update={"length": None})
+        mock_blob_repository.stat.return_value = BLOBStat(
+            size=10, modified_at=CREATED_AT
+        )
+        mock_blob_repository.seal.return_value = BLOBDigest(
+            size=10, sha256="abc123", chunk_size=4, chunk_sha256=["a", "b", "c"]
+        )
+        mock_repository.finalize.return_value = None
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await upload_service.finalize("upload-id")
+
+        # Then - the sealed object is not left behind
+        object_id = mock_blob_repository.seal.call_args.args[1]
+        mock_blob_repository.delete.assert_called_once_with(object_id)
+
+    async def test_finalize_failed(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        upload: UpdateFileUploadInfo,
+    ) -> None:
+        # Given - the file info cannot be stored
+        mock_repository.get.return_value = upload
+        mock_blob_repository.stat.return_value = BLOBStat(
+            size=10, modified_at=CREATED_AT
+        )
+        mock_blob_repository.seal.return_value = BLOBDigest(
+            size=10, sha256="abc123", chunk_size=4, chunk_sha256=["a", "b", "c"]
+        )
+        mock_repository.finalize.side_effect = ConnectionError
+
+        # When/Then
+        with pytest.raises(ConnectionError):
+            await upload_service.finalize("upload-id")
+
+        # Then - the data is back in the upload for a retry
+        object_id = mock_blob_repository.seal.call_args.args[1]
+        mock_blob_repository.unseal.assert_called_once_with(
+            object_id, "upload-id.upload"
+        )
+        mock_blob_repository.delete.assert_not_called()
+
+    async def test_delete(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.delete.return_value = True
+        mock_blob_repository.delete.side_effect = FileNotFoundError
+
+        # When
+        await upload_service.delete("upload-id")
+
+        # Then
+        mock_blob_repository.delete.assert_called_once_with("upload-id.upload")
+
+    async def test_delete_not_found(
+        self, upload_service: UpdateFileUploadService, mock_repository: AsyncMock
+    ) -> None:
+        # Given
+        mock_repository.delete.return_value = False
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await upload_service.delete("upload-id")
+
+    async def test_collect_stale(
+        self,
+        upload_service: UpdateFileUploadService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.delete_stale.return_value = ["first", "second"]
+
+        # When
+        dropped = await upload_service.collect_stale()
+
+        # Then
+        assert dropped == 2
+        mock_blob_repository.delete.assert_any_call("first.upload")
+        mock_blob_repository.delete.assert_any_call("second.upload")
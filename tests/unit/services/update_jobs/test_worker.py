@@ -0,0 +1,174 @@
+import asyncio
+from datetime import datetime, timedelta
+from logging import Logger
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.models.update_job import UpdateJobInfo, UpdateJobStatus
+from app.services.update_jobs.storage.repository import UpdateJobRepository
+from app.services.update_jobs.worker import UpdateJobWorker
+from app.settings import AppSettings
+
+CREATED_AT = datetime.fromisoformat("2023-01-01T00:00:00Z")
+
+
+@pytest.fixture
+def mock_repository() -> AsyncMock:
+    repository = AsyncMock(spec=UpdateJobRepository)
+    repository.claim.return_value = None
+    return repository
+
+
+@pytest.fixture
+def mock_handler() -> AsyncMock:
+    return AsyncMock()
+
+
+@pytest.fixture
+def mock_config() -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.job_workers = 1
+    config.job_poll_interval = 0.01
+    config.job_lease_timeout = 300
+    config.job_max_attempts = 3
+    config.job_retry_delay = 10
+    return config
+
+
+@pytest.fixture
+def mock_logger() -> MagicMock:
+    return MagicMock(spec=Logger)
+
+
+@pytest.fixture
+def worker(
+    mock_repository: AsyncMock,
+    mock_handler: AsyncMock,
+    mock_config: MagicMock,
+    mock_logger: MagicMock,
+) -> UpdateJobWorker:
+    return UpdateJobWorker(
+        repository=mock_repository,
+        handlers={"compress": mock_handler},
+        config=mock_config,
+        logger=mock_logger,
+    )
+
+
+def make_job(kind: str = "compress", attempts: int = 1) -> UpdateJobInfo:
+    return UpdateJobInfo(
+        id="job-id",
+        file_id="file-id",
+        kind=kind,
+        status=UpdateJobStatus.RUNNING,
+        attempts=attempts,
+        created_at=CREATED_AT,
+        updated_at=CREATED_AT,
+        run_at=CREATED_AT,
+    )
+
+
+class TestUpdateJobWorker:
+    async def test_run_next(
+        self,
+        worker: UpdateJobWorker,
+        mock_repository: AsyncMock,
+        mock_handler: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.claim.return_value = make_job()
+
+        # When
+        result = await worker.run_next()
+
+        # Then
+        assert result is True
+        mock_repository.claim.assert_called_once_with(timedelta(seconds=300), 3)
+        mock_handler.assert_called_once_with("file-id")
+        mock_repository.complete.assert_called_once_with("job-id")
+
+    async def test_run_next_empty(
+        self, worker: UpdateJobWorker, mock_handler: AsyncMock
+    ) -> None:
+        # When
+        result = await worker.run_next()
+
+        # Then
+        assert result is False
+        mock_handler.assert_not_called()
+
+    async def test_run_next_retries_with_backoff(
+        self,
+        worker: UpdateJobWorker,
+        mock_repository: AsyncMock,
+        mock_handler: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.claim.return_value = make_job(attempts=2)
+        mock_handler.side_effect = OSError("Disk error")
+
+        # When
+        await worker.run_next()
+
+        # Then - the delay is doubled for each attempt
+        mock_repository.retry.assert_called_once_with(
+            "job-id", timedelta(seconds=20), "OSError: Disk error"
+        )
+        mock_repository.complete.assert_not_called()
+
+    async def test_run_next_fails_after_max_attempts(
+        self,
+        worker: UpdateJobWorker,
+        mock_repository: AsyncMock,
+        mock_handler: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.claim.return_value = make_job(attempts=3)
+        mock_handler.side_effect = OSError("Disk error")
+
+        # When
+        await worker.run_next()
+
+        # Then
+        mock_repository.fail.assert_called_once_with("job-id", "OSError: Disk error")
+        mock_repository.retry.assert_not_called()
+
+    async def test_run_next_unknown_kind(
+        self, worker: UpdateJobWorker, mock_repository: AsyncMock
+    ) -> None:
+        # Given
+        mock_repository.claim.return_value = make_job(kind="unknown", attempts=3)
+
+        # When
+        await worker.run_next()
+
+        # Then
+        mock_repository.fail.assert_called_once()
+
+    async def test_stop_releases_running_job(
+        self,
+        worker: UpdateJobWorker,
+        mock_repository: AsyncMock,
+        mock_handler: AsyncMock,
+    ) -> None:
+        # Given
+        started = asyncio.Event()
+
+        async def handle(file_id: str) -> None:
+            started.set()
+            await asyncio.sleep(60)
+
+        mock_repository.claim.side_effect = [make_job(), None]
+        mock_handler.side_effect = handle
+        worker.start()
+        await started.wait()
+
+        # When
+        await worker.stop()
+
+        # Then - the job is run again without waiting for its lease to expire
+        mock_repository.retry.assert_called_once_with(
+            "job-id", timedelta(0), "Interrupted"
+        )
+        mock_repository.complete.assert_not_called()
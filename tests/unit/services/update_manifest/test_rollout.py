@@ -0,0 +1,104 @@
+from datetime import datetime
+
+import pytest
+
+from app.models.update_manifest import UpdateManifest
+from app.services.update_manifest.rollout import (
+    ANONYMOUS_CLIENT_ID,
+    BUCKETS,
+    Rollout,
+    client_bucket,
+)
+
+PUBLISHED_AT = datetime.fromisoformat("2023-01-01T00:00:00Z")
+
+
+def make_manifest(percentage: float, ramp_seconds: int = 0) -> UpdateManifest:
+    return UpdateManifest(
+        version="1.0.0",
+        url="https://example.com/app-1.0.0.zip",
+        rollout_percentage=percentage,
+        rollout_ramp_seconds=ramp_seconds,
+        published_at=PUBLISHED_AT,
+    )
+
+
+class TestRollout:
+    def test_full_rollout(self) -> None:
+        # When/Then
+        assert Rollout.of(make_manifest(100)) is None
+
+    @pytest.mark.parametrize(
+        "elapsed, expected",
+        [
+            pytest.param(-10, 0, id="before_start"),
+            pytest.param(0, 0, id="start"),
+            pytest.param(1800, 25, id="halfway"),
+            pytest.param(3600, 50, id="end"),
+            pytest.param(7200, 50, id="after_end"),
+        ],
+    )
+    def test_ramp(self, elapsed: int, expected: float) -> None:
+        # Given
+        rollout = Rollout.of(make_manifest(50, ramp_seconds=3600))
+        assert rollout is not None
+
+        # When
+        result = rollout.percentage_at(PUBLISHED_AT.timestamp() + elapsed)
+
+        # Then
+        assert result == expected
+
+    def test_admits_stable_share(self) -> None:
+        # Given
+        narrow = Rollout.of(make_manifest(10))
+        wide = Rollout.of(make_manifest(40))
+        assert narrow is not None and wide is not None
+        client_ids = [f"client-{i}" for i in range(2000)]
+        now = PUBLISHED_AT.timestamp()
+
+        # When
+        narrow_admitted = {id for id in client_ids if narrow.admits(id, now)}
+        wide_admitted = {id for id in client_ids if wide.admits(id, now)}
+
+        # Then - widening keeps the clients admitted before
+        assert 150 < len(narrow_admitted) < 250
+        assert 700 < len(wide_admitted) < 900
+        assert narrow_admitted <= wide_admitted
+
+    def test_nothing_admitted(self) -> None:
+        # Given
+        rollout = Rollout.of(make_manifest(0))
+        assert rollout is not None
+
+        # When/Then
+        assert not any(
+            rollout.admits(f"client-{i}", PUBLISHED_AT.timestamp()) for i in range(100)
+        )
+
+    @pytest.mark.parametrize(
+        "elapsed, expected",
+        [
+            pytest.param(1800, False, id="ramping"),
+            pytest.param(3600, True, id="ramped"),
+        ],
+    )
+    def test_admits_anonymous_once_full(self, elapsed: int, expected: bool) -> None:
+        # Given
+        rollout = Rollout.of(make_manifest(100, ramp_seconds=3600))
+        assert rollout is not None
+
+        # When
+        result = rollout.admits(ANONYMOUS_CLIENT_ID, PUBLISHED_AT.timestamp() + elapsed)
+
+        # Then
+        assert result is expected
+
+    def test_client_bucket(self) -> None:
+        # When
+        bucket = client_bucket("client", "salt")
+
+        # Then - deterministic, and salted
+        assert 0 <= bucket < BUCKETS
+        assert client_bucket("client", "salt") == bucket
+        assert client_bucket("client", "other salt") != bucket
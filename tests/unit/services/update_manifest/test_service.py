@@ -1,19 +1,56 @@
+from datetime import datetime
 from logging import Logger
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from packaging.version import Version
 
-from app.api.errors import ApiForbiddenError, ApiNotFoundError, WrongDataError
-from app.models.update_manifest import UpdateManifest
-from app.services.update_manifest.service import UpdateManifestService
+from app.api.errors import (
+    ApiConflictError,
+    ApiForbiddenError,
+    ApiNotFoundError,
+    WrongDataError,
+)
+from app.models.update_manifest import (
+    ClientUpdateManifest,
+    UpdateManifest,
+    UpdateManifestKey,
+    UpdateManifestRule,
+    UpdateManifestRuleToCreate,
+)
+from app.models.update_patch import UpdatePatchInfo
+from app.services.update_manifest.service import (
+    ANSWERS_CACHE_SIZE,
+    CachedManifest,
+    ManifestTargets,
+    UpdateManifestService,
+)
 from app.services.update_manifest.storage.interface import (
     UpdateManifestRepositoryInterface,
 )
+from app.services.update_patches.service import UpdatePatchService
+from app.settings import AppSettings
 
 
 @pytest.fixture
 def mock_repository() -> AsyncMock:
-    return AsyncMock(spec=UpdateManifestRepositoryInterface)
+    repository = AsyncMock(spec=UpdateManifestRepositoryInterface)
+    repository.get_rules.return_value = []
+    return repository
+
+
+@pytest.fixture
+def mock_patch_service() -> AsyncMock:
+    service = AsyncMock(spec=UpdatePatchService)
+    service.find_patch.return_value = None
+    return service
+
+
+@pytest.fixture
+def mock_config() -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.manifest_cache_ttl = 30
+    return config
 
 
 @pytest.fixture
@@ -23,10 +60,15 @@ def mock_logger() -> MagicMock:
 
 @pytest.fixture
 def update_manifest_service(
-    mock_repository: AsyncMock, mock_logger: MagicMock
+    mock_repository: AsyncMock,
+    mock_patch_service: AsyncMock,
+    mock_config: MagicMock,
+    mock_logger: MagicMock,
 ) -> UpdateManifestService:
     return UpdateManifestService(
         repository=mock_repository,
+        patch_service=mock_patch_service,
+        config=mock_config,
         logger=mock_logger,
     )
 
@@ -47,6 +89,20 @@ def newer_manifest() -> UpdateManifest:
     )
 
 
+def make_rule(
+    version: str, min_version: str | None, max_version: str | None, **key: str
+) -> UpdateManifestRule:
+    return UpdateManifestRule(
+        id=f"rule-{version}",
+        created_at=datetime.fromisoformat("2023-01-01T00:00:00Z"),
+        version=version,
+        url=f"https://example.com/app-{version}.zip",
+        min_version=min_version,
+        max_version=max_version,
+        **key,
+    )
+
+
 class TestUpdateManifestService:
     async def test_set_first_manifest(
         self,
@@ -60,8 +116,13 @@ class TestUpdateManifestService:
         # When
         await update_manifest_service.set(sample_manifest)
 
-        # Then
-        mock_repository.set.assert_called_once_with(sample_manifest)
+        # Then - published now
+        mock_repository.get.assert_called_once_with(UpdateManifestKey())
+        stored = mock_repository.set.call_args.args[0]
+        assert stored.model_dump(exclude={"published_at"}) == (
+            sample_manifest.model_dump(exclude={"published_at"})
+        )
+        assert stored.published_at is not None
 
     async def test_set_newer_version(
         self,
@@ -77,7 +138,8 @@ class TestUpdateManifestService:
         await update_manifest_service.set(newer_manifest)
 
         # Then
-        mock_repository.set.assert_called_once_with(newer_manifest)
+        mock_repository.set.assert_called_once()
+        assert mock_repository.set.call_args.args[0].version == "1.1.0"
 
     async def test_set_older_version(
         self,
@@ -96,6 +158,44 @@ class TestUpdateManifestService:
         # Then
         mock_repository.set.assert_not_called()
 
+    async def test_set_same_version_rollout(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the version is being rolled out
+        published_at = datetime.fromisoformat("2023-01-01T00:00:00Z")
+        mock_repository.get.return_value = sample_manifest.model_copy(
+            update={"rollout_percentage": 10, "published_at": published_at}
+        )
+        manifest = sample_manifest.model_copy(update={"rollout_percentage": 50})
+
+        # When
+        await update_manifest_service.set(manifest)
+
+        # Then - the rollout is widened, the ramp start is kept
+        stored = mock_repository.set.call_args.args[0]
+        assert stored.rollout_percentage == 50
+        assert stored.published_at == published_at
+
+    async def test_set_same_version_other_url(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = sample_manifest
+        manifest = sample_manifest.model_copy(
+            update={"url": "https://example.com/app-rebuilt.zip"}
+        )
+
+        # When/Then
+        with pytest.raises(ApiConflictError):
+            await update_manifest_service.set(manifest)
+        mock_repository.set.assert_not_called()
+
     async def test_set_invalid_version(
         self,
         update_manifest_service: UpdateManifestService,
@@ -121,7 +221,7 @@ class TestUpdateManifestService:
         sample_manifest: UpdateManifest,
     ) -> None:
         # Given
-        mock_repository.get.return_value = sample_manifest
+        mock_repository.get_all.return_value = [sample_manifest]
 
         # When/Then
         with pytest.raises(TypeError):
@@ -134,7 +234,7 @@ class TestUpdateManifestService:
         sample_manifest: UpdateManifest,
     ) -> None:
         # Given
-        mock_repository.get.return_value = sample_manifest
+        mock_repository.get_all.return_value = [sample_manifest]
 
         # When/Then
         with pytest.raises(ApiNotFoundError):
@@ -147,7 +247,7 @@ class TestUpdateManifestService:
         sample_manifest: UpdateManifest,
     ) -> None:
         # Given
-        mock_repository.get.return_value = sample_manifest
+        mock_repository.get_all.return_value = [sample_manifest]
 
         # When/Then
         with pytest.raises(ApiNotFoundError):
@@ -160,13 +260,44 @@ class TestUpdateManifestService:
         newer_manifest: UpdateManifest,
     ) -> None:
         # Given
-        mock_repository.get.return_value = newer_manifest
+        mock_repository.get_all.return_value = [newer_manifest]
+
+        # When
+        result = await update_manifest_service.get("1.0.0")
+
+        # Then
+        assert result == ClientUpdateManifest(**newer_manifest.model_dump())
+        assert result.patch_url is None
+
+    async def test_get_manifest_with_patch(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given
+        mock_repository.get_all.return_value = [newer_manifest]
+        patch = UpdatePatchInfo(
+            source_id="source-id",
+            target_id="target-id",
+            size=10,
+            created_at=datetime.fromisoformat("2023-01-01T00:00:00Z"),
+        )
+        mock_patch_service.find_patch.return_value = patch
+        mock_patch_service.get_patch_url = MagicMock(
+            return_value="/update-patches/source-id/target-id"
+        )
 
         # When
         result = await update_manifest_service.get("1.0.0")
 
         # Then
-        assert result == newer_manifest
+        mock_patch_service.find_patch.assert_called_once_with(
+            "1.0.0", "https://example.com/app-1.1.0.zip"
+        )
+        assert result.patch_url == "/update-patches/source-id/target-id"
+        assert result.patch_size == 10
 
     async def test_delete(
         self,
@@ -177,4 +308,524 @@ class TestUpdateManifestService:
         await update_manifest_service.delete()
 
         # Then
-        mock_repository.delete.assert_called_once()
+        mock_repository.delete.assert_called_once_with(UpdateManifestKey())
+
+    async def test_get_manifest_cached(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+    ) -> None:
+        # Given
+        mock_repository.get_all.return_value = [sample_manifest]
+
+        # When
+        for _ in range(3):
+            with pytest.raises(ApiNotFoundError):
+                await update_manifest_service.get("1.0.0")
+
+        # Then - the manifest is read once
+        mock_repository.get_all.assert_called_once()
+
+    async def test_get_no_manifest_cached(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.get_all.return_value = []
+
+        # When
+        for _ in range(2):
+            with pytest.raises(ApiNotFoundError):
+                await update_manifest_service.get("1.0.0")
+
+        # Then - the absence is cached as well
+        mock_repository.get_all.assert_called_once()
+
+    async def test_get_manifest_cache_expired(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        mock_config: MagicMock,
+        sample_manifest: UpdateManifest,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the manifest is changed by another process
+        mock_config.manifest_cache_ttl = 0
+        service = UpdateManifestService(
+            repository=mock_repository,
+            patch_service=AsyncMock(spec=UpdatePatchService),
+            config=mock_config,
+            logger=MagicMock(spec=Logger),
+        )
+        mock_repository.get_all.return_value = [sample_manifest]
+        with pytest.raises(ApiNotFoundError):
+            await service.get("1.0.0")
+        mock_repository.get_all.return_value = [newer_manifest]
+
+        # When
+        result = await service.get("1.0.0")
+
+        # Then
+        assert result.version == "1.1.0"
+        assert mock_repository.get_all.call_count == 2
+
+    async def test_set_updates_cache(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the current manifest is cached
+        mock_repository.get_all.return_value = [sample_manifest]
+        mock_repository.get.return_value = sample_manifest
+        with pytest.raises(ApiNotFoundError):
+            await update_manifest_service.get("1.0.0")
+
+        # When
+        await update_manifest_service.set(newer_manifest)
+        result = await update_manifest_service.get("1.0.0")
+
+        # Then - the new manifest is served without reading it back
+        assert result.version == "1.1.0"
+        mock_repository.get_all.assert_called_once()
+
+    async def test_delete_updates_cache(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the current manifest is cached
+        mock_repository.get_all.return_value = [newer_manifest]
+        await update_manifest_service.get("1.0.0")
+
+        # When
+        await update_manifest_service.delete()
+
+        # Then
+        with pytest.raises(ApiNotFoundError):
+            await update_manifest_service.get("1.0.0")
+        mock_repository.get_all.assert_called_once()
+
+    async def test_get_manifest_loaded_during_set(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the manifest is replaced while the old one is being read
+        async def get_replaced() -> list[UpdateManifest]:
+            mock_repository.get_all.side_effect = None
+            mock_repository.get_all.return_value = [newer_manifest]
+            mock_repository.get.return_value = sample_manifest
+            await update_manifest_service.set(newer_manifest)
+            return [sample_manifest]
+
+        mock_repository.get_all.side_effect = get_replaced
+
+        # When
+        with pytest.raises(ApiNotFoundError):
+            await update_manifest_service.get("1.0.0")
+        result = await update_manifest_service.get("1.0.0")
+
+        # Then - the old manifest read is not cached over the new one
+        assert result.version == "1.1.0"
+
+    async def test_get_answer(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given
+        mock_repository.get_all.return_value = [newer_manifest]
+
+        # When
+        answer = await update_manifest_service.get_answer("1.0.0")
+        same_answer = await update_manifest_service.get_answer("1.0")
+
+        # Then - serialized once for the equal versions
+        assert ClientUpdateManifest.model_validate_json(answer.body) == (
+            ClientUpdateManifest(**newer_manifest.model_dump())
+        )
+        assert b"patch_url" not in answer.body
+        assert answer.etag.startswith('"') and answer.etag.endswith('"')
+        assert same_answer is answer
+        mock_patch_service.find_patch.assert_called_once()
+
+    async def test_get_answer_not_found(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+        sample_manifest: UpdateManifest,
+    ) -> None:
+        # Given
+        mock_repository.get_all.return_value = [sample_manifest]
+
+        # When/Then
+        for _ in range(2):
+            with pytest.raises(ApiNotFoundError):
+                await update_manifest_service.get_answer("1.0.0")
+
+        # Then
+        mock_repository.get_all.assert_called_once()
+
+    async def test_get_answer_replaced_by_set(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given
+        mock_repository.get_all.return_value = [sample_manifest]
+        mock_repository.get.return_value = sample_manifest
+        answer = await update_manifest_service.get_answer("0.9.0")
+
+        # When
+        await update_manifest_service.set(newer_manifest)
+        new_answer = await update_manifest_service.get_answer("0.9.0")
+
+        # Then
+        assert new_answer.etag != answer.etag
+        assert b"1.1.0" in new_answer.body
+
+    async def test_get_answer_cache_bounded(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - more requester versions than the answers kept
+        mock_repository.get_all.return_value = [newer_manifest]
+        for minor in range(ANSWERS_CACHE_SIZE + 1):
+            await update_manifest_service.get_answer(f"0.{minor}")
+
+        # When - the least recently used one is requested again
+        await update_manifest_service.get_answer("0.0")
+
+        # Then - it was dropped and is looked up again
+        assert mock_patch_service.find_patch.call_count == ANSWERS_CACHE_SIZE + 2
+
+    async def test_get_manifest_by_key(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the manifests of several products and channels
+        beta = UpdateManifest(
+            version="2.0.0b1", url="https://example.com/app-2.0.0b1.zip", channel="beta"
+        )
+        other = UpdateManifest(
+            version="5.0.0", url="https://example.com/other-5.0.0.zip", product="other"
+        )
+        mock_repository.get_all.return_value = [sample_manifest, beta, other]
+
+        # When
+        stable_result = await update_manifest_service.get("0.9.0")
+        beta_result = await update_manifest_service.get(
+            "0.9.0", UpdateManifestKey(channel="beta")
+        )
+        other_result = await update_manifest_service.get(
+            "0.9.0", UpdateManifestKey(product="other")
+        )
+
+        # Then - all served from one load
+        assert stable_result.version == "1.0.0"
+        assert beta_result.version == "2.0.0b1"
+        assert other_result.version == "5.0.0"
+        mock_repository.get_all.assert_called_once()
+
+        # When/Then - no manifest for the platform
+        with pytest.raises(ApiNotFoundError):
+            await update_manifest_service.get_answer(
+                "0.9.0", UpdateManifestKey(platform="linux")
+            )
+
+    async def test_get_manifest_by_key_with_patch(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        mock_patch_service: AsyncMock,
+    ) -> None:
+        # Given
+        other = UpdateManifest(
+            version="5.0.0", url="https://example.com/other-5.0.0.zip", product="other"
+        )
+        mock_repository.get_all.return_value = [other]
+        mock_patch_service.find_patch.return_value = UpdatePatchInfo(
+            source_id="source-id",
+            target_id="target-id",
+            size=10,
+            created_at=datetime.fromisoformat("2023-01-01T00:00:00Z"),
+        )
+        mock_patch_service.get_patch_url = MagicMock(
+            return_value="/update-patches/source-id/target-id"
+        )
+
+        # When
+        result = await update_manifest_service.get(
+            "4.0.0", UpdateManifestKey(product="other")
+        )
+
+        # Then - the patch is to the file of the resolved manifest
+        assert result.version == "5.0.0"
+        assert result.patch_url == "/update-patches/source-id/target-id"
+        mock_patch_service.find_patch.assert_called_once_with(
+            "4.0.0", "https://example.com/other-5.0.0.zip"
+        )
+
+    async def test_set_other_key_keeps_cache(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        sample_manifest: UpdateManifest,
+    ) -> None:
+        # Given
+        mock_repository.get_all.return_value = [sample_manifest]
+        mock_repository.get.return_value = None
+        answer = await update_manifest_service.get_answer("0.9.0")
+        beta = UpdateManifest(
+            version="0.1.0", url="https://example.com/app-0.1.0.zip", channel="beta"
+        )
+
+        # When - an older version is set in another channel
+        await update_manifest_service.set(beta)
+
+        # Then
+        mock_repository.get.assert_called_once_with(UpdateManifestKey(channel="beta"))
+        assert await update_manifest_service.get_answer("0.9.0") is answer
+        result = await update_manifest_service.get(
+            "0.0.1", UpdateManifestKey(channel="beta")
+        )
+        assert result.version == "0.1.0"
+        mock_repository.get_all.assert_called_once()
+
+    async def test_get_manifest_by_rule(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+    ) -> None:
+        # Given - the requesters below 2.0 go to the migration release first
+        latest = UpdateManifest(
+            version="2.1.0", url="https://example.com/app-2.1.0.zip"
+        )
+        mock_repository.get_all.return_value = [latest]
+        mock_repository.get_rules.return_value = [make_rule("1.9.8", None, "2.0")]
+
+        # When/Then
+        assert (await update_manifest_service.get("1.5.0")).version == "1.9.8"
+        answer = await update_manifest_service.get_answer("1.5.0")
+        assert b"1.9.8" in answer.body
+        # The migration release reached, the latest is next
+        assert (await update_manifest_service.get("1.9.8")).version == "2.1.0"
+        assert (await update_manifest_service.get("2.0.0")).version == "2.1.0"
+        mock_repository.get_all.assert_called_once()
+        mock_repository.get_rules.assert_called_once_with()
+
+    async def test_add_rule(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the latest manifest is cached
+        mock_repository.get_all.return_value = [newer_manifest]
+        assert (await update_manifest_service.get("0.5.0")).version == "1.1.0"
+        existing = make_rule("0.9.0", "0.5", "0.8")
+        mock_repository.get_rules.return_value = [existing]
+        rule = make_rule("0.7.0", None, "0.5")
+        mock_repository.add_rule.return_value = rule
+        to_create = UpdateManifestRuleToCreate(**rule.model_dump())
+
+        # When
+        result = await update_manifest_service.add_rule(to_create)
+
+        # Then - the rules are compiled into the cached index
+        assert result == rule
+        mock_repository.get_rules.assert_called_with(UpdateManifestKey())
+        mock_repository.add_rule.assert_called_once_with(to_create)
+        assert (await update_manifest_service.get("0.1.0")).version == "0.7.0"
+        assert (await update_manifest_service.get("0.5.0")).version == "0.9.0"
+        assert (await update_manifest_service.get("0.8.0")).version == "1.1.0"
+        mock_repository.get_all.assert_called_once()
+
+    @pytest.mark.parametrize(
+        "version, min_version, max_version",
+        [
+            pytest.param("latest", None, "1.0", id="invalid_version"),
+            pytest.param("1.0", "first", None, id="invalid_min_version"),
+            pytest.param("1.0", "2.0", "1.0", id="empty_range"),
+            pytest.param("1.0", "1.0", "1.0.0", id="equal_bounds"),
+        ],
+    )
+    async def test_add_rule_invalid(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        version: str,
+        min_version: str | None,
+        max_version: str | None,
+    ) -> None:
+        # Given
+        rule = UpdateManifestRuleToCreate(
+            version=version,
+            url="https://example.com/app.zip",
+            min_version=min_version,
+            max_version=max_version,
+        )
+
+        # When/Then
+        with pytest.raises(WrongDataError):
+            await update_manifest_service.add_rule(rule)
+        mock_repository.add_rule.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "min_version, max_version",
+        [
+            pytest.param(None, None, id="unbounded"),
+            pytest.param("1.5", "3.0", id="overlapping_end"),
+            pytest.param(None, "1.0.1", id="overlapping_start"),
+            pytest.param("1.2", "1.3", id="inside"),
+        ],
+    )
+    async def test_add_rule_overlapping(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        min_version: str | None,
+        max_version: str | None,
+    ) -> None:
+        # Given
+        mock_repository.get_rules.return_value = [make_rule("1.9.8", "1.0", "2.0")]
+        rule = UpdateManifestRuleToCreate(
+            version="1.9.9",
+            url="https://example.com/app.zip",
+            min_version=min_version,
+            max_version=max_version,
+        )
+
+        # When/Then
+        with pytest.raises(ApiConflictError):
+            await update_manifest_service.add_rule(rule)
+        mock_repository.add_rule.assert_not_called()
+
+    async def test_delete_rule(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - a rule is cached
+        rule = make_rule("0.9.0", None, "0.8")
+        mock_repository.get_all.return_value = [newer_manifest]
+        mock_repository.get_rules.return_value = [rule]
+        assert (await update_manifest_service.get("0.5.0")).version == "0.9.0"
+        mock_repository.delete_rule.return_value = rule
+        mock_repository.get_rules.return_value = []
+
+        # When
+        await update_manifest_service.delete_rule("rule-id")
+
+        # Then
+        mock_repository.delete_rule.assert_called_once_with("rule-id")
+        assert (await update_manifest_service.get("0.5.0")).version == "1.1.0"
+        mock_repository.get_all.assert_called_once()
+
+    async def test_delete_rule_not_found(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.delete_rule.return_value = None
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await update_manifest_service.delete_rule("rule-id")
+
+
+class TestManifestTargets:
+    @pytest.mark.parametrize(
+        "requester_version, expected",
+        [
+            pytest.param("0.1", "0.9.0", id="below_all"),
+            pytest.param("1.0", "1.5.0", id="lower_bound_inclusive"),
+            pytest.param("1.4", "1.5.0", id="inside"),
+            pytest.param("2.0", "2.5.0", id="adjacent_range"),
+            pytest.param("2.4", "2.5.0", id="inside_adjacent"),
+            pytest.param("3.0", "9.0.0", id="upper_bound_exclusive"),
+            pytest.param("4.0", "9.0.0", id="gap"),
+            pytest.param("5.0", "6.0.0", id="unbounded_above"),
+            pytest.param("6.0", "9.0.0", id="target_reached"),
+        ],
+    )
+    def test_resolve(self, requester_version: str, expected: str) -> None:
+        # Given - the rules in no particular order
+        rules = [
+            make_rule("6.0.0", "5.0", None),
+            make_rule("2.5.0", "2.0", "3.0"),
+            make_rule("0.9.0", None, "1.0"),
+            make_rule("1.5.0", "1.0", "2.0"),
+        ]
+        latest = UpdateManifest(version="9.0.0", url="https://example.com/app.zip")
+        targets = ManifestTargets.compile(
+            CachedManifest(latest, Version(latest.version)), rules
+        )
+
+        # When
+        result = targets.resolve(Version(requester_version))
+
+        # Then
+        assert result is not None
+        assert result.manifest.version == expected
+
+    def test_resolve_without_latest(self) -> None:
+        # Given
+        targets = ManifestTargets.compile(None, [make_rule("1.5.0", "1.0", "2.0")])
+
+        # When/Then
+        assert targets.resolve(Version("0.5")) is None
+        assert targets.resolve(Version("2.0")) is None
+        assert targets.resolve(Version("1.2")) is not None
+
+    async def test_get_manifest_rollout(
+        self,
+        update_manifest_service: UpdateManifestService,
+        mock_repository: AsyncMock,
+        newer_manifest: UpdateManifest,
+    ) -> None:
+        # Given - the manifest is rolled out to a part of the clients
+        mock_repository.get_all.return_value = [
+            newer_manifest.model_copy(update={"rollout_percentage": 30})
+        ]
+        client_ids = [f"client-{i}" for i in range(1000)]
+
+        # When
+        admitted = set()
+        for client_id in client_ids:
+            try:
+                await update_manifest_service.get_answer("1.0.0", client_id=client_id)
+            except ApiNotFoundError:
+                continue
+            admitted.add(client_id)
+
+        # Then - the same clients each time, and the service requests all
+        assert 250 < len(admitted) < 350
+        for client_id in client_ids[:100]:
+            try:
+                await update_manifest_service.get("1.0.0", client_id=client_id)
+            except ApiNotFoundError:
+                assert client_id not in admitted
+            else:
+                assert client_id in admitted
+        assert (await update_manifest_service.get("1.0.0")).version == "1.1.0"
+        mock_repository.get_all.assert_called_once()
@@ -0,0 +1,292 @@
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor
+from datetime import datetime
+from logging import Logger
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock
+
+import bsdiff4  # type: ignore[import-untyped]
+import pytest
+
+from app.api.errors import ApiNotFoundError
+from app.models.update_file import UpdateFileInfo
+from app.models.update_patch import UpdatePatchInfo
+from app.services.update_files.scheduler import DownloadScheduler
+from app.services.update_files.storage.file_info_repository import FileInfoRepository
+from app.services.update_files.storage.interfaces import (
+    BLOBRepositoryInterface,
+    BLOBStat,
+)
+from app.services.update_patches.diff import make_patch
+from app.services.update_patches.service import UpdatePatchService
+from app.services.update_patches.storage.repository import UpdatePatchRepository
+from app.settings import AppSettings
+
+CREATED_AT = datetime.fromisoformat("2023-01-01T00:00:00Z")
+
+
+@pytest.fixture
+def mock_repository() -> AsyncMock:
+    return AsyncMock(spec=UpdatePatchRepository)
+
+
+@pytest.fixture
+def mock_blob_repository() -> AsyncMock:
+    return AsyncMock(spec=BLOBRepositoryInterface)
+
+
+@pytest.fixture
+def mock_file_info_repository() -> AsyncMock:
+    return AsyncMock(spec=FileInfoRepository)
+
+
+@pytest.fixture
+def mock_executor() -> MagicMock:
+    return MagicMock(spec=Executor)
+
+
+@pytest.fixture
+def mock_scheduler() -> AsyncMock:
+    scheduler = AsyncMock(spec=DownloadScheduler)
+    scheduler.schedule.side_effect = lambda download: download
+    return scheduler
+
+
+@pytest.fixture
+def mock_config() -> MagicMock:
+    config = MagicMock(spec=AppSettings)
+    config.public_base_url = "https://example.com/updates/"
+    config.file_zero_copy = False
+    return config
+
+
+@pytest.fixture
+def mock_logger() -> MagicMock:
+    return MagicMock(spec=Logger)
+
+
+@pytest.fixture
+def update_patch_service(
+    mock_repository: AsyncMock,
+    mock_blob_repository: AsyncMock,
+    mock_file_info_repository: AsyncMock,
+    mock_executor: MagicMock,
+    mock_scheduler: AsyncMock,
+    mock_config: MagicMock,
+    mock_logger: MagicMock,
+) -> UpdatePatchService:
+    return UpdatePatchService(
+        repository=mock_repository,
+        blob_repository=mock_blob_repository,
+        file_info_repository=mock_file_info_repository,
+        executor=mock_executor,
+        scheduler=mock_scheduler,
+        config=mock_config,
+        logger=mock_logger,
+    )
+
+
+@pytest.fixture
+def stored_files(mock_file_info_repository: AsyncMock) -> list[UpdateFileInfo]:
+    # Ordered by creation time (desc)
+    files = [
+        UpdateFileInfo(
+            id=f"id-{version}", version=version, size=100, created_at=CREATED_AT
+        )
+        for version in ("1.2", "1.1", "1.0")
+    ]
+    files.append(UpdateFileInfo(id="id-none", size=100, created_at=CREATED_AT))
+    mock_file_info_repository.get.return_value = files[0]
+    mock_file_info_repository.get_all.return_value = files
+    return files
+
+
+@pytest.fixture
+def patch() -> UpdatePatchInfo:
+    return UpdatePatchInfo(
+        source_id="id-1.0", target_id="id-1.2", size=10, created_at=CREATED_AT
+    )
+
+
+class TestUpdatePatchService:
+    async def test_build_patches(
+        self,
+        update_patch_service: UpdatePatchService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        mock_executor: MagicMock,
+        stored_files: list[UpdateFileInfo],
+    ) -> None:
+        # Given
+        mock_blob_repository.create_derived.return_value = BLOBStat(
+            size=10, modified_at=CREATED_AT
+        )
+        mock_repository.create.return_value = True
+
+        # When
+        await update_patch_service.build_patches("id-1.2")
+
+        # Then - from each older version, in the worker processes
+        mock_blob_repository.create_derived.assert_any_call(
+            "id-1.2.from-id-1.1.bsdiff4",
+            ["id-1.1", "id-1.2"],
+            make_patch,
+            mock_executor,
+        )
+        mock_blob_repository.create_derived.assert_any_call(
+            "id-1.2.from-id-1.0.bsdiff4",
+            ["id-1.0", "id-1.2"],
+            make_patch,
+            mock_executor,
+        )
+        assert mock_blob_repository.create_derived.call_count == 2
+        mock_repository.create.assert_any_call("id-1.0", "id-1.2", 10)
+        mock_blob_repository.delete.assert_not_called()
+
+    async def test_build_patches_no_gain(
+        self,
+        update_patch_service: UpdatePatchService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        stored_files: list[UpdateFileInfo],
+    ) -> None:
+        # Given - the patches are not smaller than the file
+        mock_blob_repository.create_derived.return_value = BLOBStat(
+            size=100, modified_at=CREATED_AT
+        )
+
+        # When
+        await update_patch_service.build_patches("id-1.2")
+
+        # Then
+        mock_repository.create.assert_not_called()
+        assert mock_blob_repository.delete.call_count == 2
+
+    @pytest.mark.parametrize(
+        "url",
+        [
+            "https://example.com/updates/update-files/2c4b7a1e0d3f4e5a9b6c8d7e6f5a4b3c",
+            "https://example.com/updates/update-files/2C4B7A1E-0D3F-4E5A-9B6C-8D7E6F5A4B3C",
+        ],
+    )
+    async def test_find_patch(
+        self,
+        update_patch_service: UpdatePatchService,
+        mock_repository: AsyncMock,
+        mock_file_info_repository: AsyncMock,
+        patch: UpdatePatchInfo,
+        url: str,
+    ) -> None:
+        # Given
+        mock_repository.find.return_value = patch
+
+        # When
+        result = await update_patch_service.find_patch("1.0", url)
+
+        # Then - to the file of the URL, with no file listing
+        assert result == patch
+        mock_repository.find.assert_called_once_with(
+            "1.0", "2c4b7a1e0d3f4e5a9b6c8d7e6f5a4b3c"
+        )
+        mock_file_info_repository.get_all.assert_not_called()
+        patch_url = update_patch_service.get_patch_url(patch)
+        assert patch_url == "https://example.com/updates/update-patches/id-1.0/id-1.2"
+
+    @pytest.mark.parametrize(
+        "from_version,to_url",
+        [
+            pytest.param(
+                "unknown",
+                "https://example.com/update-files/2c4b7a1e0d3f4e5a9b6c8d7e6f5a4b3c",
+                id="invalid_version",
+            ),
+            pytest.param("1.0", "https://example.com/app-1.2.zip", id="external_url"),
+        ],
+    )
+    async def test_find_patch_none(
+        self,
+        update_patch_service: UpdatePatchService,
+        mock_repository: AsyncMock,
+        from_version: str,
+        to_url: str,
+    ) -> None:
+        # When
+        result = await update_patch_service.find_patch(from_version, to_url)
+
+        # Then
+        assert result is None
+        mock_repository.find.assert_not_called()
+
+    async def test_get_patch(
+        self,
+        update_patch_service: UpdatePatchService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        patch: UpdatePatchInfo,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = patch
+        mock_blob_repository.stat.return_value = BLOBStat(
+            size=10, modified_at=CREATED_AT
+        )
+        content = MagicMock(spec=AsyncIterator)
+        mock_blob_repository.get.return_value = content
+
+        # When
+        result = await update_patch_service.get_patch(
+            "id-1.0", "id-1.2", range_header="bytes=0-4"
+        )
+
+        # Then
+        assert result.content == content
+        assert result.headers["Content-Range"] == "bytes 0-4/10"
+        mock_blob_repository.get.assert_called_once_with(
+            "id-1.2.from-id-1.0.bsdiff4", 0, 5
+        )
+
+    async def test_get_patch_not_found(
+        self,
+        update_patch_service: UpdatePatchService,
+        mock_repository: AsyncMock,
+    ) -> None:
+        # Given
+        mock_repository.get.return_value = None
+
+        # When/Then
+        with pytest.raises(ApiNotFoundError):
+            await update_patch_service.get_patch("id-1.0", "id-1.2")
+
+    async def test_delete_for_file(
+        self,
+        update_patch_service: UpdatePatchService,
+        mock_repository: AsyncMock,
+        mock_blob_repository: AsyncMock,
+        patch: UpdatePatchInfo,
+    ) -> None:
+        # Given
+        mock_repository.delete_for_file.return_value = [patch]
+        mock_blob_repository.delete.side_effect = FileNotFoundError
+
+        # When
+        await update_patch_service.delete_for_file("id-1.0")
+
+        # Then
+        mock_blob_repository.delete.assert_called_once_with(
+            "id-1.2.from-id-1.0.bsdiff4"
+        )
+
+
+def test_make_patch(tmp_path: Path):
+    # Given
+    source = b"0123456789" * 1000
+    target = source[:5000] + b"changed" + source[5000:]
+    (tmp_path / "source").write_bytes(source)
+    (tmp_path / "target").write_bytes(target)
+
+    # When
+    make_patch(tmp_path / "source", tmp_path / "target", tmp_path / "patch")
+
+    # Then
+    patch = (tmp_path / "patch").read_bytes()
+    assert bsdiff4.patch(source, patch) == target
+    assert len(patch) < len(target)